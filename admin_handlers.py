@@ -1,20 +1,22 @@
 # handlers/admin_handlers.py
+import asyncio
+import io
 import logging
 from datetime import datetime
 from aiogram import Dispatcher, types
 from aiogram.dispatcher import FSMContext
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from pytz import timezone
 
 # FSM
-from fsm import AdminForm, PastDowntimeForm
+from fsm import AdminForm, PastDowntimeForm, BulkImportForm
 
 # Filters, Storage, Config
 from filters.admin_filter import AdminFilter
 from utils.storage import DataStorage
 from config import (
-    USER_ID_COLUMN, USER_ROLE_COLUMN, SCHEDULER_TIMEZONE,
-    PRODUCTION_SITES, DOWNTIME_REASONS, LINES_SECTIONS
+    USER_ID_COLUMN, USER_ROLE_COLUMN,
+    PRODUCTION_SITES, DOWNTIME_REASONS, LINES_SECTIONS, QUERY_PAGE_SIZE,
+    IMPORT_MAX_ROWS, EXPORT_SPOOL_MAX_BYTES, EXPORT_MAX_BYTES, JOURNAL_PUSH_TIMEOUT_SECONDS
 )
 
 # Keyboards
@@ -23,17 +25,29 @@ from keyboards.inline import (
     get_sites_keyboard,
     get_lines_sections_keyboard,
     get_downtime_reasons_keyboard,
-    get_responsible_groups_keyboard
+    get_responsible_groups_keyboard,
+    get_query_pagination_keyboard,
+    get_period_presets_keyboard
 )
 
 # Reports & G-Sheets API
 from utils.reports import (
-    get_downtime_report_for_period,
+    get_shift_reports,
     get_shift_time_range,
     generate_line_status_report,
-    calculate_shift_times
+    render_downtime_query_page,
+    get_period_report,
+    render_cache_stats
 )
-from g_sheets.api import get_worksheet, append_downtime_record, get_next_sequence_number
+from utils.downtime_index import parse_query_args
+from utils.period_reports import PERIOD_PRESETS, get_period_time_range, parse_period_args, resolve_period_args
+from utils.analytics import render_reliability_report, render_shift_availability_report
+from utils.response_stats import render_response_stats
+from utils.charts import send_shift_charts
+from utils.bulk_import import (ImportFileError, IMPORT_COLUMNS, build_past_downtime_record, parse_import_file,
+                               render_import_errors_csv)
+from utils.export import EXPORT_FORMATS, ExportError, build_export_file, export_file_name
+from g_sheets.api import get_worksheet
 
 # --- Управление ролями ---
 async def manage_roles_start(message: types.Message, state: FSMContext):
@@ -99,8 +113,11 @@ async def send_shift_report(message: types.Message, shift_type: str):
         await message.answer("Не удалось определить временные рамки смены.")
         return
 
-    # Получаем сгруппированные отчеты
-    reports_by_site, total_minutes, record_count, cache_status = await get_downtime_report_for_period(start_dt, end_dt, storage)
+    # Получаем сгруппированные отчеты (за прошедшую смену они обычно уже подготовлены заранее)
+    reports = await get_shift_reports(start_dt, end_dt, storage)
+    reports_by_site, total_minutes, record_count, cache_status = (
+        reports["reports_by_site"], reports["total_minutes"], reports["record_count"], reports["cache_status"]
+    )
 
     # Если record_count == 0, то в cache_status уже будет готовое сообщение об отсутствии записей
     if record_count == 0:
@@ -126,18 +143,231 @@ async def send_shift_report(message: types.Message, shift_type: str):
                 await message.answer(report_text, parse_mode='Markdown')
 
     # Отправляем итоговую сводку
-    summary_text = f"\n📊 **Общее время простоя за смену: {total_minutes} минут.**"
+    summary_text = (f"\n📊 **Общее время простоя за смену: {total_minutes} минут.**\n"
+                    f"⏱️ **Без наложений записей одной линии: {reports['merged_minutes']} минут.**")
     final_message = summary_text + cache_status
     await message.answer(final_message, parse_mode='Markdown')
+    # Повторный запрос той же смены отправляет готовые картинки по file_id
+    await send_shift_charts(message.bot, message.chat.id, storage, start_dt, end_dt)
 
 
 async def send_line_status_now(message: types.Message):
     dp = Dispatcher.get_current()
     storage: DataStorage = dp['storage']
-    await message.answer("⏳ Формирую отчет о статусе линий...")
-    report_text = await generate_line_status_report(storage)
+    # Вместо разового отчета создаем закрепленную доску, которая дальше обновляется на месте
+    try:
+        await storage.line_board.attach(message.chat.id)
+    except Exception as e:
+        logging.error(f"Не удалось создать доску статуса линий в чате {message.chat.id}: {e}")
+        report_text = await generate_line_status_report(storage)
+        await message.answer(report_text, parse_mode='Markdown')
+
+# --- Отчеты за произвольный период ---
+async def send_period_report(message: types.Message):
+    dp = Dispatcher.get_current()
+    storage: DataStorage = dp['storage']
+    args = message.get_args() if message.is_command() else ""
+    if not args:
+        await message.answer("Выберите период или используйте `/report ДД.ММ.ГГГГ [ДД.ММ.ГГГГ]`:",
+                             parse_mode='Markdown', reply_markup=get_period_presets_keyboard())
+        return
+    try:
+        start, end = parse_period_args(args)
+    except ValueError as e:
+        await message.answer(f"❗️ {e}")
+        return
+    report_text = await get_period_report(start, end, "Отчет о простоях за период", storage)
     await message.answer(report_text, parse_mode='Markdown')
 
+async def send_period_preset_report(cb: types.CallbackQuery):
+    dp = Dispatcher.get_current()
+    storage: DataStorage = dp['storage']
+    preset = cb.data.split('period_', 1)[1]
+    start, end = get_period_time_range(preset)
+    if not start:
+        await cb.answer("Неизвестный период.", show_alert=True)
+        return
+    report_text = await get_period_report(start, end, f"Отчет о простоях: {PERIOD_PRESETS[preset].lower()}", storage)
+    await cb.message.answer(report_text, parse_mode='Markdown')
+    await cb.answer()
+
+# --- Надежность линий (MTBF / MTTR / доступность) ---
+async def send_reliability_report(message: types.Message):
+    dp = Dispatcher.get_current()
+    storage: DataStorage = dp['storage']
+    try:
+        start, end, title = resolve_period_args(message.get_args(), "week")
+    except ValueError as e:
+        await message.answer(f"❗️ {e}\nПример: `/reliability last_week` или `/reliability 01.06.2025 30.06.2025`", parse_mode='Markdown')
+        return
+    report_text = render_reliability_report(f"Надежность линий: {title.lower()}", start, end, storage.reliability)
+    await message.answer(report_text, parse_mode='Markdown')
+
+def _split_by_lines(text: str, max_length: int = 4096) -> list:
+    """Делит текст на сообщения не длиннее max_length, не разрывая строки (и разметку внутри них)."""
+    chunks, current = [], ""
+    for line in text.split("\n"):
+        if current and len(current) + 1 + len(line) > max_length:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def send_shift_availability_report(message: types.Message):
+    dp = Dispatcher.get_current()
+    storage: DataStorage = dp['storage']
+    try:
+        start, end, _ = resolve_period_args(message.get_args(), "week")
+    except ValueError as e:
+        await message.answer(f"❗️ {e}\nПример: `/shifts last_week` или `/shifts 01.06.2025 07.06.2025`", parse_mode='Markdown')
+        return
+    # Строка на каждую смену: за несколько месяцев текст больше лимита Telegram, отправляем частями по строкам
+    for chunk in _split_by_lines(render_shift_availability_report(start, end, storage.reliability)):
+        await message.answer(chunk, parse_mode='Markdown')
+
+async def send_response_stats(message: types.Message):
+    dp = Dispatcher.get_current()
+    storage: DataStorage = dp['storage']
+    await message.answer(render_response_stats(storage.response_stats), parse_mode='Markdown')
+
+async def send_cache_stats(message: types.Message):
+    dp = Dispatcher.get_current()
+    storage: DataStorage = dp['storage']
+    await message.answer(render_cache_stats(storage), parse_mode='Markdown')
+
+async def send_fsm_stats(message: types.Message):
+    dp = Dispatcher.get_current()
+    await message.answer(dp['fsm_housekeeper'].render_stats(dp), parse_mode='Markdown')
+
+# --- Запрос простоев по фильтрам ---
+QUERY_HELP_TEXT = (
+    "Использование: `/query ключ=значение ...`\n\n"
+    "Фильтры: `site`, `line`, `reason`, `group`, `user` (ID, username или имя), "
+    "`from`, `to` (ДД.ММ.ГГГГ или ДД.ММ.ГГГГ ЧЧ:ММ).\n"
+    "Значения с пробелами берите в кавычки.\n\n"
+    "Пример: `/query site=ОМЕТ line=ОМЕТ1 reason=КИП from=01.06.2025 to=07.06.2025`"
+)
+
+def _build_query_page(storage: DataStorage, query: dict, page: int):
+    """Выполняет запрос по индексу и возвращает текст страницы и клавиатуру."""
+    start_dt = datetime.fromisoformat(query['from']) if query.get('from') else None
+    end_dt = datetime.fromisoformat(query['to']) if query.get('to') else None
+    row_ids = storage.downtime_index.query(query['filters'], start_dt, end_dt)
+    if not row_ids:
+        return "По заданным фильтрам записей не найдено.", None
+
+    total_pages = (len(row_ids) + QUERY_PAGE_SIZE - 1) // QUERY_PAGE_SIZE
+    page = max(0, min(page, total_pages - 1))
+    page_ids = row_ids[page * QUERY_PAGE_SIZE:(page + 1) * QUERY_PAGE_SIZE]
+    rows = [storage.downtime_index.rows[i] for i in page_ids]
+    text = render_downtime_query_page(storage.downtime_index.headers, rows, len(row_ids), page, QUERY_PAGE_SIZE)
+    kb = get_query_pagination_keyboard(page, total_pages) if total_pages > 1 else None
+    return text, kb
+
+async def downtime_query(message: types.Message, state: FSMContext):
+    dp = Dispatcher.get_current()
+    storage: DataStorage = dp['storage']
+    args = message.get_args()
+    if not args:
+        await message.answer(QUERY_HELP_TEXT, parse_mode='Markdown')
+        return
+    try:
+        filters, start_dt, end_dt = parse_query_args(args)
+    except ValueError as e:
+        await message.answer(f"❗️ {e}")
+        return
+
+    query = {
+        'filters': filters,
+        'from': start_dt.isoformat() if start_dt else None,
+        'to': end_dt.isoformat() if end_dt else None,
+    }
+    # Параметры запроса сохраняем, чтобы листать страницы без повторного ввода
+    await state.update_data(downtime_query=query)
+    text, kb = _build_query_page(storage, query, 0)
+    await message.answer(text, parse_mode='Markdown', reply_markup=kb)
+
+async def downtime_query_page(cb: types.CallbackQuery, state: FSMContext):
+    dp = Dispatcher.get_current()
+    storage: DataStorage = dp['storage']
+    data = await state.get_data()
+    query = data.get('downtime_query')
+    if not query:
+        await cb.answer("Запрос устарел. Выполните /query заново.", show_alert=True)
+        return
+    page = int(cb.data.split('dtq_page_', 1)[1])
+    text, kb = _build_query_page(storage, query, page)
+    await cb.message.edit_text(text, parse_mode='Markdown', reply_markup=kb)
+    await cb.answer()
+
+# --- Выгрузка простоев файлом ---
+EXPORT_HELP_TEXT = (
+    "Использование: `/export [csv|xlsx] [период]` или `/export [csv|xlsx] ключ=значение ...`\n\n"
+    f"Период — {', '.join(f'`{key}`' for key in PERIOD_PRESETS)} или даты `ДД.ММ.ГГГГ [ДД.ММ.ГГГГ]` "
+    "(по умолчанию текущая неделя). Фильтры — как в /query.\n\n"
+    "Пример: `/export xlsx last_month` или `/export csv site=ОМЕТ from=01.06.2025 to=07.06.2025`"
+)
+
+async def export_downtimes(message: types.Message):
+    dp = Dispatcher.get_current()
+    storage: DataStorage = dp['storage']
+    tokens = message.get_args().split(maxsplit=1)
+    fmt = "csv"
+    if tokens and tokens[0].lower() in EXPORT_FORMATS:
+        fmt = tokens.pop(0).lower()
+    args = tokens[0] if tokens else ""
+    try:
+        if "=" in args:
+            filters, start, end = parse_query_args(args)
+            title = "Выгрузка по фильтрам"
+        else:
+            filters = {}
+            start, end, title = resolve_period_args(args, "week")
+    except ValueError as e:
+        await message.answer(f"❗️ {e}\n\n{EXPORT_HELP_TEXT}", parse_mode='Markdown')
+        return
+
+    index = storage.downtime_index
+    if not index.headers:
+        await message.answer("Нет данных о простоях для выгрузки.")
+        return
+    row_ids = index.query(filters, start, end)
+    if not row_ids:
+        await message.answer("Записей для выгрузки не найдено.")
+        return
+
+    await message.bot.send_chat_action(message.chat.id, types.ChatActions.UPLOAD_DOCUMENT)
+    # Строки пишутся во временный файл по одной в пуле потоков: большой период не держит в памяти
+    # ни готовый файл целиком, ни копию строк кэша. Списки индекса передаются сейчас, а не внутри потока:
+    # обновление кэша может пересобрать индекс, но прежние списки останутся согласованными с row_ids
+    loop = asyncio.get_running_loop()
+    try:
+        export_file = await loop.run_in_executor(
+            None, build_export_file, list(index.headers), index.rows, index.row_ts, row_ids, fmt,
+            EXPORT_SPOOL_MAX_BYTES, EXPORT_MAX_BYTES
+        )
+    except ExportError as e:
+        await message.answer(f"❗️ {e}")
+        return
+    except Exception as e:
+        logging.error(f"[EXPORT] Не удалось сформировать выгрузку: {e}", exc_info=True)
+        await message.answer("❌ Не удалось сформировать файл выгрузки.")
+        return
+
+    period_str = ""
+    if start and end:
+        period_str = f"\nс {start.strftime('%d.%m.%Y %H:%M')} по {end.strftime('%d.%m.%Y %H:%M')}"
+    try:
+        await message.answer_document(
+            types.InputFile(export_file, filename=export_file_name(fmt, start, end)),
+            caption=f"📤 {title}: {len(row_ids)} записей{period_str}"
+        )
+    finally:
+        export_file.close()
+    logging.info(f"[EXPORT] Админ {message.from_user.id} выгрузил {len(row_ids)} строк ({fmt}).")
+
 # --- Внесение прошедшего простоя ---
 async def start_past_downtime(message: types.Message, state: FSMContext):
     await state.finish()
@@ -245,38 +475,114 @@ async def save_past_downtime(cb: types.CallbackQuery, state: FSMContext):
     dp = Dispatcher.get_current()
     storage: DataStorage = dp['storage']
     user = cb.from_user
-    tz = timezone(SCHEDULER_TIMEZONE)
 
     async with state.proxy() as data:
-        start_time = data.get('start_time')
-        shift_start_str, shift_end_str = calculate_shift_times(start_time)
-        next_seq_num = get_next_sequence_number(storage.downtime_ws)
-        record_data = {
-            "Порядковый номер заявки": next_seq_num,
-            "Timestamp_записи": datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S"),
-            "ID_пользователя_Telegram": user.id,
-            "Username_Telegram": user.username or "N/A",
-            "Имя_пользователя_Telegram": f"{user.full_name} (внесено адм.)",
-            "Площадка": data.get('site_name', 'Н/Д'),
-            "Линия_Секция": data.get('ls_name', 'Н/Д'),
-            "Направление_простоя": data.get('reason_name', 'Н/Д'),
-            "Причина_простоя_описание": data.get('description', 'Н/Д'),
-            "Время_простоя_минут": data.get('duration_minutes', 0),
-            "Начало_смены_простоя": shift_start_str, "Конец_смены_простоя": shift_end_str,
-            "Ответственная_группа": data.get('responsible_group_name', 'Не указана'),
-            "Кто_принял_заявку_ID": "", "Кто_принял_заявку_Имя": "", "Время_принятия_заявки": "",
-            "Кто_завершил_работу_в_группе_ID": "", "Кто_завершил_работу_в_группе_Имя": "", "Время_завершения_работы_группой": "",
-            "Дополнительный_комментарий_инициатора": f"Запись внесена вручную {start_time.strftime('%d.%m %H:%M')} - {data['end_time'].strftime('%d.%m %H:%M')}",
-            "ID_Фото": ""
-        }
-    if append_downtime_record(storage.downtime_ws, record_data):
-        await storage.refresh_downtime_cache(cb.bot)
-        await cb.message.edit_text(f"✅ **Запись о прошедшем простое (№{next_seq_num}) успешно сохранена!**", parse_mode='Markdown')
-    else:
-        await cb.message.edit_text("❌ Ошибка сохранения в Google Sheets.")
+        next_seq_num = storage.write_journal.allocate()
+        record_data = build_past_downtime_record(
+            next_seq_num, user, data.get('site_name', 'Н/Д'), data.get('ls_name', 'Н/Д'), data.get('reason_name', 'Н/Д'),
+            data.get('description', 'Н/Д'), data['start_time'], data['end_time'], data.get('duration_minutes', 0),
+            data.get('responsible_group_name', 'Не указана'),
+        )
+    try:
+        storage.write_journal.append([record_data])
+    except OSError as e:
+        logging.error(f"Не удалось записать заявку №{next_seq_num} в журнал: {e}")
+        storage.write_journal.release(next_seq_num)
+        await cb.message.edit_text("❌ Ошибка сохранения: запись не удалось сохранить на диск.")
+        await state.finish()
+        await cb.answer()
+        return
+    pushed = await storage.journal_replayer.push([next_seq_num], cb.bot, JOURNAL_PUSH_TIMEOUT_SECONDS)
+    next_seq_num = storage.write_journal.resolve(next_seq_num)
+    text = f"✅ **Запись о прошедшем простое (№{next_seq_num}) успешно сохранена!**"
+    if not pushed:
+        text += "\n⏳ Таблица Google сейчас недоступна: запись будет отправлена в нее автоматически."
+    await cb.message.edit_text(text, parse_mode='Markdown')
     await state.finish()
     await cb.answer("Сохранено")
 
+# --- Массовый импорт прошедших простоев ---
+IMPORT_ERRORS_IN_MESSAGE = 10
+
+async def start_bulk_import(message: types.Message, state: FSMContext):
+    await state.finish()
+    await BulkImportForm.waiting_for_file.set()
+    columns = "\n".join(f"• {aliases[0].capitalize()}" for aliases in IMPORT_COLUMNS.values())
+    kb = InlineKeyboardMarkup().add(InlineKeyboardButton("❌ Отмена", callback_data="cancel_input"))
+    await message.answer(
+        "Отправьте файл **CSV** или **XLSX** с прошедшими простоями (первая строка — заголовки).\n\n"
+        f"Колонки:\n{columns}\n\n"
+        "Обязательны площадка, линия, направление, начало и окончание (или длительность в минутах). "
+        "Площадку, линию и направление можно указать названием, как в боте. "
+        f"Даты — `ДД.ММ.ГГГГ ЧЧ:ММ`. Не больше {IMPORT_MAX_ROWS} строк.",
+        parse_mode="Markdown", reply_markup=kb
+    )
+
+async def process_import_file(message: types.Message, state: FSMContext):
+    dp = Dispatcher.get_current()
+    storage: DataStorage = dp['storage']
+    document = message.document
+    buffer = io.BytesIO()
+    await document.download(destination_file=buffer)
+
+    # Разбор и проверка в пуле потоков: большой XLSX не должен задерживать других пользователей
+    loop = asyncio.get_running_loop()
+    try:
+        valid, errors = await loop.run_in_executor(
+            None, parse_import_file, document.file_name, buffer.getvalue(), storage.responsible_groups, IMPORT_MAX_ROWS
+        )
+    except ImportFileError as e:
+        await message.reply(f"❌ {e}\nИсправьте файл и отправьте снова.")
+        return
+    except Exception as e:
+        logging.error(f"[IMPORT] Не удалось разобрать файл {document.file_name}: {e}", exc_info=True)
+        await message.reply("❌ Не удалось прочитать файл. Проверьте формат и отправьте снова.")
+        return
+    await state.finish()
+
+    accepted, pushed = 0, True
+    if valid:
+        # Номера выделяются одним блоком, записи ложатся в журнал одной записью на диск
+        first_seq = storage.write_journal.allocate(len(valid))
+        records = [
+            build_past_downtime_record(first_seq + i, message.from_user, row.site_name, row.ls_name, row.reason_name,
+                                       row.description, row.start_time, row.end_time, row.duration_minutes, row.group_name)
+            for i, row in enumerate(valid)
+        ]
+        try:
+            storage.write_journal.append(records)
+            accepted = len(records)
+        except OSError as e:
+            logging.error(f"[IMPORT] Не удалось записать импорт в журнал: {e}")
+            # Номера блока больше никому не выданы: возвращаем их, чтобы в нумерации не было дыры
+            storage.write_journal.release(first_seq, len(records))
+        if accepted:
+            pushed = await storage.journal_replayer.push(list(range(first_seq, first_seq + accepted)), message.bot)
+        logging.info(f"[IMPORT] Админ {message.from_user.id} импортировал {accepted} строк из {document.file_name}.")
+
+    lines = []
+    if accepted:
+        lines.append(f"✅ Импортировано записей: {accepted} (№{first_seq}–№{first_seq + accepted - 1}).")
+        if not pushed:
+            lines.append("⏳ Таблица Google сейчас недоступна: записи сохранены и будут отправлены в нее автоматически.")
+    elif valid:
+        lines.append("❌ Ошибка сохранения: записи не удалось сохранить на диск. Отправьте файл снова.")
+    if errors:
+        lines.append(f"\n⚠️ Строк с ошибками: {len(errors)} (не импортированы):")
+        lines.extend(f"• строка {line}: {error}" for line, error in errors[:IMPORT_ERRORS_IN_MESSAGE])
+        if len(errors) > IMPORT_ERRORS_IN_MESSAGE:
+            lines.append("Полный список — в файле ниже.")
+    if not valid and not errors:
+        lines.append("В файле нет строк с данными.")
+    # Без Markdown: в тексте ошибок значения из файла, в которых могут быть _ и *
+    await message.reply("\n".join(lines))
+    if len(errors) > IMPORT_ERRORS_IN_MESSAGE:
+        report = types.InputFile(io.BytesIO(render_import_errors_csv(errors)), filename="import_errors.csv")
+        await message.answer_document(report)
+
+async def import_waiting_for_file(message: types.Message):
+    await message.reply("Ожидаю файл CSV или XLSX документом. Для отмены нажмите «Отмена».")
+
 def register_admin_handlers(dp: Dispatcher):
     dp.register_message_handler(manage_roles_start, AdminFilter(), text="⚙️ Управление ролями", state="*")
     dp.register_message_handler(process_user_for_role, state=AdminForm.choosing_user_for_role)
@@ -285,6 +591,18 @@ def register_admin_handlers(dp: Dispatcher):
     dp.register_message_handler(lambda msg: send_shift_report(msg, 'current'), AdminFilter(), text="📄 Отчет за текущую смену", state="*")
     dp.register_message_handler(lambda msg: send_shift_report(msg, 'previous'), AdminFilter(), text="📄 Отчет за предыдущую смену", state="*")
     dp.register_message_handler(send_line_status_now, AdminFilter(), text="🔄 Статус линий", state="*")
+    dp.register_message_handler(send_period_report, AdminFilter(), text="📆 Отчет за период", state="*")
+    dp.register_message_handler(send_period_report, AdminFilter(), commands=['report'], state="*")
+    dp.register_callback_query_handler(send_period_preset_report, AdminFilter(), lambda c: c.data.startswith('period_'), state="*")
+    dp.register_message_handler(send_reliability_report, AdminFilter(), commands=['reliability'], state="*")
+    dp.register_message_handler(send_shift_availability_report, AdminFilter(), commands=['shifts'], state="*")
+    dp.register_message_handler(send_response_stats, AdminFilter(), commands=['response_stats'], state="*")
+    dp.register_message_handler(send_fsm_stats, AdminFilter(), commands=['fsm_stats'], state="*")
+    dp.register_message_handler(send_cache_stats, AdminFilter(), commands=['cache_stats'], state="*")
+    dp.register_message_handler(downtime_query, AdminFilter(), commands=['query'], state="*")
+    dp.register_callback_query_handler(downtime_query_page, AdminFilter(), lambda c: c.data.startswith('dtq_page_'), state="*")
+    dp.register_callback_query_handler(lambda cb: cb.answer(), text="dtq_noop", state="*")
+    dp.register_message_handler(export_downtimes, AdminFilter(), commands=['export'], state="*")
     dp.register_message_handler(start_past_downtime, AdminFilter(), text="🗓️ Внести прошедший простой", state="*")
     dp.register_callback_query_handler(past_downtime_site_chosen, lambda c: c.data.startswith('site_'), state=PastDowntimeForm.choosing_site)
     dp.register_callback_query_handler(past_downtime_line_chosen, lambda c: c.data.startswith('ls_'), state=PastDowntimeForm.choosing_line_section)
@@ -295,4 +613,7 @@ def register_admin_handlers(dp: Dispatcher):
     dp.register_callback_query_handler(past_downtime_group_chosen, lambda c: c.data.startswith('group_'), state=PastDowntimeForm.choosing_responsible_group)
     dp.register_callback_query_handler(skip_past_downtime_group, text="skip_group_selection", state=PastDowntimeForm.choosing_responsible_group)
     dp.register_callback_query_handler(save_past_downtime, text="past_downtime_save", state=PastDowntimeForm.confirming_submission)
-    dp.register_callback_query_handler(cancel_admin_input, text="cancel_input", state=[PastDowntimeForm.all_states, AdminForm.all_states])
+    dp.register_message_handler(start_bulk_import, AdminFilter(), commands=['import'], state="*")
+    dp.register_message_handler(process_import_file, content_types=[types.ContentType.DOCUMENT], state=BulkImportForm.waiting_for_file)
+    dp.register_message_handler(import_waiting_for_file, content_types=types.ContentTypes.ANY, state=BulkImportForm.waiting_for_file)
+    dp.register_callback_query_handler(cancel_admin_input, text="cancel_input", state=[PastDowntimeForm.all_states, AdminForm.all_states, BulkImportForm.all_states])
@@ -0,0 +1,226 @@
+# utils/analytics.py
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from aiogram.utils.markdown import escape_md
+from pytz import timezone
+
+from config import PRODUCTION_SITES, LINES_SECTIONS, PRODUCTION_SITE_EMOJIS, SCHEDULER_TIMEZONE
+from utils.parsing import parse_sheet_datetime, unchanged_row_count
+from utils.period_reports import SHIFT_LENGTH, shift_start_for
+
+# Точка отсчета номеров смен: смена N начинается в SHIFT_EPOCH + N * 12 ч
+SHIFT_EPOCH = datetime(2020, 1, 1, 8, 0)
+SHIFT_MINUTES = int(SHIFT_LENGTH.total_seconds() // 60)
+# Окно допустимых дат записи относительно текущего момента: опечатка в годе (1025, 2205)
+# иначе растянула бы матрицы на тысячи лет смен
+MAX_RECORD_AGE = timedelta(days=20 * 365)
+MAX_RECORD_AHEAD = timedelta(days=2)
+
+# Все линии из конфигурации в фиксированном порядке: (площадка, линия) -> номер столбца матрицы
+LINE_KEYS: List[Tuple[str, str]] = [
+    (PRODUCTION_SITES[site_key], line_name)
+    for site_key, lines in LINES_SECTIONS.items() if site_key in PRODUCTION_SITES
+    for line_name in lines.values()
+]
+LINE_INDEX: Dict[Tuple[str, str], int] = {key: i for i, key in enumerate(LINE_KEYS)}
+SITE_OF_LINE = np.array([list(PRODUCTION_SITES.values()).index(site) for site, _ in LINE_KEYS])
+
+
+def shift_number(dt: datetime) -> int:
+    return int((shift_start_for(dt) - SHIFT_EPOCH) // SHIFT_LENGTH)
+
+
+def shift_start_by_number(number: int) -> datetime:
+    return SHIFT_EPOCH + number * SHIFT_LENGTH
+
+
+class ReliabilityAnalytics:
+    """
+    Матрицы "смена x линия" с суммой минут простоя и числом отказов.
+    Новые строки добавляются векторно через np.add.at, поэтому обновление не зависит от длины истории,
+    а метрики за любой период считаются срезом матрицы.
+    """
+
+    def __init__(self):
+        self.headers: Optional[List[str]] = None
+        self._base = 0  # Номер смены, соответствующий строке 0 матриц
+        self.minutes = np.zeros((0, len(LINE_KEYS)), dtype=np.int64)
+        self.failures = np.zeros((0, len(LINE_KEYS)), dtype=np.int64)
+        self._indexed = 0
+        self._rows: List[List[str]] = []
+        self._idx: Dict[str, int] = {}
+
+    def sync(self, headers: List[str], data_rows: List[List[str]], unchanged_rows: Optional[int] = None):
+        if unchanged_rows is None:
+            unchanged_rows = unchanged_row_count(self._rows, data_rows)
+        rebuild = headers != self.headers or unchanged_rows < self._indexed
+        if rebuild:
+            try:
+                self._idx = {col: headers.index(col) for col in
+                             ("Timestamp_записи", "Площадка", "Линия_Секция", "Время_простоя_минут")}
+            except ValueError as e:
+                logging.error(f"[ANALYTICS] Отсутствует необходимый столбец в таблице: {e}")
+                return
+            self.headers = list(headers)
+            self.minutes = np.zeros((0, len(LINE_KEYS)), dtype=np.int64)
+            self.failures = np.zeros((0, len(LINE_KEYS)), dtype=np.int64)
+            self._indexed = 0
+        self._ingest(data_rows[self._indexed:])
+        self._indexed = len(data_rows)
+        self._rows = data_rows
+
+    def _ingest(self, rows: List[List[str]]):
+        shifts, lines, durations = [], [], []
+        max_idx = max(self._idx.values())
+        now = datetime.now(timezone(SCHEDULER_TIMEZONE)).replace(tzinfo=None)
+        earliest, latest = now - MAX_RECORD_AGE, now + MAX_RECORD_AHEAD
+        out_of_range = 0
+        for row in rows:
+            if len(row) <= max_idx or not row[self._idx["Timestamp_записи"]]:
+                continue
+            line = LINE_INDEX.get((row[self._idx["Площадка"]], row[self._idx["Линия_Секция"]]))
+            record_dt = parse_sheet_datetime(row[self._idx["Timestamp_записи"]], log_failures=False)
+            if line is None or not record_dt:
+                continue
+            if not earliest <= record_dt <= latest:
+                out_of_range += 1
+                continue
+            try:
+                duration = int(row[self._idx["Время_простоя_минут"]] or 0)
+            except ValueError:
+                continue
+            shifts.append(shift_number(record_dt))
+            lines.append(line)
+            durations.append(duration)
+        if out_of_range:
+            logging.warning(f"[ANALYTICS] Пропущено строк с датой записи вне {earliest:%d.%m.%Y} — {latest:%d.%m.%Y}: {out_of_range}.")
+        if not shifts:
+            return
+
+        shifts = np.asarray(shifts, dtype=np.int64)
+        lines = np.asarray(lines, dtype=np.int64)
+        durations = np.asarray(durations, dtype=np.int64)
+        self._ensure_rows(int(shifts.min()), int(shifts.max()))
+        np.add.at(self.minutes, (shifts - self._base, lines), durations)
+        np.add.at(self.failures, (shifts - self._base, lines), 1)
+
+    def _ensure_rows(self, first: int, last: int):
+        """Расширяет матрицы, чтобы они покрывали смены с номерами [first, last]."""
+        if self.minutes.shape[0] == 0:
+            self._base = first
+        before = max(0, self._base - first)
+        after = max(0, last - (self._base + self.minutes.shape[0] - 1))
+        if before or after:
+            self.minutes = np.pad(self.minutes, ((before, after), (0, 0)))
+            self.failures = np.pad(self.failures, ((before, after), (0, 0)))
+            self._base -= before
+
+    def _slice(self, start: datetime, end: datetime, now: Optional[datetime] = None):
+        """
+        Возвращает минуты, отказы и длительности смен (в минутах) за смены, пересекающие [start, end).
+        Текущая смена учитывается только прошедшей частью.
+        """
+        first, last = shift_number(start), shift_number(end - timedelta(seconds=1))
+        numbers = np.arange(first, last + 1)
+        rows = numbers - self._base
+        valid = (rows >= 0) & (rows < self.minutes.shape[0])
+        minutes = np.zeros((len(numbers), len(LINE_KEYS)), dtype=np.int64)
+        failures = np.zeros_like(minutes)
+        minutes[valid] = self.minutes[rows[valid]]
+        failures[valid] = self.failures[rows[valid]]
+
+        now = now or datetime.now(timezone(SCHEDULER_TIMEZONE)).replace(tzinfo=None)
+        elapsed = (now - SHIFT_EPOCH).total_seconds() / 60 - (numbers * SHIFT_MINUTES)
+        shift_minutes = np.clip(elapsed, 0, SHIFT_MINUTES)
+        return numbers, minutes, failures, shift_minutes
+
+    @staticmethod
+    def _metrics(downtime: np.ndarray, failures: np.ndarray, planned: np.ndarray) -> dict:
+        """MTBF, MTTR и доступность для массивов одинаковой формы."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            uptime = np.clip(planned - downtime, 0, None)
+            mttr = np.where(failures > 0, downtime / failures, np.nan)
+            mtbf = np.where(failures > 0, uptime / failures, np.nan)
+            availability = np.where(planned > 0, 1 - np.minimum(downtime, planned) / planned, np.nan)
+        return {"downtime": downtime, "failures": failures, "mttr": mttr, "mtbf": mtbf, "availability": availability}
+
+    def line_metrics(self, start: datetime, end: datetime, now: Optional[datetime] = None) -> dict:
+        _, minutes, failures, shift_minutes = self._slice(start, end, now)
+        planned = np.full(len(LINE_KEYS), shift_minutes.sum())
+        return self._metrics(minutes.sum(axis=0), failures.sum(axis=0), planned)
+
+    def site_metrics(self, start: datetime, end: datetime, now: Optional[datetime] = None) -> dict:
+        _, minutes, failures, shift_minutes = self._slice(start, end, now)
+        n_sites = len(PRODUCTION_SITES)
+        downtime = np.bincount(SITE_OF_LINE, weights=minutes.sum(axis=0), minlength=n_sites)
+        fails = np.bincount(SITE_OF_LINE, weights=failures.sum(axis=0), minlength=n_sites)
+        planned = np.bincount(SITE_OF_LINE, minlength=n_sites) * shift_minutes.sum()
+        return self._metrics(downtime, fails, planned)
+
+    def shift_metrics(self, start: datetime, end: datetime, now: Optional[datetime] = None) -> Tuple[List[datetime], dict]:
+        numbers, minutes, failures, shift_minutes = self._slice(start, end, now)
+        planned = shift_minutes * len(LINE_KEYS)
+        metrics = self._metrics(minutes.sum(axis=1), failures.sum(axis=1), planned)
+        return [shift_start_by_number(int(n)) for n in numbers], metrics
+
+
+def _fmt_minutes(value: float) -> str:
+    if np.isnan(value):
+        return "—"
+    hours, minutes = divmod(int(round(value)), 60)
+    return f"{hours} ч {minutes} мин." if hours else f"{minutes} мин."
+
+
+def _fmt_percent(value: float) -> str:
+    return "—" if np.isnan(value) else f"{value * 100:.1f}%"
+
+
+def render_reliability_report(title: str, start: datetime, end: datetime, analytics: ReliabilityAnalytics,
+                              max_lines: int = 10) -> str:
+    """Отчет по доступности, MTBF и MTTR площадок и худших линий за период."""
+    sites = analytics.site_metrics(start, end)
+    lines_m = analytics.line_metrics(start, end)
+    lines = [
+        f"📈 **{escape_md(title)}**",
+        f"Период: с {start.strftime('%d.%m.%Y %H:%M')} по {end.strftime('%d.%m.%Y %H:%M')}",
+        "",
+        "**По площадкам:**",
+    ]
+    for i, (site_key, site_name) in enumerate(PRODUCTION_SITES.items()):
+        emoji = PRODUCTION_SITE_EMOJIS.get(site_key, '⚪️')
+        lines.append(
+            f"{emoji} **{escape_md(site_name)}**: доступность {_fmt_percent(sites['availability'][i])}, "
+            f"отказов {int(sites['failures'][i])}, MTBF {_fmt_minutes(sites['mtbf'][i])}, MTTR {_fmt_minutes(sites['mttr'][i])}"
+        )
+
+    failed = np.flatnonzero(lines_m["failures"] > 0)
+    if failed.size:
+        worst = failed[np.argsort(lines_m["availability"][failed], kind="stable")][:max_lines]
+        lines.append(f"\n**Линии с наименьшей доступностью (топ-{len(worst)}):**")
+        for i in worst:
+            site_name, line_name = LINE_KEYS[i]
+            lines.append(
+                f"   └ ⚙️ {escape_md(site_name)} / {escape_md(line_name)}: {_fmt_percent(lines_m['availability'][i])}, "
+                f"отказов {int(lines_m['failures'][i])}, MTBF {_fmt_minutes(lines_m['mtbf'][i])}, MTTR {_fmt_minutes(lines_m['mttr'][i])}"
+            )
+    else:
+        lines.append("\nОтказов за период не зафиксировано.")
+    return "\n".join(lines)
+
+
+def render_shift_availability_report(start: datetime, end: datetime, analytics: ReliabilityAnalytics) -> str:
+    """Доступность всех линий по каждой смене периода."""
+    shift_starts, metrics = analytics.shift_metrics(start, end)
+    lines = [f"📈 **Доступность по сменам** ({start.strftime('%d.%m.%Y')} — {end.strftime('%d.%m.%Y')})"]
+    for i, shift_start in enumerate(shift_starts):
+        if np.isnan(metrics["availability"][i]):
+            continue
+        shift_name = "☀️ День" if shift_start.hour == 8 else "🌙 Ночь"
+        lines.append(
+            f"{shift_start.strftime('%d.%m')} {shift_name}: {_fmt_percent(metrics['availability'][i])}, "
+            f"простой {_fmt_minutes(metrics['downtime'][i])}, отказов {int(metrics['failures'][i])}"
+        )
+    return "\n".join(lines)
@@ -1,13 +1,72 @@
 # g_sheets/api.py
 import logging
+import time
+from collections import deque
+from contextlib import contextmanager
 import gspread
 from config import (GOOGLE_SHEET_ID, GOOGLE_SERVICE_ACCOUNT_JSON_PATH,
                     DOWNTIME_WORKSHEET_NAME, RESPONSIBLE_GROUPS_WORKSHEET_NAME,
                     USER_ROLES_WORKSHEET_NAME, SHEET_HEADERS, GROUP_NAME_COLUMN,
-                    GROUP_ID_COLUMN, USER_ID_COLUMN, USER_ROLE_COLUMN)
+                    GROUP_ID_COLUMN, USER_ID_COLUMN, USER_ROLE_COLUMN, SHEETS_REQUESTS_PER_MINUTE,
+                    SHEETS_BACKEND, SHEETS_EMULATOR_LATENCY_MS, SHEETS_EMULATOR_QUOTA_PER_MINUTE,
+                    SHEETS_EMULATOR_ERROR_RATE, SHEETS_EMULATOR_SEED_PATH)
+from utils.metrics import SHEETS_LATENCY, SHEETS_ERRORS
+from utils.tracing import span
+
+
+class SheetsQuotaTracker:
+    """Считает запросы к Google Sheets за последнюю минуту, чтобы оценить запас по квоте."""
+
+    def __init__(self, limit_per_minute: int):
+        self.limit_per_minute = limit_per_minute
+        self.calls = deque()
+        self.throttled_until = 0.0
+
+    def record(self, count: int = 1):
+        now = time.time()
+        self.calls.extend([now] * count)
+
+    def record_throttled(self):
+        """Ответ 429: до конца минутного окна считаем квоту исчерпанной."""
+        self.throttled_until = time.time() + 60
+
+    def usage(self) -> float:
+        """Доля использованной минутной квоты (1.0 и больше — квота исчерпана)."""
+        now = time.time()
+        while self.calls and self.calls[0] < now - 60:
+            self.calls.popleft()
+        if now < self.throttled_until:
+            return 1.0
+        return len(self.calls) / self.limit_per_minute
+
+
+sheets_quota = SheetsQuotaTracker(SHEETS_REQUESTS_PER_MINUTE)
+
+
+@contextmanager
+def _sheets_call(operation: str, calls: int = 1):
+    """Учитывает запрос к Google Sheets в квоте, метриках (время и ошибки по операции) и трассе апдейта."""
+    sheets_quota.record(calls)
+    started = time.perf_counter()
+    try:
+        with span(f"sheets.{operation}"):
+            yield
+    except Exception as e:
+        status = getattr(getattr(e, 'response', None), 'status_code', None)
+        if status == 429:
+            sheets_quota.record_throttled()
+        SHEETS_ERRORS.inc(operation=operation, error=str(status) if status else type(e).__name__)
+        raise
+    finally:
+        SHEETS_LATENCY.observe(time.perf_counter() - started, operation=operation)
+
+# Экземпляр эмулятора, если SHEETS_BACKEND == "emulator" (доступен нагрузочным сценариям для проверки данных)
+sheets_emulator = None
 
 def get_gspread_client():
     """Инициализирует и возвращает клиент gspread."""
+    if SHEETS_BACKEND == "emulator":
+        return get_emulated_client()
     try:
         scope = ["https://spreadsheets.google.com/feeds", 'https://www.googleapis.com/auth/spreadsheets',
                  "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/drive"]
@@ -17,15 +76,30 @@ def get_gspread_client():
         logging.error(f"Критическая ошибка: Не удалось инициализировать gspread клиент: {e}")
         return None
 
+def get_emulated_client():
+    """Клиент gspread, обслуживаемый локальным эмулятором Sheets API вместо Google."""
+    global sheets_emulator
+    from g_sheets.emulator import SheetsEmulator, create_emulated_client
+    if sheets_emulator is None:
+        sheets_emulator = SheetsEmulator(latency_ms=SHEETS_EMULATOR_LATENCY_MS,
+                                         quota_per_minute=SHEETS_EMULATOR_QUOTA_PER_MINUTE or None,
+                                         error_rate=SHEETS_EMULATOR_ERROR_RATE)
+        sheets_emulator.create_spreadsheet(GOOGLE_SHEET_ID)
+        if SHEETS_EMULATOR_SEED_PATH:
+            sheets_emulator.load_seed(SHEETS_EMULATOR_SEED_PATH)
+    return create_emulated_client(sheets_emulator)
+
 def get_worksheet(gc: gspread.Client, worksheet_name: str, headers_list: list = None):
     """Получает или создает лист в Google Таблице."""
     if not gc:
         logging.error("gspread клиент не инициализирован.")
         return None
     try:
-        spreadsheet = gc.open_by_key(GOOGLE_SHEET_ID)
+        with _sheets_call("open_by_key"):
+            spreadsheet = gc.open_by_key(GOOGLE_SHEET_ID)
         try:
-            worksheet = spreadsheet.worksheet(worksheet_name)
+            with _sheets_call("worksheet"):
+                worksheet = spreadsheet.worksheet(worksheet_name)
         except gspread.exceptions.WorksheetNotFound:
             logging.info(f"Лист '{worksheet_name}' не найден. Создаю новый...")
             cols = len(headers_list) + 5 if headers_list else 20
@@ -43,7 +117,8 @@ def get_next_sequence_number(worksheet: gspread.Worksheet) -> int:
     """Определяет следующий порядковый номер в столбце A."""
     try:
         # Получаем все значения из первого столбца (A)
-        col_a_values = worksheet.col_values(1)
+        with _sheets_call("col_values"):
+            col_a_values = worksheet.col_values(1)
         # Фильтруем только числовые значения, пропуская заголовок (первую строку)
         numeric_values = [int(v) for v in col_a_values[1:] if v and v.isdigit()]
         
@@ -60,6 +135,22 @@ def get_next_sequence_number(worksheet: gspread.Worksheet) -> int:
         # Можно заменить на более сложную логику, если требуется
         return 1
 
+def get_sequence_timestamps(worksheet: gspread.Worksheet):
+    """
+    Порядковые номера (столбец A), время записи (B) и ID автора (C) всех строк листа одним запросом.
+    Возвращает {номер: (время, ID автора)} или None при ошибке.
+    """
+    if not worksheet:
+        return None
+    try:
+        with _sheets_call("get"):
+            values = worksheet.get("A2:C")
+    except Exception as e:
+        logging.error(f"Не удалось прочитать порядковые номера: {e}")
+        return None
+    return {int(row[0]): (row[1] if len(row) > 1 else "", row[2] if len(row) > 2 else "")
+            for row in values if row and str(row[0]).isdigit()}
+
 def append_downtime_record(gs_worksheet: gspread.Worksheet, data_dict: dict):
     """Добавляет запись о простое в Google Таблицу."""
     if not gs_worksheet:
@@ -68,19 +159,42 @@ def append_downtime_record(gs_worksheet: gspread.Worksheet, data_dict: dict):
     try:
         # Собираем строку в правильном порядке на основе заголовков из config.py
         row = [data_dict.get(h, "") for h in SHEET_HEADERS]
-        gs_worksheet.append_row(row, value_input_option='USER_ENTERED')
+        with _sheets_call("append_row"):
+            gs_worksheet.append_row(row, value_input_option='USER_ENTERED')
         logging.info(f"Данные успешно добавлены в '{gs_worksheet.title}'.")
         return True
     except Exception as e:
         logging.error(f"Ошибка append_downtime_record: {e}")
         return False
 
+def append_downtime_records(gs_worksheet: gspread.Worksheet, records: list, batch_size: int) -> int:
+    """
+    Добавляет записи о простоях пачками по batch_size строк (один запрос append_rows на пачку).
+    Возвращает число записанных строк: при ошибке следующие пачки не отправляются.
+    """
+    if not gs_worksheet:
+        logging.error("Лист Простои не доступен для записи.")
+        return 0
+    written = 0
+    for start in range(0, len(records), batch_size):
+        rows = [[record.get(h, "") for h in SHEET_HEADERS] for record in records[start:start + batch_size]]
+        try:
+            with _sheets_call("append_rows"):
+                gs_worksheet.append_rows(rows, value_input_option='USER_ENTERED')
+        except Exception as e:
+            logging.error(f"Ошибка append_downtime_records после {written} строк: {e}")
+            break
+        written += len(rows)
+    logging.info(f"Пакетно добавлено {written} из {len(records)} строк в '{gs_worksheet.title}'.")
+    return written
+
 def fetch_all_rows(gs_worksheet: gspread.Worksheet):
     """Получает все строки с листа для кэширования."""
     if not gs_worksheet:
         return None
     try:
-        return gs_worksheet.get_all_values()
+        with _sheets_call("get_all_values"):
+            return gs_worksheet.get_all_values()
     except gspread.exceptions.APIError as e:
         logging.error(f"Google Sheets API error при получении данных: {e}")
     except Exception as e:
@@ -93,7 +207,8 @@ def load_responsible_groups(gc: gspread.Client):
     if not groups_ws:
         return {}, {}
     try:
-        records = groups_ws.get_all_records()
+        with _sheets_call("get_all_records"):
+            records = groups_ws.get_all_records()
         groups_by_name, ids_by_name = {}, {}
         for idx, record in enumerate(records):
             name = record.get(GROUP_NAME_COLUMN)
@@ -118,7 +233,8 @@ def load_user_roles(gc: gspread.Client):
     if not roles_ws:
         return {}
     try:
-        records = roles_ws.get_all_records()
+        with _sheets_call("get_all_records"):
+            records = roles_ws.get_all_records()
         roles = {}
         for record in records:
             user_id = str(record.get(USER_ID_COLUMN, "")).strip()
@@ -0,0 +1,201 @@
+# benchmarks/bench_reports.py
+"""
+Бенчмарк отчетов и обновления кэша простоев на синтетических данных.
+
+Использование:
+    python -m benchmarks.bench_reports [--sizes 10000 100000 1000000] [--repeat 3]
+                                       [--output results.json] [--compare old.json]
+
+Лист "Простои" генерируется по SHEET_HEADERS с распределением площадок, линий и направлений из config.py
+и смешанными форматами даты. Таблица обслуживается эмулятором Sheets API, поэтому обновление кэша
+измеряется целиком (чтение через gspread + индексы), без обращения к Google.
+Время измеряется без tracemalloc (медиана и минимум из --repeat), пиковая память — отдельным прогоном.
+"""
+import os
+
+# Бенчмарк никогда не должен ходить в настоящую таблицу
+os.environ["SHEETS_BACKEND"] = "emulator"
+os.environ.setdefault("SHEETS_EMULATOR_LATENCY_MS", "0")
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List
+
+import config
+from config import SHEET_HEADERS, PRODUCTION_SITES, LINES_SECTIONS, DOWNTIME_REASONS, DOWNTIME_WORKSHEET_NAME
+from g_sheets import api
+from g_sheets.api import get_worksheet
+from utils.parsing import SHEET_DATETIME_FORMATS
+from utils.storage import DataStorage
+from utils.reports import (get_shift_time_range, get_downtime_report_for_period,
+                           generate_admin_shift_summary, generate_line_status_report)
+
+DEFAULT_SIZES = [10_000, 100_000]
+HISTORY_DAYS = 180
+
+# Веса направлений: частые бытовые причины и редкие аварийные
+REASON_WEIGHTS = {"Перевод": 20, "Механика": 15, "КИП": 10, "Обрыв": 12, "Нет основы": 6, "Нет оператора": 4,
+                  "Обед": 14, "Замена": 8, "Нет плана": 3, "ПХД": 5, "Нет воздуха": 1}
+GROUPS = ["Механики", "КИП и А", "Электрики", "Не указана"]
+
+
+def generate_rows(count: int, seed: int = 42) -> List[List[str]]:
+    """Синтетические строки листа "Простои" за последние HISTORY_DAYS дней."""
+    rnd = random.Random(seed)
+    lines = [(PRODUCTION_SITES[site], line) for site, site_lines in LINES_SECTIONS.items() for line in site_lines.values()]
+    # Крупные площадки простаивают чаще: вес линии зависит от площадки
+    line_weights = [3 if site.startswith("ОМЕТ") else 2 if site.startswith("Гамбини") else 1 for site, _ in lines]
+    reasons = list(DOWNTIME_REASONS.values())
+    reason_weights = [REASON_WEIGHTS.get(r, 1) for r in reasons]
+    now = datetime.now()
+    start = now - timedelta(days=HISTORY_DAYS)
+    span_seconds = HISTORY_DAYS * 86400
+    index = {h: i for i, h in enumerate(SHEET_HEADERS)}
+
+    timestamps = sorted(start + timedelta(seconds=rnd.random() * span_seconds) for _ in range(count))
+    rows = []
+    for seq, ts in enumerate(timestamps, start=1):
+        site, line = rnd.choices(lines, line_weights)[0]
+        row = [""] * len(SHEET_HEADERS)
+        row[index["Порядковый номер заявки"]] = str(seq)
+        # Большинство строк в основном формате, часть — в форматах, внесенных вручную
+        fmt = SHEET_DATETIME_FORMATS[0] if rnd.random() < 0.8 else rnd.choice(SHEET_DATETIME_FORMATS[1:])
+        row[index["Timestamp_записи"]] = ts.strftime(fmt)
+        user_id = rnd.randint(100000, 100060)
+        row[index["ID_пользователя_Telegram"]] = str(user_id)
+        row[index["Username_Telegram"]] = f"operator{user_id % 100}"
+        row[index["Имя_пользователя_Telegram"]] = f"Оператор {user_id % 100}"
+        row[index["Площадка"]] = site
+        row[index["Линия_Секция"]] = line
+        row[index["Направление_простоя"]] = rnd.choices(reasons, reason_weights)[0]
+        row[index["Причина_простоя_описание"]] = rnd.choice(["", "Замена ножа", "Порыв полотна", "Нет связи с ПЛК"])
+        row[index["Время_простоя_минут"]] = str(max(1, int(rnd.lognormvariate(2.7, 0.9))))
+        row[index["Ответственная_группа"]] = rnd.choice(GROUPS)
+        rows.append(row)
+    return rows
+
+
+def seed_emulator(rows: List[List[str]]):
+    """Записывает строки прямо в эмулятор, минуя API (иначе подготовка 1 млн строк заняла бы дольше замеров)."""
+    client = api.get_gspread_client()
+    worksheet = get_worksheet(client, DOWNTIME_WORKSHEET_NAME, SHEET_HEADERS)
+    sheet = api.sheets_emulator.spreadsheets[config.GOOGLE_SHEET_ID][DOWNTIME_WORKSHEET_NAME]
+    sheet.values = [list(SHEET_HEADERS)] + rows
+    sheet.row_count = len(sheet.values)
+    return client, worksheet
+
+
+async def _measure(func: Callable[[], Awaitable], repeat: int) -> Dict[str, float]:
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        durations.append(time.perf_counter() - started)
+    tracemalloc.start()
+    await func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds_median": round(statistics.median(durations), 4), "seconds_min": round(min(durations), 4),
+            "peak_mb": round(peak / 1024 / 1024, 2)}
+
+
+async def run_size(size: int, repeat: int) -> List[dict]:
+    rows = generate_rows(size)
+    client, worksheet = seed_emulator(rows)
+
+    def fresh_storage() -> DataStorage:
+        storage = DataStorage()
+        storage.gspread_client = client
+        storage.downtime_ws = worksheet
+        return storage
+
+    async def cold_refresh():
+        # Новое хранилище на каждый прогон: индексы строятся с нуля, как при запуске бота
+        await fresh_storage().refresh_downtime_cache()
+
+    storage = fresh_storage()
+    await storage.refresh_downtime_cache()
+    for site, line in list(((PRODUCTION_SITES[s], l) for s, ls in LINES_SECTIONS.items() for l in ls.values()))[::4]:
+        storage.active_downtimes.acquire((site, line), 1, "Механика")
+    start_dt, end_dt = get_shift_time_range('previous')
+    week_start = end_dt - timedelta(days=7)
+
+    operations = {
+        "refresh_downtime_cache": cold_refresh,
+        "get_downtime_report_for_period[shift]": lambda: get_downtime_report_for_period(start_dt, end_dt, storage),
+        "get_downtime_report_for_period[week]": lambda: get_downtime_report_for_period(week_start, end_dt, storage),
+        "generate_admin_shift_summary": lambda: generate_admin_shift_summary(start_dt, end_dt, storage),
+        "generate_line_status_report": lambda: generate_line_status_report(storage),
+    }
+    results = []
+    for name, func in operations.items():
+        measured = await _measure(func, repeat)
+        results.append({"size": size, "operation": name, **measured})
+        print(f"{size:>9} {name:<42} {measured['seconds_median']:>9.4f} с {measured['peak_mb']:>9.2f} МБ", flush=True)
+    return results
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(current: List[dict], previous_path: str):
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {(r["size"], r["operation"]): r for r in json.load(f)["results"]}
+    print(f"\nСравнение с {previous_path} (медиана, текущее / прошлое):")
+    for result in current:
+        old = previous.get((result["size"], result["operation"]))
+        if not old or not old["seconds_median"]:
+            continue
+        ratio = result["seconds_median"] / old["seconds_median"]
+        flag = "  ⚠️ медленнее" if ratio > 1.2 else ""
+        print(f"{result['size']:>9} {result['operation']:<42} x{ratio:.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк отчетов и обновления кэша простоев.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="размеры листа в строках")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов для замера времени")
+    parser.add_argument("--output", help="файл JSON с результатами (по умолчанию benchmarks/results/<дата>_<коммит>.json)")
+    parser.add_argument("--compare", help="прошлый файл результатов для сравнения")
+    args = parser.parse_args()
+
+    # Логи хранилища и отчетов не должны искажать замеры
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger().setLevel(logging.ERROR)
+
+    revision = _git_revision()
+    print(f"{'строк':>9} {'операция':<42} {'время':>11} {'пик памяти':>12}")
+    results = []
+    for size in args.sizes:
+        results.extend(asyncio.run(run_size(size, args.repeat)))
+
+    report = {
+        "meta": {"revision": revision, "created_at": datetime.now().isoformat(timespec="seconds"),
+                 "python": platform.python_version(), "machine": platform.machine(), "repeat": args.repeat},
+        "results": results,
+    }
+    output = args.output or os.path.join("benchmarks", "results", f"{datetime.now():%Y%m%d-%H%M%S}_{revision}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены: {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+# utils/bulk_import.py
+import csv
+import io
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pytz import timezone
+
+from config import PRODUCTION_SITES, LINES_SECTIONS, DOWNTIME_REASONS, SCHEDULER_TIMEZONE
+from utils.parsing import MANUAL_ENTRY_PREFIX, SHEET_DATETIME_FORMATS
+from utils.reports import calculate_shift_times
+
+# Колонки файла импорта и допустимые варианты заголовков (без учета регистра)
+IMPORT_COLUMNS = {
+    "site": ("площадка",),
+    "line": ("линия", "линия_секция", "линия/секция"),
+    "reason": ("направление", "направление_простоя"),
+    "start": ("начало", "начало простоя"),
+    "end": ("окончание", "окончание простоя"),
+    "duration": ("длительность", "длительность, мин", "время_простоя_минут"),
+    "description": ("описание", "причина_простоя_описание"),
+    "group": ("группа", "ответственная_группа"),
+}
+REQUIRED_COLUMNS = ("site", "line", "reason", "start")
+# Формат ручного ввода из диалога "Внести прошедший простой" плюс форматы, встречающиеся в таблице
+IMPORT_DATETIME_FORMATS = ["%d.%m.%Y %H:%M", "%d.%m.%Y %H:%M:%S"] + SHEET_DATETIME_FORMATS + ["%Y-%m-%d %H:%M"]
+
+_SITE_BY_NAME = {name.lower(): key for key, name in PRODUCTION_SITES.items()}
+_REASON_BY_NAME = {name.lower(): key for key, name in DOWNTIME_REASONS.items()}
+
+
+class ImportFileError(Exception):
+    """Файл нельзя разобрать целиком: неизвестный формат, нет обязательных колонок, слишком много строк."""
+
+
+class ImportRow:
+    """Проверенная строка файла, готовая к записи (порядковый номер назначается при записи)."""
+    __slots__ = ("line_number", "site_name", "ls_name", "reason_name", "start_time", "end_time",
+                 "duration_minutes", "description", "group_name")
+
+    def __init__(self, line_number: int, site_name: str, ls_name: str, reason_name: str, start_time: datetime,
+                 end_time: datetime, duration_minutes: int, description: str, group_name: str):
+        self.line_number = line_number
+        self.site_name = site_name
+        self.ls_name = ls_name
+        self.reason_name = reason_name
+        self.start_time = start_time
+        self.end_time = end_time
+        self.duration_minutes = duration_minutes
+        self.description = description
+        self.group_name = group_name
+
+
+def build_past_downtime_record(seq_num: int, user, site_name: str, ls_name: str, reason_name: str, description: str,
+                               start_time: datetime, end_time: datetime, duration_minutes: int, group_name: str) -> dict:
+    """
+    Строка листа "Простои" для простоя, внесенного администратором задним числом. Время записи - окончание
+    простоя, как у записей из бота: отчеты за период, сводки по сменам и индексы относят ее к той смене,
+    когда простой был, а не к моменту ввода. Момент ввода сохраняется в комментарии.
+    """
+    entered_at = datetime.now(timezone(SCHEDULER_TIMEZONE))
+    shift_start_str, shift_end_str = calculate_shift_times(start_time)
+    return {
+        "Порядковый номер заявки": seq_num,
+        "Timestamp_записи": end_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "ID_пользователя_Telegram": user.id,
+        "Username_Telegram": user.username or "N/A",
+        "Имя_пользователя_Telegram": f"{user.full_name} (внесено адм.)",
+        "Площадка": site_name,
+        "Линия_Секция": ls_name,
+        "Направление_простоя": reason_name,
+        "Причина_простоя_описание": description,
+        "Время_простоя_минут": duration_minutes,
+        "Начало_смены_простоя": shift_start_str, "Конец_смены_простоя": shift_end_str,
+        "Ответственная_группа": group_name,
+        "Кто_принял_заявку_ID": "", "Кто_принял_заявку_Имя": "", "Время_принятия_заявки": "",
+        "Кто_завершил_работу_в_группе_ID": "", "Кто_завершил_работу_в_группе_Имя": "", "Время_завершения_работы_группой": "",
+        "Дополнительный_комментарий_инициатора": f"{MANUAL_ENTRY_PREFIX} {start_time.strftime('%d.%m %H:%M')} - "
+                                                 f"{end_time.strftime('%d.%m %H:%M')} (внесена {entered_at:%d.%m.%Y %H:%M})",
+        "ID_Фото": ""
+    }
+
+
+# --- Чтение файлов построчно ---
+
+def _iter_csv(data: bytes) -> Iterator[list]:
+    encoding = "utf-8-sig"
+    try:
+        data[:65536].decode(encoding)
+    except UnicodeDecodeError:
+        # Excel в русской локали сохраняет CSV в cp1251
+        encoding = "cp1251"
+    stream = io.TextIOWrapper(io.BytesIO(data), encoding=encoding, newline="")
+    sample = stream.read(4096)
+    stream.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(stream, dialect)
+
+
+def _iter_xlsx(data: bytes) -> Iterator[list]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFileError("Для XLSX нужен пакет openpyxl. Сохраните файл как CSV или установите openpyxl.")
+    # read_only читает лист потоково, не загружая всю книгу в память
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+def iter_file_rows(file_name: str, data: bytes) -> Iterator[list]:
+    name = (file_name or "").lower()
+    if name.endswith(".xlsx"):
+        return _iter_xlsx(data)
+    if name.endswith((".csv", ".txt")):
+        return _iter_csv(data)
+    raise ImportFileError("Поддерживаются файлы .csv и .xlsx.")
+
+
+# --- Проверка строк ---
+
+def _map_header(header: list) -> Dict[str, int]:
+    columns = {}
+    for index, title in enumerate(header):
+        title = str(title or "").strip().lower()
+        for column, aliases in IMPORT_COLUMNS.items():
+            if title in aliases and column not in columns:
+                columns[column] = index
+    missing = [IMPORT_COLUMNS[c][0] for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ImportFileError(f"Нет обязательных колонок: {', '.join(missing)}.")
+    if "end" not in columns and "duration" not in columns:
+        raise ImportFileError("Нужна колонка «Окончание» или «Длительность».")
+    return columns
+
+
+def _parse_datetime(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    text = str(value or "").strip()
+    for fmt in IMPORT_DATETIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _validate_row(line_number: int, cells: Dict[str, object], groups: Dict[str, str]) -> Tuple[Optional[ImportRow], Optional[str]]:
+    """Проверяет строку по справочникам config.py. Площадку, линию и направление можно указать ключом или названием."""
+    site_value = str(cells.get("site") or "").strip()
+    site_key = site_value if site_value in PRODUCTION_SITES else _SITE_BY_NAME.get(site_value.lower())
+    if not site_key:
+        return None, f"неизвестная площадка «{site_value}»"
+
+    line_value = str(cells.get("line") or "").strip()
+    site_lines = LINES_SECTIONS.get(site_key, {})
+    ls_name = site_lines.get(line_value) or next((n for n in site_lines.values() if n.lower() == line_value.lower()), None)
+    if not ls_name:
+        return None, f"линия «{line_value}» не относится к площадке {PRODUCTION_SITES[site_key]}"
+
+    reason_value = str(cells.get("reason") or "").strip()
+    reason_key = reason_value if reason_value in DOWNTIME_REASONS else _REASON_BY_NAME.get(reason_value.lower())
+    if not reason_key:
+        return None, f"неизвестное направление «{reason_value}»"
+
+    start_time = _parse_datetime(cells.get("start"))
+    if not start_time:
+        return None, f"не распознано начало «{cells.get('start')}» (формат ДД.ММ.ГГГГ ЧЧ:ММ)"
+    if cells.get("end") not in (None, ""):
+        end_time = _parse_datetime(cells.get("end"))
+        if not end_time:
+            return None, f"не распознано окончание «{cells.get('end')}» (формат ДД.ММ.ГГГГ ЧЧ:ММ)"
+        if end_time <= start_time:
+            return None, "окончание раньше начала или совпадает с ним"
+        duration_minutes = max(1, int((end_time - start_time).total_seconds() / 60))
+    else:
+        try:
+            duration_minutes = int(float(str(cells.get("duration")).replace(",", ".")))
+        except (TypeError, ValueError):
+            return None, "нет ни окончания, ни длительности в минутах"
+        if duration_minutes <= 0:
+            return None, "длительность должна быть положительной"
+        end_time = start_time + timedelta(minutes=duration_minutes)
+    if end_time > datetime.now(timezone(SCHEDULER_TIMEZONE)).replace(tzinfo=None):
+        return None, "простой еще не закончился (окончание в будущем)"
+
+    group_value = str(cells.get("group") or "").strip()
+    if group_value and group_value.lower() not in groups:
+        return None, f"неизвестная ответственная группа «{group_value}»"
+    group_name = groups.get(group_value.lower(), "Не указана") if group_value else "Не указана"
+
+    description = str(cells.get("description") or "").strip() or "Без описания"
+    return ImportRow(line_number, PRODUCTION_SITES[site_key], ls_name, DOWNTIME_REASONS[reason_key], start_time,
+                     end_time, duration_minutes, description, group_name), None
+
+
+def parse_import_file(file_name: str, data: bytes, responsible_groups: Dict[str, str],
+                      max_rows: int) -> Tuple[List[ImportRow], List[Tuple[int, str]]]:
+    """
+    Разбирает файл построчно. Возвращает проверенные строки и ошибки (номер строки файла, причина).
+    Пустые строки пропускаются. ImportFileError — если файл не подходит целиком.
+    """
+    rows = iter_file_rows(file_name, data)
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError("Файл пустой.")
+    columns = _map_header(header)
+    groups = {name.lower(): name for name in responsible_groups.values()}
+
+    valid: List[ImportRow] = []
+    errors: List[Tuple[int, str]] = []
+    data_rows = 0
+    for line_number, row in enumerate(rows, start=2):
+        if not any(str(v).strip() for v in row if v is not None):
+            continue
+        data_rows += 1
+        if data_rows > max_rows:
+            raise ImportFileError(f"В файле больше {max_rows} строк. Разделите его на части.")
+        cells = {column: row[index] if index < len(row) else None for column, index in columns.items()}
+        item, error = _validate_row(line_number, cells, groups)
+        if item:
+            valid.append(item)
+        else:
+            errors.append((line_number, error))
+    logging.info(f"[IMPORT] Файл {file_name}: {len(valid)} строк принято, {len(errors)} с ошибками.")
+    return valid, errors
+
+
+def render_import_errors_csv(errors: List[Tuple[int, str]]) -> bytes:
+    """Отчет об ошибках для отправки документом."""
+    out = io.StringIO()
+    writer = csv.writer(out, delimiter=";")
+    writer.writerow(["Строка файла", "Ошибка"])
+    writer.writerows(errors)
+    return out.getvalue().encode("utf-8-sig")
@@ -0,0 +1,70 @@
+# utils/callback_guard.py
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable
+
+from aiogram import types
+
+from utils.metrics import metrics
+
+DUPLICATE_ANSWER = "⏳ Уже обрабатывается."
+DUPLICATE_CALLBACKS = metrics.counter("duplicate_callbacks_total", "Повторные нажатия кнопок, отброшенные без обработки")
+
+
+class CallbackGuard:
+    """
+    Защита от двойных нажатий и повторной доставки callback-запросов.
+
+    claim() пропускает только первое нажатие кнопки (данные кнопки + сообщение) за ttl секунд.
+    transition() сериализует смену состояния одной заявки: обработчик проверяет статус под замком,
+    поэтому нажатия разных участников или разных кнопок не выполняют переход дважды.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl = ttl_seconds
+        # (данные кнопки, чат, сообщение) -> момент истечения; порядок вставки совпадает с порядком истечения
+        self._seen: "OrderedDict[tuple, float]" = OrderedDict()
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._lock_users: Dict[Hashable, int] = {}
+
+    @staticmethod
+    def _key(cb: types.CallbackQuery) -> tuple:
+        message = cb.message
+        return cb.data, message.chat.id if message else None, message.message_id if message else cb.inline_message_id
+
+    def _purge(self, now: float):
+        while self._seen and next(iter(self._seen.values())) <= now:
+            self._seen.popitem(last=False)
+
+    def claim(self, cb: types.CallbackQuery, handler: str = "") -> bool:
+        """True - нажатие первое и его нужно обработать, False - повтор."""
+        now = time.monotonic()
+        self._purge(now)
+        key = self._key(cb)
+        if key in self._seen:
+            DUPLICATE_CALLBACKS.inc(handler=handler)
+            return False
+        self._seen[key] = now + self.ttl
+        return True
+
+    def forget(self, cb: types.CallbackQuery):
+        """Снимает отметку, чтобы нажатие можно было повторить (обработка не состоялась)."""
+        self._seen.pop(self._key(cb), None)
+
+    @asynccontextmanager
+    async def transition(self, key: Hashable):
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._lock_users[key] -= 1
+            if not self._lock_users[key]:
+                del self._lock_users[key]
+                del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._seen)
@@ -0,0 +1,207 @@
+# utils/charts.py
+import asyncio
+import importlib.util
+import io
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot, types
+
+from config import CHARTS_ENABLED, LINES_SECTIONS, PRODUCTION_SITES
+from utils.intervals import naive_local
+from utils.workers import run_in_process
+
+CHART_PARETO = "pareto"
+CHART_TIMELINE = "timeline"
+SHIFT_CHARTS = (CHART_PARETO, CHART_TIMELINE)
+
+# matplotlib необязателен: без него отчеты отправляются только текстом
+CHARTS_AVAILABLE = importlib.util.find_spec("matplotlib") is not None
+
+
+# --- Рисование (выполняется в пуле процессов) ---
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _to_png(plt, fig) -> bytes:
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=120, bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def render_pareto_png(title: str, items: List[Tuple[str, int]]) -> bytes:
+    """Столбцы минут по направлениям (по убыванию) и накопленная доля с отметкой 80%."""
+    plt = _pyplot()
+    labels = [reason for reason, _ in items]
+    minutes = [value for _, value in items]
+    total = sum(minutes)
+    cumulative, running = [], 0
+    for value in minutes:
+        running += value
+        cumulative.append(running * 100 / total)
+    positions = list(range(len(items)))
+
+    fig, ax = plt.subplots(figsize=(8, 4.5))
+    ax.bar(positions, minutes, color="#4c72b0")
+    ax.set_xticks(positions)
+    ax.set_xticklabels(labels, rotation=30, ha="right")
+    ax.set_ylabel("Минуты простоя")
+    ax.set_title(title)
+    share = ax.twinx()
+    share.plot(positions, cumulative, color="#dd8452", marker="o")
+    share.axhline(80, color="#999999", linestyle="--", linewidth=0.8)
+    share.set_ylim(0, 105)
+    share.set_ylabel("Накопленная доля, %")
+    return _to_png(plt, fig)
+
+
+def render_timeline_png(title: str, start: datetime, end: datetime,
+                        lines: List[Tuple[str, List[Tuple[float, float]]]]) -> bytes:
+    """Полосы простоя по линиям на оси времени периода. Интервалы - в минутах от start."""
+    plt = _pyplot()
+    span_minutes = (end - start).total_seconds() / 60
+    fig, ax = plt.subplots(figsize=(9, 0.4 * len(lines) + 1.5))
+    for row, (_, spans) in enumerate(lines):
+        ax.broken_barh(spans, (row - 0.35, 0.7), color="#c44e52")
+    ax.set_yticks(list(range(len(lines))))
+    ax.set_yticklabels([label for label, _ in lines])
+    ax.set_ylim(len(lines) - 0.5, -0.5)
+    ax.set_xlim(0, span_minutes)
+    # Смена - деления по часу, длинные периоды - реже, чтобы подписи не слипались
+    step = 60 * max(1, round(span_minutes / 60 / 12))
+    ticks = list(range(0, int(span_minutes) + 1, step))
+    label_format = "%H:%M" if span_minutes <= 24 * 60 else "%d.%m %H:%M"
+    ax.set_xticks(ticks)
+    ax.set_xticklabels([(start + timedelta(minutes=t)).strftime(label_format) for t in ticks], rotation=45, ha="right")
+    ax.grid(axis="x", alpha=0.3)
+    ax.set_title(title)
+    return _to_png(plt, fig)
+
+
+# --- Данные для графиков (из индексов кэша, без просмотра строк) ---
+
+def pareto_data(storage, start: datetime, end: datetime) -> List[Tuple[str, int]]:
+    totals = storage.shift_rollups.aggregate(naive_local(start), naive_local(end), storage.downtime_index.rows_between)
+    reasons = totals["reasons"]
+    return [(reason, minutes) for reason, minutes in reasons.most_common() if minutes > 0]
+
+
+def timeline_data(storage, start: datetime, end: datetime) -> List[Tuple[str, List[Tuple[float, float]]]]:
+    by_line = storage.interval_index.intervals_by_line(start, end)
+    lines = []
+    for site_key, site_lines in LINES_SECTIONS.items():
+        site_name = PRODUCTION_SITES.get(site_key, site_key)
+        for line_name in site_lines.values():
+            spans = by_line.pop((site_name, line_name), None)
+            if spans:
+                # Названия секций повторяются на разных площадках ("Раскат", "Резка")
+                label = line_name if line_name.startswith(site_name) else f"{site_name} / {line_name}"
+                lines.append((label, spans))
+    # Линии не из справочника (переименованные, внесенные вручную) - в конце списка
+    lines.extend((f"{site} / {line}", spans) for (site, line), spans in sorted(by_line.items()))
+    return lines
+
+
+class ChartCache:
+    """
+    Готовые графики: (тип, начало, конец, версия данных) -> PNG и file_id после первой отправки.
+    Повторная отправка того же периода не рисует и не загружает картинку заново.
+    """
+
+    def __init__(self, maxsize: int = 16):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[tuple, dict]" = OrderedDict()
+        # Одновременные запросы одного графика ждут одну отрисовку
+        self._rendering: Dict[tuple, asyncio.Task] = {}
+        self.hits = 0
+        self.renders = 0
+        self.uploads = 0
+
+    async def get(self, chart_type: str, start: datetime, end: datetime, storage) -> Optional[dict]:
+        """Возвращает {"png", "file_id", "caption"} или None, если данных за период нет или рисование не удалось."""
+        key = (chart_type, start, end, storage.downtime_cache["version"])
+        if key in self._items:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key]
+        task = self._rendering.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._render(key, chart_type, start, end, storage))
+            self._rendering[key] = task
+            task.add_done_callback(lambda _: self._rendering.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _render(self, key: tuple, chart_type: str, start: datetime, end: datetime, storage) -> Optional[dict]:
+        period = f"{start.strftime('%d.%m %H:%M')} – {end.strftime('%d.%m %H:%M')}"
+        # Данные снимаются сразу, до первого await: в процесс уходит согласованный снимок
+        if chart_type == CHART_PARETO:
+            items = pareto_data(storage, start, end)
+            if not items:
+                return None
+            title = f"Парето направлений простоя, {period}"
+            caption = f"📊 {title}"
+            call = (render_pareto_png, title, items)
+        else:
+            lines = timeline_data(storage, start, end)
+            if not lines:
+                return None
+            title = f"Простои по линиям, {period}"
+            caption = f"📈 {title}"
+            call = (render_timeline_png, title, naive_local(start), naive_local(end), lines)
+        try:
+            png = await run_in_process(*call)
+        except Exception as e:
+            logging.error(f"[CHARTS] Не удалось нарисовать график {chart_type} за {period}: {e}")
+            return None
+        self.renders += 1
+        item = {"png": png, "file_id": None, "caption": caption}
+        self._items[key] = item
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return item
+
+    async def send(self, bot: Bot, chat_id: int, chart_type: str, start: datetime, end: datetime, storage) -> bool:
+        item = await self.get(chart_type, start, end, storage)
+        if not item:
+            return False
+        if item["file_id"]:
+            try:
+                await bot.send_photo(chat_id, item["file_id"], caption=item["caption"])
+                return True
+            except Exception as e:
+                logging.warning(f"[CHARTS] file_id графика {chart_type} не принят, загружаем заново: {e}")
+                item["file_id"] = None
+        message = await bot.send_photo(chat_id, types.InputFile(io.BytesIO(item["png"]), filename=f"{chart_type}.png"),
+                                       caption=item["caption"])
+        self.uploads += 1
+        item["file_id"] = message.photo[-1].file_id
+        return True
+
+
+def charts_enabled() -> bool:
+    return CHARTS_ENABLED and CHARTS_AVAILABLE
+
+
+async def prerender_shift_charts(storage, start: datetime, end: datetime):
+    if charts_enabled():
+        for chart_type in SHIFT_CHARTS:
+            await storage.charts.get(chart_type, start, end, storage)
+
+
+async def send_shift_charts(bot: Bot, chat_id: int, storage, start: datetime, end: datetime):
+    """Графики к отчету за смену. Ошибки не мешают отправке текстового отчета."""
+    if not charts_enabled():
+        return
+    for chart_type in SHIFT_CHARTS:
+        try:
+            await storage.charts.send(bot, chat_id, chart_type, start, end, storage)
+        except Exception as e:
+            logging.error(f"[CHARTS] Ошибка отправки графика {chart_type} в чат {chat_id}: {e}")
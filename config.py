@@ -13,6 +13,12 @@ BOT_VERSION = "8.2_With_Emoji"
 # --- Настройки Google Sheets ---
 GOOGLE_SHEET_ID = "1Mip6C-o4Fvi777_lYYrZg-I_JkB4vVDmT1_w694mBcw"
 GOOGLE_SERVICE_ACCOUNT_JSON_PATH = "service_account.json"
+# "google" — настоящая таблица, "emulator" — локальный эмулятор Sheets API (для нагрузочных проверок)
+SHEETS_BACKEND = os.getenv("SHEETS_BACKEND", "google")
+SHEETS_EMULATOR_LATENCY_MS = float(os.getenv("SHEETS_EMULATOR_LATENCY_MS", "0"))
+SHEETS_EMULATOR_QUOTA_PER_MINUTE = int(os.getenv("SHEETS_EMULATOR_QUOTA_PER_MINUTE", "0"))  # 0 — без ограничения
+SHEETS_EMULATOR_ERROR_RATE = float(os.getenv("SHEETS_EMULATOR_ERROR_RATE", "0"))  # Доля запросов с ответом 429
+SHEETS_EMULATOR_SEED_PATH = os.getenv("SHEETS_EMULATOR_SEED_PATH", "")  # JSON с начальными данными листов
 DOWNTIME_WORKSHEET_NAME = "Простои"
 RESPONSIBLE_GROUPS_WORKSHEET_NAME = "Группы"
 USER_ROLES_WORKSHEET_NAME = "Пользователи_Роли"
@@ -22,10 +28,80 @@ USER_ROLES_WORKSHEET_NAME = "Пользователи_Роли"
 REPORTS_CHAT_IDS = ["483262851", "323628998"]
 SCHEDULER_TIMEZONE = "Europe/Moscow"
 TOP_N_REASONS_FOR_SUMMARY = 3
+QUERY_PAGE_SIZE = 10  # Записей на странице результатов команды /query
+SHIFT_REPORT_PREWARM_MINUTES = 3         # За сколько минут до конца смены готовить отчеты
+SHIFT_REPORT_REFRESH_TIMEOUT_SECONDS = 20  # Сколько ждать дочитывания последних строк перед рассылкой
+
+# --- Массовый импорт прошедших простоев (/import) ---
+IMPORT_MAX_ROWS = 5000       # Строк данных в одном файле
+
+# --- Журнал записей в таблицу ---
+# Каждая запись сначала попадает в локальный журнал (fsync), затем отправляется в Google Sheets
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "downtime_journal.jsonl")
+JOURNAL_REPLAY_INTERVAL_SECONDS = 30  # Как часто повторять отправку неотправленных записей
+JOURNAL_PUSH_TIMEOUT_SECONDS = 5      # Сколько оператор ждет записи в таблицу, прежде чем получить ответ
+JOURNAL_BATCH_SIZE = 500              # Строк в одном запросе append_rows при отправке журнала
+
+# --- Выгрузка простоев файлом (/export) ---
+EXPORT_SPOOL_MAX_BYTES = 4 * 1024 * 1024   # До этого размера файл выгрузки собирается в памяти, дальше - на диске
+EXPORT_MAX_BYTES = 50 * 1024 * 1024        # Ограничение Bot API на размер отправляемого документа
+
+# --- Активные простои на линиях ---
+ACTIVE_DOWNTIME_LEASE_HOURS = 12  # Незакрытый и не продленный простой снимается с линии через это время
+LINE_LEASE_SWEEP_SECONDS = 60     # Период проверки истекших простоев
+
+# --- Брошенные диалоги (FSM) ---
+FSM_IDLE_TIMEOUT_MINUTES = 30  # Незавершенный ввод сбрасывается после этого времени бездействия
+FSM_SWEEP_INTERVAL_MINUTES = 5
+
+# --- Открытые заявки ---
+PENDING_REQUEST_MAX_AGE_HOURS = 48  # Незакрытые заявки старше этого срока удаляются с записью в аудит
+
+# --- Повторные нажатия кнопок ---
+CALLBACK_DEDUP_TTL_SECONDS = 10  # Сколько помнить обработанное нажатие: повтор в этот срок отбрасывается
+
+# --- Живая доска статуса линий ---
+LINE_BOARD_DEBOUNCE_SECONDS = 5  # Изменения за это время объединяются в одно редактирование
 
 # --- Кэш ---
 CACHE_REFRESH_INTERVAL_SECONDS = 300  # 5 минут
 CACHE_MAX_AGE_SECONDS = 900           # 15 минут
+# Интервал обновления адаптивный: стартует с CACHE_REFRESH_INTERVAL_SECONDS, в тишине растет
+# до CACHE_MAX_AGE_SECONDS - CACHE_REFRESH_HEADROOM_SECONDS, чтобы кэш обновлялся раньше, чем устареет
+CACHE_MIN_REFRESH_INTERVAL_SECONDS = 60   # Интервал сразу после записей и запросов отчетов
+CACHE_REFRESH_HEADROOM_SECONDS = 120      # Запас на чтение листа (в том числе с повторами при ошибках квоты)
+CACHE_ACTIVITY_WINDOW_SECONDS = 600       # Сколько после активности держать минимальный интервал
+SHEETS_REQUESTS_PER_MINUTE = 60           # Квота Google Sheets на чтение в минуту для сервисного аккаунта
+
+# --- Пул процессов для тяжелых вычислений ---
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "2"))  # Рисование графиков и сборка больших отчетов
+REPORT_PROCESS_POOL_MIN_ROWS = 2000  # Отчет за период с меньшим числом строк собирается на месте
+
+# --- Графики к отчетам за смену (нужен matplotlib) ---
+CHARTS_ENABLED = os.getenv("CHARTS_ENABLED", "1") == "1"
+CHART_CACHE_SIZE = 16  # Готовых PNG в памяти: (тип, период, версия данных) -> картинка и file_id
+
+# --- Метрики Prometheus (опционально) ---
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# --- Трассировка медленных апдейтов (опционально) ---
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0") == "1"
+TRACE_SLOW_THRESHOLD_MS = int(os.getenv("TRACE_SLOW_THRESHOLD_MS", "1500"))  # Трассы дольше порога пишутся в файл
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "slow_traces.jsonl")
+TRACE_LOG_MAX_BYTES = 5 * 1024 * 1024
+TRACE_LOG_BACKUP_COUNT = 3
+
+# --- Запись входящих апдейтов для воспроизведения (опционально) ---
+# Обезличенные апдейты пишутся в gzip-JSONL, отдельный файл на каждую смену (см. benchmarks/replay_updates.py)
+UPDATE_RECORDING_ENABLED = os.getenv("UPDATE_RECORDING_ENABLED", "0") == "1"
+UPDATE_RECORDING_DIR = os.getenv("UPDATE_RECORDING_DIR", "recordings")
+
+# --- Локальное зеркало SQLite (опционально) ---
+# Если включено, отчеты фильтруют и агрегируют данные запросами к локальной базе
+SQLITE_MIRROR_ENABLED = os.getenv("SQLITE_MIRROR_ENABLED", "0") == "1"
+SQLITE_MIRROR_PATH = os.getenv("SQLITE_MIRROR_PATH", "downtime_mirror.sqlite3")
 
 # --- Роли пользователей ---
 ADMIN_ROLE = "Администратор"
@@ -1,7 +1,6 @@
 # handlers/downtime_handlers.py
 import logging
 from datetime import datetime
-import json
 import asyncio
 
 from aiogram import Dispatcher, types, Bot
@@ -11,19 +10,30 @@ from pytz import timezone
 
 from fsm import DowntimeForm
 from utils.storage import DataStorage
-from config import (PRODUCTION_SITES, LINES_SECTIONS, DOWNTIME_REASONS, SCHEDULER_TIMEZONE)
+from config import (PRODUCTION_SITES, LINES_SECTIONS, DOWNTIME_REASONS, SCHEDULER_TIMEZONE,
+                    JOURNAL_PUSH_TIMEOUT_SECONDS)
 from keyboards import inline
 from utils.reports import calculate_shift_times
-from g_sheets.api import append_downtime_record, get_next_sequence_number
+from utils.pending_requests import PendingRequest
+from utils.callback_guard import DUPLICATE_ANSWER
 
 # --- Начало и навигация в FSM ---
 
+async def release_line_lease(storage: DataStorage, state: FSMContext, user_id: int):
+    """Снимает аренду линии, взятую пользователем в текущем вводе простоя (если была)."""
+    data = await state.get_data()
+    if data.get('site_name') and data.get('ls_name'):
+        if storage.active_downtimes.release((data['site_name'], data['ls_name']), user_id):
+            logging.info(f"Снят активный простой для {data['site_name']}/{data['ls_name']} (пользователь {user_id})")
+
 async def start_downtime_entry(message: types.Message, state: FSMContext):
     """Начинает процесс ввода данных о простое."""
     dp = Dispatcher.get_current()
     storage: DataStorage = dp['storage']
     
     logging.info(f"User {message.from_user.id} начал ввод простоя.")
+    # Брошенный предыдущий ввод освобождает занятую им линию
+    await release_line_lease(storage, state, message.from_user.id)
     await state.finish()
     if not storage.responsible_groups:
         logging.warning("Список ответственных групп пуст. Попытка перезагрузки...")
@@ -93,8 +103,8 @@ async def process_description(message: types.Message, state: FSMContext):
         data['description'] = message.text
         data['downtime_start_time'] = datetime.now(tz)
         data['photo_file_id'] = "" # Указываем, что фото нет
-        # Добавляем линию в словарь активных простоев для отчета о статусе
-        storage.active_downtimes[(data['site_name'], data['ls_name'])] = data.get('reason_name', 'Простой')
+        # Занимаем линию в реестре активных простоев для отчета о статусе
+        storage.active_downtimes.acquire((data['site_name'], data['ls_name']), message.from_user.id, data.get('reason_name', 'Простой'))
         logging.info(f"Добавлен активный простой для {data['site_name']}/{data['ls_name']}")
     await DowntimeForm.choosing_responsible_group.set()
     await message.reply("Описание принято.\nВыберите ответственную группу:", reply_markup=inline.get_responsible_groups_keyboard(storage))
@@ -111,7 +121,7 @@ async def process_initial_photo(message: types.Message, state: FSMContext):
         data['description'] = description
         data['photo_file_id'] = photo_file_id
         data['downtime_start_time'] = datetime.now(tz)
-        storage.active_downtimes[(data['site_name'], data['ls_name'])] = data.get('reason_name', 'Простой')
+        storage.active_downtimes.acquire((data['site_name'], data['ls_name']), message.from_user.id, data.get('reason_name', 'Простой'))
         logging.info(f"Добавлен активный простой c фото для {data['site_name']}/{data['ls_name']}")
 
     await DowntimeForm.choosing_responsible_group.set()
@@ -125,7 +135,7 @@ async def skip_description(message: types.Message, state: FSMContext):
         data['description'] = "Без описания"
         data['downtime_start_time'] = datetime.now(tz)
         data['photo_file_id'] = "" # Указываем, что фото нет
-        storage.active_downtimes[(data['site_name'], data['ls_name'])] = data.get('reason_name', 'Простой')
+        storage.active_downtimes.acquire((data['site_name'], data['ls_name']), message.from_user.id, data.get('reason_name', 'Простой'))
         logging.info(f"Добавлен активный простой для {data['site_name']}/{data['ls_name']}")
     await DowntimeForm.choosing_responsible_group.set()
     await message.reply("Описание пропущено.\nВыберите ответственную группу:", reply_markup=inline.get_responsible_groups_keyboard(storage))
@@ -162,17 +172,16 @@ async def process_group_choice(cb: types.CallbackQuery, state: FSMContext):
         return
 
     request_id = f"dt_{user.id}_{int(datetime.now().timestamp())}"
-    start_time_obj = fsm_data.get('downtime_start_time')
-    start_time_str = start_time_obj.strftime('%H:%M:%S %d.%m.%Y') if start_time_obj else "Неизвестно"
-
-    notif_text = (f"🔔 **Новый простой (ID: {request_id})**\n\n"
-                  f"Площадка: {fsm_data.get('site_name', 'Н/Д')}\n"
-                  f"Линия/Секция: {fsm_data.get('ls_name', 'Н/Д')}\n"
-                  f"Направление: {fsm_data.get('reason_name', 'Н/Д')}\n"
-                  f"Описание: {fsm_data.get('description', 'Н/Д')}\n"
-                  f"Начало: {start_time_str}\n"
-                  f"Заявитель: {user.full_name}")
-    
+    request = PendingRequest(
+        request_id=request_id,
+        initiating_user_id=user.id,
+        initiating_user_chat_id=cb.message.chat.id,
+        initiating_user_name=user.full_name,
+        responsible_group_name=group_name,
+        responsible_group_id=group_id,
+        fsm_data=fsm_data,
+    )
+    notif_text = request.notification_text()
     photo_id = fsm_data.get("photo_file_id")
 
     try:
@@ -182,22 +191,11 @@ async def process_group_choice(cb: types.CallbackQuery, state: FSMContext):
         else:
             msg_to_group = await bot.send_message(group_id, notif_text, parse_mode='Markdown', reply_markup=inline.get_accept_downtime_keyboard(request_id))
         
+        storage.active_downtimes.renew(request.line_key, user.id, request_id)
+
         # Сохраняем заявку для отслеживания и напоминаний
-        storage.pending_requests[request_id] = {
-            "request_id": request_id,
-            "creation_time": datetime.now().isoformat(),
-            "status": "pending_acceptance",
-            "reminders_sent_group": 0,
-            "reminders_sent_initiator": 0,
-            "initiating_user_id": user.id,
-            "initiating_user_chat_id": cb.message.chat.id,
-            "responsible_group_name": group_name,
-            "responsible_group_id": group_id,
-            "downtime_fsm_data_json": json.dumps(fsm_data, default=str),
-            "group_notification_message_id": msg_to_group.message_id,
-            "group_notification_text": notif_text,
-            "ls_name": fsm_data.get('ls_name', '')
-        }
+        request.group_notification_message_id = msg_to_group.message_id
+        storage.pending_requests[request_id] = request
         
         await DowntimeForm.waiting_for_group_acceptance.set()
         await cb.message.edit_text(f"Группа: {group_name}.\nЗаявка отправлена, ожидайте принятия.")
@@ -215,7 +213,20 @@ async def skip_group_choice(cb: types.CallbackQuery, state: FSMContext):
 # --- Завершение и сохранение простоя ---
 
 async def end_downtime_with_comment(cb: types.CallbackQuery, state: FSMContext):
-    await DowntimeForm.entering_additional_comment.set()
+    storage: DataStorage = Dispatcher.get_current()['storage']
+    if not storage.callback_guard.claim(cb, "end_downtime"):
+        await cb.answer(DUPLICATE_ANSWER)
+        return
+    try:
+        async with storage.callback_guard.transition(("end_downtime", cb.from_user.id)):
+            if await state.get_state() != DowntimeForm.waiting_for_downtime_end.state:
+                await cb.answer("Простой уже завершается.")
+                return
+            await DowntimeForm.entering_additional_comment.set()
+    except Exception:
+        # Переход не состоялся: повторное нажатие той же кнопки должно обработаться
+        storage.callback_guard.forget(cb)
+        raise
     await cb.message.edit_text("Введите дополнительный комментарий (например, что было сделано для устранения):")
     await cb.answer()
 
@@ -224,8 +235,24 @@ async def process_additional_comment(message: types.Message, state: FSMContext):
     await save_downtime_record(message, state)
 
 async def end_downtime_no_comment(cb: types.CallbackQuery, state: FSMContext):
-    await state.update_data(additional_comment_initiator="Без доп. комментария")
-    await save_downtime_record(cb, state)
+    storage: DataStorage = Dispatcher.get_current()['storage']
+    if not storage.callback_guard.claim(cb, "end_downtime"):
+        await cb.answer(DUPLICATE_ANSWER)
+        return
+    # Сохранение и сброс состояния под замком: второе нажатие застает простой уже закрытым
+    try:
+        async with storage.callback_guard.transition(("end_downtime", cb.from_user.id)):
+            if await state.get_state() != DowntimeForm.waiting_for_downtime_end.state:
+                await cb.answer("Простой уже завершается.")
+                return
+            await state.update_data(additional_comment_initiator="Без доп. комментария")
+            await save_downtime_record(cb, state)
+    except Exception:
+        # Состояние сбрасывается сразу после записи в журнал: если оно еще на месте, простой не сохранен
+        if await state.get_state() == DowntimeForm.waiting_for_downtime_end.state:
+            storage.callback_guard.forget(cb)
+        raise
+    await cb.answer()
 
 async def save_downtime_record(update: types.Update, state: FSMContext):
     dp = Dispatcher.get_current()
@@ -245,7 +272,6 @@ async def save_downtime_record(update: types.Update, state: FSMContext):
         
     async with state.proxy() as data:
         request_id_to_clear = data.get('request_id')
-        next_seq_num = get_next_sequence_number(storage.downtime_ws)
         start_time_val = data.get('downtime_start_time')
         start_time = datetime.fromisoformat(start_time_val) if isinstance(start_time_val, str) else start_time_val
 
@@ -260,7 +286,7 @@ async def save_downtime_record(update: types.Update, state: FSMContext):
         shift_start_str, shift_end_str = calculate_shift_times(start_time)
         
         record_data = {
-            "Порядковый номер заявки": next_seq_num, "Timestamp_записи": datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S"),
+            "Порядковый номер заявки": None, "Timestamp_записи": datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S"),
             "ID_пользователя_Telegram": user.id, "Username_Telegram": user.username or "N/A",
             "Имя_пользователя_Telegram": user.full_name, "Площадка": data.get('site_name', 'Н/Д'),
             "Линия_Секция": data.get('ls_name', 'Н/Д'), "Направление_простоя": data.get('reason_name', 'Н/Д'),
@@ -274,45 +300,57 @@ async def save_downtime_record(update: types.Update, state: FSMContext):
             "ID_Фото": data.get('photo_file_id', '')
         }
 
-    if append_downtime_record(storage.downtime_ws, record_data):
-        try:
-            line_key = (record_data['Площадка'], record_data['Линия_Секция'])
-            if line_key in storage.active_downtimes:
-                del storage.active_downtimes[line_key]
-                logging.info(f"Удален активный простой для {line_key[0]}/{line_key[1]}")
-            if request_id_to_clear and request_id_to_clear in storage.pending_requests:
-                del storage.pending_requests[request_id_to_clear]
-                logging.info(f"Заявка {request_id_to_clear} успешно закрыта и удалена из отслеживания.")
-        except KeyError:
-            pass
-
-        await storage.refresh_downtime_cache(bot)
-        
-        summary_lines = [f"✅ **Заявка №{next_seq_num} успешно сохранена!**\n"]
-        summary_lines.append(f"**Площадка:** {record_data['Площадка']}")
-        summary_lines.append(f"**Линия/Секция:** {record_data['Линия_Секция']}")
-        summary_lines.append(f"**Направление:** {record_data['Направление_простоя']}")
-        summary_lines.append(f"**Описание:** {record_data['Причина_простоя_описание']}")
-        summary_lines.append(f"**Время простоя:** {record_data['Время_простоя_минут']} мин.\n")
-        
-        if record_data.get('Ответственная_группа') and record_data['Ответственная_группа'] != 'Не указана':
-            summary_lines.append(f"**Ответственная группа:** {record_data['Ответственная_группа']}")
-        
-        final_comment = record_data.get('Дополнительный_комментарий_инициатора')
-        if final_comment and 'Без доп. комментария' not in final_comment:
-            summary_lines.append(f"**Финальный комментарий:** {final_comment}")
+    # Номер выделяется и запись ложится в журнал без await между ними: номера в журнале идут по порядку
+    next_seq_num = storage.write_journal.allocate()
+    record_data["Порядковый номер заявки"] = next_seq_num
+    try:
+        storage.write_journal.append([record_data])
+    except OSError as e:
+        logging.error(f"Не удалось записать заявку №{next_seq_num} в журнал: {e}")
+        await bot.send_message(chat_id, "❌ Ошибка сохранения: запись не удалось сохранить на диск.")
+        await state.finish()
+        return
 
-        summary_caption = "\n".join(summary_lines)
-        
-        photo_id = record_data.get("ID_Фото")
-        if photo_id:
-            await bot.send_photo(chat_id, photo=photo_id, caption=summary_caption, parse_mode='Markdown')
-        else:
-            await bot.send_message(chat_id, summary_caption, parse_mode='Markdown')
-    else:
-        await bot.send_message(chat_id, "❌ Ошибка сохранения в Google Sheets.")
-    
+    # Запись уже на диске: диалог завершается, линия освобождается и заявка закрывается,
+    # даже если таблица сейчас недоступна
     await state.finish()
+    try:
+        line_key = (record_data['Площадка'], record_data['Линия_Секция'])
+        if storage.active_downtimes.release(line_key, user.id):
+            logging.info(f"Удален активный простой для {line_key[0]}/{line_key[1]}")
+        if request_id_to_clear and request_id_to_clear in storage.pending_requests:
+            del storage.pending_requests[request_id_to_clear]
+            logging.info(f"Заявка {request_id_to_clear} успешно закрыта и удалена из отслеживания.")
+    except KeyError:
+        pass
+
+    pushed = await storage.journal_replayer.push([next_seq_num], bot, JOURNAL_PUSH_TIMEOUT_SECONDS)
+    next_seq_num = storage.write_journal.resolve(next_seq_num)
+
+    summary_lines = [f"✅ **Заявка №{next_seq_num} успешно сохранена!**\n"]
+    summary_lines.append(f"**Площадка:** {record_data['Площадка']}")
+    summary_lines.append(f"**Линия/Секция:** {record_data['Линия_Секция']}")
+    summary_lines.append(f"**Направление:** {record_data['Направление_простоя']}")
+    summary_lines.append(f"**Описание:** {record_data['Причина_простоя_описание']}")
+    summary_lines.append(f"**Время простоя:** {record_data['Время_простоя_минут']} мин.\n")
+
+    if record_data.get('Ответственная_группа') and record_data['Ответственная_группа'] != 'Не указана':
+        summary_lines.append(f"**Ответственная группа:** {record_data['Ответственная_группа']}")
+
+    final_comment = record_data.get('Дополнительный_комментарий_инициатора')
+    if final_comment and 'Без доп. комментария' not in final_comment:
+        summary_lines.append(f"**Финальный комментарий:** {final_comment}")
+
+    if not pushed:
+        summary_lines.append("\n⏳ Таблица Google сейчас недоступна: запись сохранена и будет отправлена в нее автоматически.")
+
+    summary_caption = "\n".join(summary_lines)
+
+    photo_id = record_data.get("ID_Фото")
+    if photo_id:
+        await bot.send_photo(chat_id, photo=photo_id, caption=summary_caption, parse_mode='Markdown')
+    else:
+        await bot.send_message(chat_id, summary_caption, parse_mode='Markdown')
 
 # --- Регистрация хендлеров ---
 def register_downtime_handlers(dp: Dispatcher):
@@ -0,0 +1,166 @@
+# utils/downtime_index.py
+import bisect
+import logging
+import shlex
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils.parsing import parse_sheet_datetime, unchanged_row_count
+
+# Категориальные фильтры запроса -> столбцы таблицы, по которым строятся списки вхождений
+QUERY_FIELDS = {
+    "site": ["Площадка"],
+    "line": ["Линия_Секция"],
+    "reason": ["Направление_простоя"],
+    "group": ["Ответственная_группа"],
+    "user": ["ID_пользователя_Telegram", "Username_Telegram", "Имя_пользователя_Telegram"],
+}
+QUERY_DATE_FORMATS = ["%d.%m.%Y %H:%M", "%d.%m.%Y"]
+
+
+def _normalize(value: str) -> str:
+    return str(value).strip().lstrip("@").lower()
+
+
+class DowntimeIndex:
+    """
+    Инвертированные индексы по строкам кэша простоев.
+    Для каждого значения категориального поля хранится список номеров строк (posting list),
+    для времени - отсортированный список меток. Индекс дополняется по мере поступления новых строк.
+    """
+
+    def __init__(self):
+        self.headers: Optional[List[str]] = None
+        self.rows: List[List[str]] = []
+        self.postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in QUERY_FIELDS}
+        self.row_ts: List[Optional[datetime]] = []
+        self._time_keys: List[datetime] = []
+        self._time_ids: List[int] = []
+        self._col_idx: Dict[str, List[int]] = {}
+        self._ts_idx: Optional[int] = None
+
+    def _reset(self, headers: List[str]):
+        self.headers = list(headers)
+        self.postings = {field: {} for field in QUERY_FIELDS}
+        self.row_ts = []
+        self._time_keys, self._time_ids = [], []
+        self._col_idx = {field: [headers.index(c) for c in cols if c in headers] for field, cols in QUERY_FIELDS.items()}
+        self._ts_idx = headers.index("Timestamp_записи") if "Timestamp_записи" in headers else None
+
+    def sync(self, headers: List[str], data_rows: List[List[str]], unchanged_rows: Optional[int] = None):
+        """
+        Добавляет в индекс новые строки. При изменении заголовков или уже проиндексированных строк - пересобирает.
+        unchanged_rows - число первых строк, совпадающих с прошлым снимком, если вызывающий уже посчитал его.
+        """
+        indexed = len(self.row_ts)
+        if unchanged_rows is None:
+            unchanged_rows = unchanged_row_count(self.rows, data_rows)
+        rebuild = headers != self.headers or unchanged_rows < indexed
+        if rebuild:
+            self._reset(headers)
+            indexed = 0
+        self.rows = data_rows
+        new_times = []
+        for row_id in range(indexed, len(data_rows)):
+            ts = self._ingest(row_id, data_rows[row_id])
+            if ts:
+                new_times.append((ts, row_id))
+        if rebuild:
+            # Строки задним числом идут не по времени: при пересборке одна сортировка вместо вставок в середину
+            new_times.sort()
+            self._time_keys = [ts for ts, _ in new_times]
+            self._time_ids = [row_id for _, row_id in new_times]
+        else:
+            for ts, row_id in new_times:
+                pos = bisect.bisect_right(self._time_keys, ts)
+                self._time_keys.insert(pos, ts)
+                self._time_ids.insert(pos, row_id)
+        if rebuild or len(data_rows) > indexed:
+            logging.info(f"[INDEX] Индекс простоев: {len(self.row_ts)} строк ({'пересборка' if rebuild else f'+{len(data_rows) - indexed}'}).")
+
+    def _ingest(self, row_id: int, row: List[str]) -> Optional[datetime]:
+        """Добавляет строку в списки вхождений и возвращает ее время (в отсортированные списки его вносит sync)."""
+        for field, indexes in self._col_idx.items():
+            seen = set()
+            for idx in indexes:
+                if idx < len(row) and row[idx]:
+                    key = _normalize(row[idx])
+                    if key and key not in seen:
+                        seen.add(key)
+                        self.postings[field].setdefault(key, []).append(row_id)
+        ts = None
+        if self._ts_idx is not None and self._ts_idx < len(row) and row[self._ts_idx]:
+            ts = parse_sheet_datetime(row[self._ts_idx], log_failures=False)
+        self.row_ts.append(ts)
+        return ts
+
+    def query(self, filters: Dict[str, str], start_dt: Optional[datetime] = None,
+              end_dt: Optional[datetime] = None) -> List[int]:
+        """
+        Возвращает номера строк, удовлетворяющих всем фильтрам, отсортированные по времени (новые первыми).
+        Границы периода - наивные локальные даты, как в таблице.
+        """
+        candidates: List[List[int]] = []
+        for field, value in filters.items():
+            posting = self.postings.get(field, {}).get(_normalize(value))
+            if not posting:
+                return []
+            candidates.append(posting)
+
+        if start_dt or end_dt:
+            lo = bisect.bisect_left(self._time_keys, start_dt) if start_dt else 0
+            hi = bisect.bisect_left(self._time_keys, end_dt) if end_dt else len(self._time_keys)
+            candidates.append(self._time_ids[lo:hi])
+
+        if not candidates:
+            result = list(range(len(self.row_ts)))
+        else:
+            # Пересечение начинаем с самого короткого списка, остальные проверяем через множества
+            candidates.sort(key=len)
+            result = candidates[0]
+            for other in candidates[1:]:
+                other_set = set(other)
+                result = [row_id for row_id in result if row_id in other_set]
+                if not result:
+                    break
+
+        return sorted(result, key=lambda i: (self.row_ts[i] or datetime.min, i), reverse=True)
+
+    def rows_between(self, start_dt: datetime, end_dt: datetime) -> Iterator[List[str]]:
+        """Строки со временем записи в [start_dt, end_dt) (наивное локальное время) по возрастанию времени."""
+        lo = bisect.bisect_left(self._time_keys, start_dt)
+        hi = bisect.bisect_left(self._time_keys, end_dt)
+        return (self.rows[row_id] for row_id in self._time_ids[lo:hi])
+
+
+def parse_query_args(args: str) -> Tuple[Dict[str, str], Optional[datetime], Optional[datetime]]:
+    """
+    Разбирает аргументы команды вида `site=ОМЕТ line=ОМЕТ1 from=01.06.2025 to=07.06.2025`.
+    Значения с пробелами берутся в кавычки. Бросает ValueError с понятным сообщением.
+    """
+    filters, start_dt, end_dt = {}, None, None
+    for token in shlex.split(args or ""):
+        if "=" not in token:
+            raise ValueError(f"Неверный фильтр '{token}'. Используйте формат ключ=значение.")
+        key, value = token.split("=", 1)
+        key = key.strip().lower()
+        if key in ("from", "to"):
+            parsed = None
+            for fmt in QUERY_DATE_FORMATS:
+                try:
+                    parsed = datetime.strptime(value, fmt)
+                    break
+                except ValueError:
+                    continue
+            if not parsed:
+                raise ValueError(f"Неверная дата '{value}'. Формат: ДД.ММ.ГГГГ или ДД.ММ.ГГГГ ЧЧ:ММ.")
+            if key == "from":
+                start_dt = parsed
+            else:
+                # Дата без времени в "to" включает весь указанный день
+                end_dt = parsed + timedelta(days=1) if len(value.strip()) <= 10 else parsed
+        elif key in QUERY_FIELDS:
+            filters[key] = value
+        else:
+            raise ValueError(f"Неизвестный фильтр '{key}'. Доступны: {', '.join(QUERY_FIELDS)}, from, to.")
+    return filters, start_dt, end_dt
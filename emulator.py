@@ -0,0 +1,297 @@
+# g_sheets/emulator.py
+"""
+Локальный эмулятор Google Sheets API v4 для нагрузочных и интеграционных проверок.
+
+Подключается к gspread как транспорт requests для https://sheets.googleapis.com, поэтому
+g_sheets/api.py и DataStorage работают с ним без изменений. Поддерживает запросы, которые
+делает gspread в этом боте: метаданные таблицы (open_by_key, worksheet), values get/batchGet,
+append, update, batchUpdate (addSheet, deleteDimension); find работает поверх values get.
+Задержка ответа и ошибки 429 (по квоте в минуту или с заданной вероятностью) настраиваются.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, unquote, parse_qs
+
+import gspread
+import requests
+from requests.adapters import BaseAdapter
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+
+API_BASE = "https://sheets.googleapis.com/"
+
+
+class EmulatedSheet:
+    def __init__(self, sheet_id: int, title: str, index: int, rows: int = 1000, cols: int = 26):
+        self.sheet_id = sheet_id
+        self.title = title
+        self.index = index
+        self.row_count = rows
+        self.col_count = cols
+        self.values: List[List[str]] = []
+
+    def properties(self) -> dict:
+        return {"sheetId": self.sheet_id, "title": self.title, "index": self.index, "sheetType": "GRID",
+                "gridProperties": {"rowCount": self.row_count, "columnCount": self.col_count}}
+
+    def _ensure_size(self, rows: int, cols: int):
+        self.row_count = max(self.row_count, rows)
+        self.col_count = max(self.col_count, cols)
+
+    def last_row(self) -> int:
+        """Количество строк до последней непустой (как таблица данных для append)."""
+        for index in range(len(self.values) - 1, -1, -1):
+            if any(cell != "" for cell in self.values[index]):
+                return index + 1
+        return 0
+
+    def read(self, grid: dict, by_columns: bool) -> List[List[str]]:
+        r0 = grid.get("startRowIndex", 0)
+        r1 = min(grid.get("endRowIndex", len(self.values)), len(self.values))
+        c0 = grid.get("startColumnIndex", 0)
+        c1 = grid.get("endColumnIndex")
+        rows = [row[c0:c1] if c1 is not None else row[c0:] for row in self.values[r0:r1]]
+        if by_columns:
+            width = max((len(row) for row in rows), default=0)
+            rows = [[row[i] if i < len(row) else "" for row in rows] for i in range(width)]
+        # Как и настоящий API, пустые ячейки и строки в конце не возвращаются
+        trimmed = [self._rstrip(row) for row in rows]
+        while trimmed and not trimmed[-1]:
+            trimmed.pop()
+        return trimmed
+
+    @staticmethod
+    def _rstrip(row: List[str]) -> List[str]:
+        end = len(row)
+        while end and row[end - 1] == "":
+            end -= 1
+        return row[:end]
+
+    def write(self, row0: int, col0: int, values: List[List]):
+        for r, row_values in enumerate(values):
+            target = row0 + r
+            while len(self.values) <= target:
+                self.values.append([])
+            row = self.values[target]
+            if len(row) < col0 + len(row_values):
+                row.extend([""] * (col0 + len(row_values) - len(row)))
+            for c, value in enumerate(row_values):
+                row[col0 + c] = "" if value is None else str(value)
+        self._ensure_size(row0 + len(values), col0 + max((len(v) for v in values), default=0))
+
+    def delete_rows(self, start: int, end: int):
+        del self.values[start:end]
+        self.row_count = max(1, self.row_count - (end - start))
+
+
+class SheetsEmulator:
+    """Состояние эмулированных таблиц и обработка запросов API. Потокобезопасен (gspread вызывается из пула)."""
+
+    def __init__(self, latency_ms: float = 0.0, quota_per_minute: Optional[int] = None, error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.quota_per_minute = quota_per_minute
+        self.error_rate = error_rate
+        self.spreadsheets: Dict[str, Dict[str, EmulatedSheet]] = {}
+        self.requests_total = 0
+        self.throttled_total = 0
+        self._calls = deque()
+        self._lock = threading.RLock()
+        self._next_sheet_id = 1
+
+    # --- Наполнение данными ---
+    def create_spreadsheet(self, spreadsheet_id: str):
+        with self._lock:
+            self.spreadsheets.setdefault(spreadsheet_id, {})
+
+    def add_sheet(self, spreadsheet_id: str, title: str, rows: int = 1000, cols: int = 26,
+                  values: Optional[List[List]] = None) -> EmulatedSheet:
+        with self._lock:
+            sheets = self.spreadsheets.setdefault(spreadsheet_id, {})
+            sheet = EmulatedSheet(self._next_sheet_id, title, len(sheets), rows, cols)
+            self._next_sheet_id += 1
+            sheets[title] = sheet
+            if values:
+                sheet.write(0, 0, values)
+            return sheet
+
+    def load_seed(self, path: str):
+        """JSON вида {"spreadsheet_id": {"Лист": [[...], ...]}}."""
+        with open(path, encoding="utf-8") as f:
+            seed = json.load(f)
+        for spreadsheet_id, sheets in seed.items():
+            self.create_spreadsheet(spreadsheet_id)
+            for title, values in sheets.items():
+                self.add_sheet(spreadsheet_id, title, rows=max(1000, len(values)), values=values)
+
+    # --- Транспорт ---
+    def _throttle(self) -> bool:
+        now = time.time()
+        while self._calls and self._calls[0] < now - 60:
+            self._calls.popleft()
+        self._calls.append(now)
+        if self.quota_per_minute is not None and len(self._calls) > self.quota_per_minute:
+            return True
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+    def handle(self, method: str, url: str, body: Optional[bytes]) -> Tuple[int, dict]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        with self._lock:
+            self.requests_total += 1
+            if self._throttle():
+                self.throttled_total += 1
+                return _error(429, "Quota exceeded for quota metric 'Read requests' (emulated).", "RESOURCE_EXHAUSTED")
+            parts = urlsplit(url)
+            params = {k: v if len(v) > 1 else v[0] for k, v in parse_qs(parts.query).items()}
+            payload = json.loads(body) if body else {}
+            try:
+                return self._route(method, parts.path, params, payload)
+            except KeyError as e:
+                return _error(404, f"Not found: {e}", "NOT_FOUND")
+            except ValueError as e:
+                return _error(400, f"Unable to parse range or request: {e}", "INVALID_ARGUMENT")
+
+    def _route(self, method: str, path: str, params: dict, payload: dict) -> Tuple[int, dict]:
+        match = re.match(r"^/v4/spreadsheets/([^/:]+)(.*)$", path)
+        if not match:
+            return _error(404, f"Unknown endpoint {path}", "NOT_FOUND")
+        spreadsheet_id, rest = match.group(1), match.group(2)
+        sheets = self.spreadsheets[spreadsheet_id]
+
+        if rest == "" and method == "GET":
+            return 200, self._metadata(spreadsheet_id, sheets)
+        if rest == ":batchUpdate" and method == "POST":
+            return 200, self._batch_update(spreadsheet_id, sheets, payload)
+        if rest == "/values:batchGet" and method == "GET":
+            ranges = params.get("ranges", [])
+            ranges = [ranges] if isinstance(ranges, str) else ranges
+            return 200, {"spreadsheetId": spreadsheet_id,
+                         "valueRanges": [self._values_get(sheets, r, params) for r in ranges]}
+        values_match = re.match(r"^/values/(.+?)(:append|:clear)?$", rest)
+        if values_match:
+            range_name, action = unquote(values_match.group(1)), values_match.group(2)
+            if action == ":append" and method == "POST":
+                return 200, self._values_append(spreadsheet_id, sheets, range_name, payload)
+            if action == ":clear" and method == "POST":
+                sheet, grid = self._resolve(sheets, range_name)
+                for row in sheet.values[grid.get("startRowIndex", 0):grid.get("endRowIndex")]:
+                    for c in range(grid.get("startColumnIndex", 0), min(grid.get("endColumnIndex", len(row)), len(row))):
+                        row[c] = ""
+                return 200, {"spreadsheetId": spreadsheet_id, "clearedRange": range_name}
+            if action is None and method == "GET":
+                return 200, self._values_get(sheets, range_name, params)
+            if action is None and method == "PUT":
+                return 200, self._values_update(spreadsheet_id, sheets, range_name, payload)
+        return _error(404, f"Unsupported request {method} {path}", "NOT_FOUND")
+
+    def _metadata(self, spreadsheet_id: str, sheets: Dict[str, EmulatedSheet]) -> dict:
+        return {"spreadsheetId": spreadsheet_id,
+                "properties": {"title": f"Emulated {spreadsheet_id}", "locale": "ru_RU", "timeZone": "Europe/Moscow"},
+                "sheets": [{"properties": s.properties()} for s in sorted(sheets.values(), key=lambda s: s.index)],
+                "spreadsheetUrl": f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit"}
+
+    @staticmethod
+    def _split_range(range_name: str) -> Tuple[str, str]:
+        if "!" not in range_name:
+            return range_name.strip("'").replace("''", "'"), ""
+        title, a1 = range_name.rsplit("!", 1)
+        if title.startswith("'") and title.endswith("'"):
+            title = title[1:-1].replace("''", "'")
+        return title, a1
+
+    def _resolve(self, sheets: Dict[str, EmulatedSheet], range_name: str) -> Tuple[EmulatedSheet, dict]:
+        title, a1 = self._split_range(range_name)
+        sheet = sheets[title]
+        return sheet, a1_range_to_grid_range(a1) if a1 else {}
+
+    def _values_get(self, sheets: Dict[str, EmulatedSheet], range_name: str, params: dict) -> dict:
+        sheet, grid = self._resolve(sheets, range_name)
+        by_columns = params.get("majorDimension") == "COLUMNS"
+        response = {"range": range_name, "majorDimension": "COLUMNS" if by_columns else "ROWS"}
+        values = sheet.read(grid, by_columns)
+        if values:
+            response["values"] = values
+        return response
+
+    def _values_update(self, spreadsheet_id: str, sheets: Dict[str, EmulatedSheet], range_name: str, payload: dict) -> dict:
+        sheet, grid = self._resolve(sheets, range_name)
+        values = payload.get("values", [])
+        sheet.write(grid.get("startRowIndex", 0), grid.get("startColumnIndex", 0), values)
+        return {"spreadsheetId": spreadsheet_id, "updatedRange": range_name, "updatedRows": len(values),
+                "updatedColumns": max((len(v) for v in values), default=0),
+                "updatedCells": sum(len(v) for v in values)}
+
+    def _values_append(self, spreadsheet_id: str, sheets: Dict[str, EmulatedSheet], range_name: str, payload: dict) -> dict:
+        sheet, grid = self._resolve(sheets, range_name)
+        values = payload.get("values", [])
+        row0 = max(sheet.last_row(), grid.get("startRowIndex", 0))
+        col0 = grid.get("startColumnIndex", 0)
+        sheet.write(row0, col0, values)
+        width = max((len(v) for v in values), default=1)
+        updated_range = (f"'{sheet.title}'!{rowcol_to_a1(row0 + 1, col0 + 1)}:"
+                         f"{rowcol_to_a1(row0 + max(len(values), 1), col0 + width)}")
+        return {"spreadsheetId": spreadsheet_id, "tableRange": f"'{sheet.title}'!A1",
+                "updates": {"spreadsheetId": spreadsheet_id, "updatedRange": updated_range,
+                            "updatedRows": len(values), "updatedColumns": width,
+                            "updatedCells": sum(len(v) for v in values)}}
+
+    def _batch_update(self, spreadsheet_id: str, sheets: Dict[str, EmulatedSheet], payload: dict) -> dict:
+        replies = []
+        for request in payload.get("requests", []):
+            if "addSheet" in request:
+                props = request["addSheet"].get("properties", {})
+                grid = props.get("gridProperties", {})
+                sheet = self.add_sheet(spreadsheet_id, props["title"], int(grid.get("rowCount", 1000)),
+                                       int(grid.get("columnCount", 26)))
+                replies.append({"addSheet": {"properties": sheet.properties()}})
+            elif "deleteDimension" in request:
+                rng = request["deleteDimension"]["range"]
+                sheet = next(s for s in sheets.values() if s.sheet_id == rng["sheetId"])
+                if rng.get("dimension", "ROWS") != "ROWS":
+                    raise ValueError("эмулятор поддерживает удаление только строк")
+                sheet.delete_rows(rng.get("startIndex", 0), rng.get("endIndex", len(sheet.values)))
+                replies.append({})
+            else:
+                raise ValueError(f"неподдерживаемый запрос batchUpdate: {sorted(request)}")
+        return {"spreadsheetId": spreadsheet_id, "replies": replies}
+
+
+def _error(code: int, message: str, status: str) -> Tuple[int, dict]:
+    return code, {"error": {"code": code, "message": message, "status": status}}
+
+
+class EmulatorAdapter(BaseAdapter):
+    """Транспорт requests, который отвечает из SheetsEmulator вместо сети."""
+
+    def __init__(self, emulator: SheetsEmulator):
+        super().__init__()
+        self.emulator = emulator
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        body = request.body.encode("utf-8") if isinstance(request.body, str) else request.body
+        status, payload = self.emulator.handle(request.method, request.url, body)
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        response.headers["Content-Type"] = "application/json; charset=UTF-8"
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.reason = "OK" if status == 200 else "Error"
+        return response
+
+    def close(self):
+        pass
+
+
+def create_emulated_client(emulator: SheetsEmulator) -> gspread.Client:
+    """Клиент gspread без авторизации, все запросы которого обслуживает эмулятор."""
+    session = requests.Session()
+    session.mount(API_BASE, EmulatorAdapter(emulator))
+    logging.info("[GS] Используется эмулятор Google Sheets.")
+    return gspread.Client(auth=None, session=session)
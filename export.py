@@ -0,0 +1,107 @@
+# utils/export.py
+import csv
+import io
+import logging
+import tempfile
+from datetime import datetime
+from typing import IO, Iterable, Iterator, List, Optional, Sequence
+
+EXPORT_FORMATS = ("csv", "xlsx")
+# Колонки, которые в XLSX пишутся числами, чтобы по ним работали сумма и фильтры Excel
+NUMERIC_COLUMNS = ("Порядковый номер заявки", "Время_простоя_минут", "ID_пользователя_Telegram")
+
+
+class ExportError(Exception):
+    """Выгрузку нельзя сформировать: нет openpyxl или файл больше допустимого размера документа."""
+
+
+def iter_export_rows(headers: List[str], rows: List[List[str]], row_ids: Sequence[int]) -> Iterator[List[str]]:
+    """
+    Строки выгрузки в хронологическом порядке. Индекс простоев возвращает новые первыми,
+    поэтому номера обходятся с конца; сами строки не копируются до момента записи.
+    """
+    width = len(headers)
+    for row_id in reversed(row_ids):
+        row = rows[row_id]
+        yield row if len(row) == width else (row + [""] * (width - len(row)))[:width]
+
+
+def _xlsx_cells(headers: List[str], rows: Iterable[List[str]], row_ts: List[Optional[datetime]],
+                row_ids: Sequence[int]) -> Iterator[list]:
+    numeric = [i for i, h in enumerate(headers) if h in NUMERIC_COLUMNS]
+    ts_idx = headers.index("Timestamp_записи") if "Timestamp_записи" in headers else None
+    for row_id, row in zip(reversed(row_ids), rows):
+        cells: list = list(row)
+        for i in numeric:
+            if cells[i].isdigit():
+                cells[i] = int(cells[i])
+        # Время записи уже разобрано индексом: в XLSX оно попадает датой, а не строкой в одном из форматов листа
+        if ts_idx is not None and row_ts[row_id]:
+            cells[ts_idx] = row_ts[row_id]
+        yield cells
+
+
+def write_csv(headers: List[str], rows: Iterable[List[str]], out: IO[bytes]) -> int:
+    """CSV с разделителем ';' и BOM: так его без настройки открывает Excel в русской локали."""
+    stream = io.TextIOWrapper(out, encoding="utf-8-sig", newline="", write_through=True)
+    writer = csv.writer(stream, delimiter=";")
+    writer.writerow(headers)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    stream.flush()
+    # Обертка не должна закрыть файл вместе с собой
+    stream.detach()
+    return count
+
+
+def write_xlsx(headers: List[str], cells: Iterable[list], out: IO[bytes]) -> int:
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ExportError("Для XLSX нужен пакет openpyxl. Используйте формат CSV.")
+    # write_only пишет строки в поток по одной, не держа лист целиком в памяти
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Простои")
+    sheet.append(headers)
+    count = 0
+    for row in cells:
+        sheet.append(row)
+        count += 1
+    workbook.save(out)
+    return count
+
+
+def build_export_file(headers: List[str], rows: List[List[str]], row_ts: List[Optional[datetime]],
+                      row_ids: Sequence[int], fmt: str, spool_max_bytes: int, max_bytes: int) -> IO[bytes]:
+    """
+    Пишет выгрузку во временный файл: до spool_max_bytes он остается в памяти, дальше уходит на диск.
+    rows и row_ts - списки индекса простоев (DowntimeIndex), row_ids - результат его запроса.
+    Возвращает файл, перемотанный в начало. Вызывается в пуле потоков.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes)
+    try:
+        export_rows = iter_export_rows(headers, rows, row_ids)
+        if fmt == "xlsx":
+            count = write_xlsx(headers, _xlsx_cells(headers, export_rows, row_ts, row_ids), out)
+        else:
+            count = write_csv(headers, export_rows, out)
+        size = out.tell()
+        if size > max_bytes:
+            raise ExportError(
+                f"Файл выгрузки {size / 1024 / 1024:.1f} МБ больше допустимых {max_bytes / 1024 / 1024:.0f} МБ. "
+                f"Сократите период или добавьте фильтры."
+            )
+    except Exception:
+        out.close()
+        raise
+    logging.info(f"[EXPORT] Выгрузка {fmt}: {count} строк, {size / 1024:.0f} КБ.")
+    out.seek(0)
+    return out
+
+
+def export_file_name(fmt: str, start: Optional[datetime], end: Optional[datetime]) -> str:
+    if start and end:
+        return f"downtimes_{start:%Y%m%d_%H%M}-{end:%Y%m%d_%H%M}.{fmt}"
+    return f"downtimes_{datetime.now():%Y%m%d_%H%M}.{fmt}"
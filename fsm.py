@@ -25,4 +25,8 @@ class PastDowntimeForm(StatesGroup):
     entering_downtime_end = State() # Запрос времени окончания
     entering_description = State()
     choosing_responsible_group = State()
-    confirming_submission = State() # Финальное подтверждение перед записью
\ No newline at end of file
+    confirming_submission = State() # Финальное подтверждение перед записью
+
+# Массовый импорт прошедших простоев из файла CSV/XLSX
+class BulkImportForm(StatesGroup):
+    waiting_for_file = State()
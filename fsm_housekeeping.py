@@ -0,0 +1,144 @@
+# utils/fsm_housekeeping.py
+import logging
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from fsm import DowntimeForm
+from keyboards.reply import get_main_keyboard
+
+FSMKey = Tuple[str, str]  # (chat_id, user_id) в том виде, в котором их хранит MemoryStorage
+
+# Состояния открытого простоя: пользователь ждет ответственную группу или окончания простоя, а после него
+# пишет финальный комментарий, и сброс потерял бы уже идущий простой. Они живут столько же, сколько
+# открытая заявка, и снимаются по отдельному, более длинному сроку
+WAITING_STATES = {
+    DowntimeForm.waiting_for_group_acceptance.state,
+    DowntimeForm.waiting_for_group_work_completion.state,
+    DowntimeForm.waiting_for_downtime_end.state,
+    DowntimeForm.entering_additional_comment.state,
+}
+
+
+def _deep_sizeof(obj, seen=None) -> int:
+    """Приблизительный размер объекта вместе с вложенными словарями, списками и строками."""
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+class FSMHousekeeper:
+    """
+    Следит за последней активностью в каждом диалоге и сбрасывает брошенные состояния FSM.
+    Рассчитан на MemoryStorage: без очистки незаконченный ввод простоя хранится до перезапуска бота.
+    """
+
+    def __init__(self, idle_seconds: float, waiting_seconds: float):
+        self.idle_seconds = idle_seconds
+        self.waiting_seconds = waiting_seconds
+        self.last_activity: Dict[FSMKey, float] = {}
+        self.evicted_total = 0
+
+    def touch(self, chat_id: int, user_id: int):
+        self.last_activity[(str(chat_id), str(user_id))] = time.time()
+
+    def _timeout_for(self, state: Optional[str]) -> float:
+        return self.waiting_seconds if state in WAITING_STATES else self.idle_seconds
+
+    async def sweep(self, dp: Dispatcher):
+        """Сбрасывает просроченные состояния, уведомляет пользователей и освобождает занятые линии."""
+        fsm_data = getattr(dp.storage, 'data', None)
+        if fsm_data is None:
+            return
+        storage = dp['storage']
+        now = time.time()
+        expired: List[Tuple[FSMKey, Optional[str], dict]] = []
+        for chat_id, users in fsm_data.items():
+            for user_id, record in users.items():
+                key = (chat_id, user_id)
+                # Состояния, появившиеся до запуска учета, отсчитываем с момента первой проверки
+                last_seen = self.last_activity.setdefault(key, now)
+                if now - last_seen > self._timeout_for(record.get('state')):
+                    expired.append((key, record.get('state'), dict(record.get('data') or {})))
+
+        for (chat_id, user_id), state, data in expired:
+            await dp.storage.finish(chat=chat_id, user=user_id)
+            self._drop(fsm_data, chat_id, user_id)
+            if state is None:
+                # Остались только служебные данные (например, параметры /query) — убираем молча
+                continue
+            self.evicted_total += 1
+            if data.get('site_name') and data.get('ls_name'):
+                storage.active_downtimes.release((data['site_name'], data['ls_name']), int(user_id))
+            logging.info(f"[FSM] Сброшено брошенное состояние '{state}' (чат {chat_id}, пользователь {user_id}).")
+            try:
+                await dp.bot.send_message(
+                    int(chat_id),
+                    "⌛️ Незавершенный ввод был отменен из-за долгого бездействия. Начните заново, если он еще нужен.",
+                    reply_markup=get_main_keyboard(storage.is_admin(user_id))
+                )
+            except Exception as e:
+                logging.warning(f"[FSM] Не удалось уведомить пользователя {user_id} о сбросе ввода: {e}")
+
+        # Учет активности не должен расти сам по себе: забываем ключи, которых уже нет в хранилище
+        for key in [key for key in self.last_activity if key[1] not in fsm_data.get(key[0], {})]:
+            del self.last_activity[key]
+
+    def _drop(self, fsm_data: dict, chat_id: str, user_id: str):
+        """Удаляет пустую запись MemoryStorage, которая остается после finish()."""
+        users = fsm_data.get(chat_id, {})
+        record = users.get(user_id)
+        if record and record.get('state') is None and not record.get('data') and not record.get('bucket'):
+            del users[user_id]
+        if not users:
+            fsm_data.pop(chat_id, None)
+
+    def render_stats(self, dp: Dispatcher) -> str:
+        fsm_data = getattr(dp.storage, 'data', None)
+        if fsm_data is None:
+            return "Хранилище FSM не поддерживает подсчет (используется не MemoryStorage)."
+        states = Counter()
+        records = 0
+        for users in fsm_data.values():
+            for record in users.values():
+                records += 1
+                state = record.get('state')
+                states[state.split(':', 1)[0] if state else "без состояния"] += 1
+        lines = [
+            "🧠 **Состояния FSM**",
+            f"Записей в хранилище: {records}",
+            f"Память хранилища: ~{_deep_sizeof(fsm_data) / 1024:.1f} КБ",
+            f"Отслеживаемых диалогов: {len(self.last_activity)}, ~{_deep_sizeof(self.last_activity) / 1024:.1f} КБ",
+            f"Сброшено по бездействию с запуска: {self.evicted_total}",
+        ]
+        if states:
+            lines.append("\nПо группам состояний:")
+            lines.extend(f"   └ {name}: {count}" for name, count in states.most_common())
+        return "\n".join(lines)
+
+
+class FSMActivityMiddleware(BaseMiddleware):
+    """Отмечает активность пользователя перед обработкой каждого сообщения и нажатия кнопки."""
+
+    def __init__(self, housekeeper: FSMHousekeeper):
+        super().__init__()
+        self.housekeeper = housekeeper
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        if message.from_user:
+            self.housekeeper.touch(message.chat.id, message.from_user.id)
+
+    async def on_pre_process_callback_query(self, cb: types.CallbackQuery, data: dict):
+        if cb.message:
+            self.housekeeper.touch(cb.message.chat.id, cb.from_user.id)
@@ -1,6 +1,7 @@
 # keyboards/inline.py
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from utils.storage import DataStorage
+from utils.period_reports import PERIOD_PRESETS
 from config import (PRODUCTION_SITES, LINES_SECTIONS, DOWNTIME_REASONS, 
                     ADMIN_ROLE, EMPLOYEE_ROLE, PRODUCTION_SITE_EMOJIS)
 
@@ -66,3 +67,20 @@ def get_admin_roles_keyboard() -> InlineKeyboardMarkup:
     kb.add(InlineKeyboardButton(text="🗑️ Удалить роль", callback_data=f"setrole_DELETE"))
     kb.add(InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_admin_role_input"))
     return kb
+
+def get_query_pagination_keyboard(page: int, total_pages: int) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardMarkup(row_width=3)
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"dtq_page_{page - 1}"))
+    buttons.append(InlineKeyboardButton(text=f"{page + 1}/{total_pages}", callback_data="dtq_noop"))
+    if page < total_pages - 1:
+        buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"dtq_page_{page + 1}"))
+    kb.row(*buttons)
+    return kb
+
+def get_period_presets_keyboard() -> InlineKeyboardMarkup:
+    kb = InlineKeyboardMarkup(row_width=2)
+    buttons = [InlineKeyboardButton(text=f"📆 {v}", callback_data=f"period_{k}") for k, v in PERIOD_PRESETS.items()]
+    kb.add(*buttons)
+    return kb
@@ -0,0 +1,163 @@
+# utils/intervals.py
+import bisect
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pytz import timezone
+
+from config import SCHEDULER_TIMEZONE
+from utils.parsing import parse_manual_entry_span, parse_sheet_datetime, unchanged_row_count
+
+_EPOCH = datetime(2000, 1, 1)
+
+
+def _to_minutes(dt: datetime) -> float:
+    """Наивное локальное время -> минуты от фиксированной точки отсчета."""
+    return (dt - _EPOCH).total_seconds() / 60
+
+
+def naive_local(dt: datetime) -> datetime:
+    if dt.tzinfo:
+        return dt.astimezone(timezone(SCHEDULER_TIMEZONE)).replace(tzinfo=None)
+    return dt
+
+
+def record_span(end_dt: datetime, duration: int, comment: str = "") -> Tuple[datetime, datetime]:
+    """
+    Начало и конец простоя записи: конец - время записи, начало - на длительность раньше. Для записей,
+    внесенных задним числом, время записи - момент ввода, поэтому границы берутся из их комментария.
+    """
+    return parse_manual_entry_span(comment, end_dt) or (end_dt - timedelta(minutes=duration), end_dt)
+
+
+def merged_minutes(spans: Iterable[Tuple[datetime, datetime]]) -> int:
+    """Минуты простоя набора записей одной линии с объединением наложившихся отрезков."""
+    total = timedelta()
+    current_start = current_end = None
+    for start, end in sorted(spans):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return int(round(total.total_seconds() / 60))
+
+
+class LineIntervals:
+    """
+    Непересекающиеся отсортированные интервалы простоя одной линии.
+    Пересекающиеся и смежные интервалы сливаются при добавлении;
+    запрос покрытия отрезка выполняется двумя бинарными поисками по префиксным суммам.
+    """
+    __slots__ = ("starts", "ends", "_prefix")
+
+    def __init__(self):
+        self.starts: List[float] = []
+        self.ends: List[float] = []
+        self._prefix: Optional[List[float]] = None
+
+    def add(self, start: float, end: float):
+        i = bisect.bisect_left(self.ends, start)
+        j = bisect.bisect_right(self.starts, end)
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+        self._prefix = None
+
+    def covered(self, a: float, b: float) -> float:
+        """Сколько минут отрезка [a, b) покрыто простоем."""
+        i = bisect.bisect_right(self.ends, a)
+        j = bisect.bisect_left(self.starts, b)
+        if i >= j:
+            return 0.0
+        if self._prefix is None:
+            self._prefix = [0.0]
+            for s, e in zip(self.starts, self.ends):
+                self._prefix.append(self._prefix[-1] + (e - s))
+        total = self._prefix[j] - self._prefix[i]
+        total -= max(0.0, a - self.starts[i])
+        total -= max(0.0, self.ends[j - 1] - b)
+        return total
+
+    def clipped(self, a: float, b: float) -> List[Tuple[float, float]]:
+        """Интервалы, пересекающие [a, b), обрезанные по его границам."""
+        i = bisect.bisect_right(self.ends, a)
+        j = bisect.bisect_left(self.starts, b)
+        return [(max(s, a), min(e, b)) for s, e in zip(self.starts[i:j], self.ends[i:j])]
+
+
+class DowntimeIntervalIndex:
+    """
+    Интервалы простоев по каждой паре (площадка, линия).
+    Границы интервала записи - record_span().
+    Позволяет считать простой без двойного учета наложившихся записей.
+    """
+
+    def __init__(self):
+        self.headers: Optional[List[str]] = None
+        self.lines: Dict[Tuple[str, str], LineIntervals] = {}
+        self._indexed = 0
+        self._rows: List[List[str]] = []
+        self._idx: Dict[str, int] = {}
+        self._comment_idx: Optional[int] = None
+
+    def sync(self, headers: List[str], data_rows: List[List[str]], unchanged_rows: Optional[int] = None):
+        if unchanged_rows is None:
+            unchanged_rows = unchanged_row_count(self._rows, data_rows)
+        rebuild = headers != self.headers or unchanged_rows < self._indexed
+        if rebuild:
+            try:
+                self._idx = {col: headers.index(col) for col in
+                             ("Timestamp_записи", "Площадка", "Линия_Секция", "Время_простоя_минут")}
+            except ValueError as e:
+                logging.error(f"[INTERVALS] Отсутствует необходимый столбец в таблице: {e}")
+                return
+            comment_col = "Дополнительный_комментарий_инициатора"
+            self._comment_idx = headers.index(comment_col) if comment_col in headers else None
+            self.headers = list(headers)
+            self.lines = {}
+            self._indexed = 0
+        for row in data_rows[self._indexed:]:
+            self._ingest(row)
+        self._indexed = len(data_rows)
+        self._rows = data_rows
+
+    def _ingest(self, row: List[str]):
+        try:
+            if len(row) <= max(self._idx.values()) or not row[self._idx["Timestamp_записи"]]:
+                return
+            end_dt = parse_sheet_datetime(row[self._idx["Timestamp_записи"]], log_failures=False)
+            duration = int(row[self._idx["Время_простоя_минут"]] or 0)
+        except ValueError:
+            return
+        if not end_dt or duration <= 0:
+            return
+        key = (row[self._idx["Площадка"]], row[self._idx["Линия_Секция"]])
+        # Комментарий не входит в обязательные столбцы: пустая ячейка в конце строки может отсутствовать
+        comment = row[self._comment_idx] if self._comment_idx is not None and self._comment_idx < len(row) else ""
+        start_dt, end_dt = record_span(end_dt, duration, comment)
+        if end_dt > start_dt:
+            self.lines.setdefault(key, LineIntervals()).add(_to_minutes(start_dt), _to_minutes(end_dt))
+
+    def covered_minutes(self, site_name: str, line_name: str, start_dt: datetime, end_dt: datetime) -> int:
+        """Фактические минуты простоя линии внутри [start_dt, end_dt) с объединением наложений."""
+        intervals = self.lines.get((site_name, line_name))
+        if not intervals:
+            return 0
+        return int(round(intervals.covered(_to_minutes(naive_local(start_dt)), _to_minutes(naive_local(end_dt)))))
+
+    def intervals_by_line(self, start_dt: datetime, end_dt: datetime) -> Dict[Tuple[str, str], List[Tuple[float, float]]]:
+        """Слитые интервалы простоя каждой линии внутри [start_dt, end_dt): (минут от start_dt, длительность)."""
+        a, b = _to_minutes(naive_local(start_dt)), _to_minutes(naive_local(end_dt))
+        result = {}
+        for key, intervals in self.lines.items():
+            spans = intervals.clipped(a, b)
+            if spans:
+                result[key] = [(s - a, e - s) for s, e in spans]
+        return result
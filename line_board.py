@@ -0,0 +1,84 @@
+# utils/line_board.py
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from aiogram import Bot
+from aiogram.utils.exceptions import MessageNotModified, MessageToEditNotFound, MessageCantBeEdited
+
+
+class LineStatusBoard:
+    """
+    Закрепленное сообщение со статусом линий в чатах администраторов.
+    При изменении активных простоев сообщение редактируется на месте: изменения за окно debounce
+    склеиваются в одно редактирование, а неизменившийся текст не отправляется вовсе.
+    """
+
+    def __init__(self, debounce_seconds: float):
+        self.debounce_seconds = debounce_seconds
+        self.bot: Optional[Bot] = None
+        self.render: Optional[Callable[[], Awaitable[str]]] = None
+        self.boards: Dict[int, Dict[str, object]] = {}  # chat_id -> {"message_id", "text"}
+        self._pending: Optional[asyncio.Task] = None
+        self._dirty = False
+        self.edits_sent = 0
+        self.edits_skipped = 0
+
+    def configure(self, bot: Bot, render: Callable[[], Awaitable[str]]):
+        self.bot = bot
+        self.render = render
+
+    def has_board(self, chat_id: int) -> bool:
+        return chat_id in self.boards
+
+    async def attach(self, chat_id: int):
+        """Отправляет в чат новое сообщение-доску и закрепляет его. Предыдущая доска чата больше не обновляется."""
+        text = await self.render()
+        message = await self.bot.send_message(chat_id, text, parse_mode="Markdown")
+        self.boards[chat_id] = {"message_id": message.message_id, "text": text}
+        try:
+            await self.bot.pin_chat_message(chat_id, message.message_id, disable_notification=True)
+        except Exception as e:
+            logging.warning(f"[BOARD] Не удалось закрепить доску статуса в чате {chat_id}: {e}")
+        logging.info(f"[BOARD] Доска статуса линий создана в чате {chat_id}.")
+
+    def notify_changed(self):
+        """Сообщает об изменении статуса линий. Обновление будет выполнено после паузы debounce."""
+        if not self.boards or not self.render:
+            return
+        self._dirty = True
+        if self._pending and not self._pending.done():
+            # Выполняющееся обновление увидит флаг и перерисует доску еще раз, если изменение пришло во время отрисовки
+            return
+        try:
+            self._pending = asyncio.get_running_loop().create_task(self._debounced_refresh())
+        except RuntimeError:
+            # Нет запущенного цикла событий (например, при вызове из синхронного кода)
+            pass
+
+    async def _debounced_refresh(self):
+        while self._dirty:
+            await asyncio.sleep(self.debounce_seconds)
+            self._dirty = False
+            await self.refresh()
+
+    async def refresh(self):
+        """Перерисовывает доску и редактирует сообщения, текст которых изменился."""
+        if not self.boards or not self.render:
+            return
+        text = await self.render()
+        for chat_id, board in list(self.boards.items()):
+            if board["text"] == text:
+                self.edits_skipped += 1
+                continue
+            try:
+                await self.bot.edit_message_text(text, chat_id, board["message_id"], parse_mode="Markdown")
+                board["text"] = text
+                self.edits_sent += 1
+            except MessageNotModified:
+                board["text"] = text
+            except (MessageToEditNotFound, MessageCantBeEdited):
+                logging.info(f"[BOARD] Сообщение доски в чате {chat_id} недоступно, доска отключена.")
+                del self.boards[chat_id]
+            except Exception as e:
+                logging.error(f"[BOARD] Не удалось обновить доску статуса в чате {chat_id}: {e}")
@@ -0,0 +1,118 @@
+# utils/line_registry.py
+import heapq
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+LineKey = Tuple[str, str]  # (площадка, линия)
+
+
+class LineLease:
+    """Аренда линии одним оператором на время активного простоя."""
+    __slots__ = ("line", "user_id", "request_id", "reason", "started_at", "expires_at")
+
+    def __init__(self, line: LineKey, user_id: int, reason: str, started_at: float, expires_at: float,
+                 request_id: Optional[str] = None):
+        self.line = line
+        self.user_id = user_id
+        self.request_id = request_id
+        self.reason = reason
+        self.started_at = started_at
+        self.expires_at = expires_at
+
+
+class LineOccupancyRegistry:
+    """
+    Реестр активных простоев по линиям.
+    На одной линии может быть несколько держателей (по одному на оператора). Каждая аренда истекает,
+    если ее не продлевают: брошенные и отмененные вводы больше не оставляют линию в статусе "ПРОСТОЙ".
+    Истечение проверяется дешевой очисткой по куче сроков, которую вызывает планировщик.
+    """
+
+    def __init__(self, lease_seconds: float, on_change: Optional[Callable[[], None]] = None):
+        self.lease_seconds = lease_seconds
+        self.on_change = on_change
+        self._lines: Dict[LineKey, Dict[int, LineLease]] = {}
+        self._expiry_heap: List[Tuple[float, LineKey, int]] = []
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def __contains__(self, line: LineKey) -> bool:
+        return line in self._lines
+
+    def __len__(self) -> int:
+        return sum(len(holders) for holders in self._lines.values())
+
+    def holders(self, line: LineKey) -> List[LineLease]:
+        """Держатели линии в порядке начала простоя."""
+        return sorted(self._lines.get(line, {}).values(), key=lambda lease: lease.started_at)
+
+    def get(self, line: LineKey, default: Optional[str] = None) -> Optional[str]:
+        """Направление простоя первого держателя линии (совместимо со старым словарем)."""
+        holders = self.holders(line)
+        return holders[0].reason if holders else default
+
+    def acquire(self, line: LineKey, user_id: int, reason: str, request_id: Optional[str] = None) -> LineLease:
+        """Берет или обновляет аренду линии пользователем."""
+        now = time.time()
+        lease = self._lines.get(line, {}).get(user_id)
+        if lease:
+            lease.reason = reason
+            lease.request_id = request_id or lease.request_id
+            lease.expires_at = now + self.lease_seconds
+        else:
+            lease = LineLease(line, user_id, reason, now, now + self.lease_seconds, request_id)
+            self._lines.setdefault(line, {})[user_id] = lease
+        heapq.heappush(self._expiry_heap, (lease.expires_at, line, user_id))
+        self._changed()
+        return lease
+
+    def renew(self, line: LineKey, user_id: int, request_id: Optional[str] = None) -> bool:
+        """Продлевает аренду, если она есть. Возвращает False, если аренды нет."""
+        lease = self._lines.get(line, {}).get(user_id)
+        if not lease:
+            return False
+        lease.expires_at = time.time() + self.lease_seconds
+        if request_id:
+            lease.request_id = request_id
+        heapq.heappush(self._expiry_heap, (lease.expires_at, line, user_id))
+        return True
+
+    def release(self, line: LineKey, user_id: int) -> Optional[LineLease]:
+        holders = self._lines.get(line)
+        if not holders or user_id not in holders:
+            return None
+        lease = holders.pop(user_id)
+        if not holders:
+            del self._lines[line]
+        # Запись в куче остается и будет отброшена при очистке
+        self._changed()
+        return lease
+
+    def sweep(self, now: Optional[float] = None) -> List[LineLease]:
+        """Удаляет истекшие аренды. Просматриваются только записи кучи с наступившим сроком."""
+        now = now or time.time()
+        expired = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, line, user_id = heapq.heappop(self._expiry_heap)
+            lease = self._lines.get(line, {}).get(user_id)
+            # Продленные и уже снятые аренды пропускаем
+            if lease and lease.expires_at <= now:
+                holders = self._lines[line]
+                del holders[user_id]
+                if not holders:
+                    del self._lines[line]
+                expired.append(lease)
+        if expired:
+            for lease in expired:
+                logging.warning(f"[LINES] Истекла аренда простоя {lease.line[0]}/{lease.line[1]} "
+                                f"(пользователь {lease.user_id}, заявка {lease.request_id or '—'}).")
+            self._changed()
+        # Куча не должна разрастаться от продлений: пересобираем ее, когда устаревших записей слишком много
+        if len(self._expiry_heap) > 4 * len(self) + 64:
+            self._expiry_heap = [(lease.expires_at, lease.line, lease.user_id)
+                                 for holders in self._lines.values() for lease in holders.values()]
+            heapq.heapify(self._expiry_heap)
+        return expired
@@ -0,0 +1,478 @@
+# benchmarks/load_harness.py
+"""
+Нагрузочный стенд диалога ввода простоя: N операторов одновременно проходят DowntimeForm.
+
+Использование:
+    python -m benchmarks.load_harness [--users 50] [--groups 3] [--members 2] [--ramp 5] [--think-ms 300]
+                                      [--telegram-latency-ms 40] [--sheets-latency-ms 80] [--history 5000]
+                                      [--photo-ratio 0.3] [--comment-ratio 0.5] [--output load.json]
+
+Сценарий оператора: кнопка меню → площадка → линия → направление → описание (текст, фото или /skip) → группа;
+участник группы нажимает «Принять» и «Завершить работу»; оператор закрывает простой с комментарием или без.
+Бот собирается тем же create_dispatcher, что и в main_bot, и ходит по HTTP в локальную заглушку Bot API,
+таблица обслуживается эмулятором Sheets API. Апдейты подаются в dp.process_updates, как при polling.
+Время шага — от подачи апдейта до завершения обработчика. Пользователи нажимают только те кнопки,
+которые бот им действительно прислал: ответ бота ищется в сообщениях заглушки.
+"""
+import os
+import tempfile
+
+# Стенд никогда не должен ходить в настоящие Telegram и таблицу
+os.environ["SHEETS_BACKEND"] = "emulator"
+# Свой журнал записей на каждый запуск: неотправленные строки прошлого прогона не должны попасть в эмулятор
+os.environ["JOURNAL_PATH"] = os.path.join(tempfile.mkdtemp(prefix="load_harness_"), "journal.jsonl")
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import statistics
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+
+import config
+from config import (DOWNTIME_WORKSHEET_NAME, RESPONSIBLE_GROUPS_WORKSHEET_NAME, USER_ROLES_WORKSHEET_NAME,
+                    GROUP_NAME_COLUMN, GROUP_ID_COLUMN, USER_ID_COLUMN, USER_ROLE_COLUMN, EMPLOYEE_ROLE, SHEET_HEADERS)
+from g_sheets import api
+from main_bot import create_dispatcher, on_startup, on_shutdown
+from utils.tracing import TracedBot
+from benchmarks.bench_reports import generate_rows
+
+LOAD_TEST_TOKEN = "123456789:LOADTEST-stand-in-token-not-for-telegram"
+OPERATOR_ID_BASE = 500000
+MEMBER_ID_BASE = 900000
+GROUP_CHAT_ID_BASE = -1001000000000
+
+
+class StandInTelegramAPI:
+    """
+    Заглушка Bot API: отвечает правдоподобными объектами и хранит сообщения по чатам,
+    чтобы имитируемые пользователи видели кнопки, отправленные ботом.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, strict: bool = True):
+        self.latency_ms = latency_ms
+        # Без строгой проверки правка неизвестного сообщения успешна: при воспроизведении записи
+        # нажатия ссылаются на сообщения, отправленные ботом еще до начала записи
+        self.strict = strict
+        self.chats: Dict[int, Dict[int, dict]] = defaultdict(dict)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.failures: Dict[str, int] = defaultdict(int)
+        # Файлы, которые пользователи "загрузили" в Telegram: file_id -> содержимое (для getFile и скачивания)
+        self.files: Dict[str, bytes] = {}
+        self._message_ids = itertools.count(1)
+        self._changed = asyncio.Condition()
+
+    def next_message_id(self) -> int:
+        return next(self._message_ids)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        form = dict(await request.post())
+        self.calls[method] += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        result = await self._dispatch(method, form)
+        if result is None:
+            self.failures[method] += 1
+            return web.json_response({"ok": False, "error_code": 400,
+                                      "description": "Bad Request: message to edit not found"}, status=400)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _dispatch(self, method: str, form: dict):
+        if method == "getMe":
+            return {"id": 123456789, "is_bot": True, "first_name": "Load Test Bot", "username": "load_test_bot"}
+        if method == "getFile":
+            return {"file_id": form["file_id"], "file_unique_id": form["file_id"],
+                    "file_size": len(self.files.get(form["file_id"], b"")), "file_path": f"documents/{form['file_id']}"}
+        if method in ("sendMessage", "sendPhoto", "sendDocument"):
+            chat_id = int(form["chat_id"])
+            message = {
+                "message_id": self.next_message_id(), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"},
+                "from": {"id": 123456789, "is_bot": True, "first_name": "Load Test Bot"},
+            }
+            if method == "sendPhoto":
+                photo = form["photo"]
+                if not isinstance(photo, str):
+                    # Загруженная картинка (графики отчетов): сохраняем под новым file_id, как Telegram
+                    upload, photo = photo, f"uploaded_{message['message_id']}"
+                    self.files[photo] = upload.file.read()
+                message["photo"] = [{"file_id": photo, "file_unique_id": photo, "width": 1280, "height": 960}]
+                message["caption"] = form.get("caption", "")
+            elif method == "sendDocument":
+                document = form["document"]
+                file_name = getattr(document, "filename", None) or "document"
+                message["document"] = {"file_id": file_name, "file_unique_id": file_name, "file_name": file_name}
+                message["caption"] = form.get("caption", "")
+            else:
+                message["text"] = form.get("text", "")
+            if form.get("reply_markup"):
+                message["reply_markup"] = json.loads(form["reply_markup"])
+            await self._store(message)
+            return message
+        if method in ("editMessageText", "editMessageCaption", "editMessageReplyMarkup"):
+            chat_id, message_id = int(form.get("chat_id", 0)), int(form.get("message_id", 0))
+            message = self.chats.get(chat_id, {}).get(message_id)
+            if message is None:
+                if self.strict:
+                    return None
+                message = {"message_id": message_id, "date": int(time.time()),
+                           "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"}}
+            message = dict(message)
+            if method == "editMessageText":
+                message["text"] = form.get("text", "")
+            elif method == "editMessageCaption":
+                message["caption"] = form.get("caption", "")
+            # Как и в Telegram, правка без reply_markup убирает кнопки
+            if form.get("reply_markup"):
+                message["reply_markup"] = json.loads(form["reply_markup"])
+            else:
+                message.pop("reply_markup", None)
+            message["edit_date"] = int(time.time())
+            await self._store(message)
+            return message
+        # answerCallbackQuery, pinChatMessage, deleteMessage и прочее
+        return True
+
+    async def _store(self, message: dict):
+        async with self._changed:
+            self.chats[message["chat"]["id"]][message["message_id"]] = message
+            self._changed.notify_all()
+
+    def _find_button(self, chat_id: int, prefix: str) -> Optional[Tuple[dict, str]]:
+        for message in reversed(list(self.chats.get(chat_id, {}).values())):
+            for row in message.get("reply_markup", {}).get("inline_keyboard", []):
+                for button in row:
+                    if button.get("callback_data", "").startswith(prefix):
+                        return message, button["callback_data"]
+        return None
+
+    def _find_text(self, chat_id: int, fragment: str, after_id: int) -> Optional[dict]:
+        for message_id, message in self.chats.get(chat_id, {}).items():
+            if message_id > after_id and fragment in (message.get("text") or message.get("caption") or ""):
+                return message
+        return None
+
+    async def _wait(self, probe, timeout: float):
+        async def poll():
+            async with self._changed:
+                while True:
+                    found = probe()
+                    if found is not None:
+                        return found
+                    await self._changed.wait()
+        return await asyncio.wait_for(poll(), timeout)
+
+    async def wait_for_button(self, chat_id: int, prefix: str, timeout: float) -> Tuple[dict, str]:
+        """Ждет в чате сообщение с кнопкой, callback_data которой начинается с prefix."""
+        return await self._wait(lambda: self._find_button(chat_id, prefix), timeout)
+
+    async def wait_for_text(self, chat_id: int, fragment: str, after_id: int, timeout: float) -> dict:
+        return await self._wait(lambda: self._find_text(chat_id, fragment, after_id), timeout)
+
+    async def download(self, request: web.Request) -> web.Response:
+        content = self.files.get(request.match_info["path"].rsplit("/", 1)[-1])
+        if content is None:
+            return web.Response(status=404)
+        return web.Response(body=content)
+
+    async def start(self) -> Tuple[web.AppRunner, str]:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.download)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        return runner, f"http://{host}:{port}"
+
+
+class StepFailed(Exception):
+    pass
+
+
+class LoadRun:
+    """Имитируемые пользователи и замеры по шагам сценария."""
+
+    def __init__(self, dp: Dispatcher, telegram: StandInTelegramAPI, args: argparse.Namespace):
+        self.dp = dp
+        self.telegram = telegram
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.update_ids = itertools.count(1)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.completed_flows = 0
+        self.flow_seconds: List[float] = []
+
+    @staticmethod
+    def _user(user_id: int, name: str) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": name, "username": f"load_{user_id}"}
+
+    def _message_update(self, user: dict, text: Optional[str] = None, photo: Optional[str] = None) -> types.Update:
+        message = {"message_id": self.telegram.next_message_id(), "date": int(time.time()),
+                   "chat": {"id": user["id"], "type": "private"}, "from": user}
+        if photo:
+            message["photo"] = [{"file_id": photo, "file_unique_id": photo, "width": 1280, "height": 960}]
+            message["caption"] = text
+        else:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return types.Update.to_object({"update_id": next(self.update_ids), "message": message})
+
+    def _callback_update(self, user: dict, message: dict, data: str) -> types.Update:
+        callback = {"id": str(next(self.update_ids)), "from": user, "chat_instance": str(message["chat"]["id"]),
+                    "message": message, "data": data}
+        return types.Update.to_object({"update_id": next(self.update_ids), "callback_query": callback})
+
+    async def _step(self, name: str, update: types.Update):
+        started = time.perf_counter()
+        try:
+            await self.dp.process_updates([update])
+        except Exception as e:
+            self.errors[name][type(e).__name__] += 1
+            raise StepFailed(name) from e
+        finally:
+            self.latencies[name].append(time.perf_counter() - started)
+
+    async def _expect(self, name: str, awaitable):
+        """Ответ бота, без которого сценарий не может продолжаться."""
+        try:
+            return await awaitable
+        except asyncio.TimeoutError:
+            self.errors[name]["no_response"] += 1
+            raise StepFailed(name)
+
+    async def _think(self):
+        if self.args.think_ms:
+            await asyncio.sleep(self.args.think_ms / 1000 * self.rnd.uniform(0.5, 1.5))
+
+    async def _press(self, name: str, user: dict, chat_id: int, prefix: str):
+        message, data = await self._expect(name, self.telegram.wait_for_button(chat_id, prefix, self.args.step_timeout))
+        await self._think()
+        await self._step(name, self._callback_update(user, message, data))
+
+    async def operator_flow(self, index: int, group_index: int):
+        await asyncio.sleep(self.args.ramp * index / max(1, self.args.users))
+        operator = self._user(OPERATOR_ID_BASE + index, f"Оператор {index}")
+        member_index = self.rnd.randrange(self.args.members)
+        member = self._user(MEMBER_ID_BASE + group_index * 100 + member_index, f"Группа {group_index + 1}, участник {member_index + 1}")
+        chat_id, group_chat_id = operator["id"], GROUP_CHAT_ID_BASE - group_index
+        timeout = self.args.step_timeout
+        started = time.perf_counter()
+        step = "start"
+        try:
+            await self._step(step, self._message_update(operator, "📊 Внести запись о Простое"))
+            step = "site"
+            await self._press(step, operator, chat_id, "site_")
+            step = "line"
+            await self._press(step, operator, chat_id, "ls_")
+            step = "reason"
+            await self._press(step, operator, chat_id, "reason_")
+
+            step = "description"
+            await self._expect(step, self.telegram.wait_for_text(chat_id, "Введите описание", 0, timeout))
+            await self._think()
+            roll = self.rnd.random()
+            if roll < self.args.photo_ratio:
+                update = self._message_update(operator, "Порыв полотна, фото узла", photo=f"AgACAgIAAxkBAAIB{index:06d}")
+            elif roll < self.args.photo_ratio + self.args.skip_ratio:
+                update = self._message_update(operator, "/skip")
+            else:
+                update = self._message_update(operator, f"Нагрузочный тест: описание {index}")
+            await self._step(step, update)
+
+            step = "group"
+            await self._press(step, operator, chat_id, f"group_grp_idx_{group_index}")
+            # request_id заявки имеет вид dt_<id оператора>_<время>
+            step = "accept"
+            await self._press(step, member, group_chat_id, f"accept_dt_dt_{operator['id']}_")
+            step = "complete"
+            await self._press(step, member, group_chat_id, f"gw_simple_dt_{operator['id']}_")
+
+            last_id = self.telegram.next_message_id()
+            if self.rnd.random() < self.args.comment_ratio:
+                step = "close"
+                await self._press(step, operator, chat_id, "end_downtime_with_comment")
+                step = "comment"
+                # Бот правит сообщение с кнопками, поэтому ищем по всему чату
+                await self._expect(step, self.telegram.wait_for_text(chat_id, "дополнительный комментарий", 0, timeout))
+                await self._think()
+                await self._step(step, self._message_update(operator, "Заменили нож, линия запущена"))
+            else:
+                step = "close"
+                await self._press(step, operator, chat_id, "end_downtime_without_comment")
+            await self._expect(step, self.telegram.wait_for_text(chat_id, "успешно сохранена", last_id, timeout))
+        except StepFailed:
+            self.errors["flow"][f"aborted_at_{step}"] += 1
+            return
+        except Exception as e:
+            logging.exception(f"[LOAD] Сценарий оператора {index} упал на шаге {step}")
+            self.errors[step][type(e).__name__] += 1
+            self.errors["flow"][f"aborted_at_{step}"] += 1
+            return
+        self.completed_flows += 1
+        self.flow_seconds.append(time.perf_counter() - started)
+
+    async def run(self):
+        await asyncio.gather(*(self.operator_flow(i, i % self.args.groups) for i in range(self.args.users)))
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round((len(ordered) - 1) * p / 100)))]
+
+
+STEP_ORDER = ["start", "site", "line", "reason", "description", "group", "accept", "complete", "close", "comment"]
+
+
+def build_report(run: LoadRun, telegram: StandInTelegramAPI, storage, wall_seconds: float, args) -> dict:
+    steps = []
+    for name in STEP_ORDER:
+        values = run.latencies.get(name, [])
+        errors = dict(run.errors.get(name, {}))
+        if not values and not errors:
+            continue
+        # Шаг мог не выполниться ни разу, если бот так и не прислал нужную кнопку
+        steps.append({
+            "step": name, "count": len(values), "errors": errors,
+            **{f"p{p}_ms": round(percentile(values, p) * 1000, 1) if values else None for p in (50, 90, 99)},
+            "max_ms": round(max(values) * 1000, 1) if values else None,
+            "mean_ms": round(statistics.mean(values) * 1000, 1) if values else None,
+        })
+    sheet = api.sheets_emulator.spreadsheets[config.GOOGLE_SHEET_ID][DOWNTIME_WORKSHEET_NAME]
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "wall_seconds": round(wall_seconds, 2),
+        "flows": {"started": args.users, "completed": run.completed_flows, "aborted": dict(run.errors.get("flow", {})),
+                  "p50_seconds": round(percentile(run.flow_seconds, 50), 2) if run.flow_seconds else None,
+                  "p99_seconds": round(percentile(run.flow_seconds, 99), 2) if run.flow_seconds else None},
+        "steps": steps,
+        "telegram_calls": dict(telegram.calls),
+        "telegram_failures": dict(telegram.failures),
+        "sheets": {"requests": api.sheets_emulator.requests_total, "throttled": api.sheets_emulator.throttled_total,
+                   "cache_fetches": storage.cache_fetches, "cache_refresh_joins": storage.cache_refresh_joins},
+        # После полного прогона не должно остаться открытых заявок и занятых линий, а строк — ровно по числу сценариев
+        "consistency": {"rows_written": sheet.last_row() - 1 - args.history,
+                        "pending_requests_left": len(storage.pending_requests),
+                        "active_downtimes_left": len(storage.active_downtimes)},
+    }
+
+
+def print_report(report: dict):
+    flows = report["flows"]
+    print(f"\nСценариев: {flows['completed']}/{flows['started']} завершено за {report['wall_seconds']} с"
+          f" (p50 {flows['p50_seconds']} с, p99 {flows['p99_seconds']} с с учетом пауз пользователей)")
+    if flows["aborted"]:
+        print(f"Прервано: {flows['aborted']}")
+    print(f"\n{'шаг':<12} {'кол-во':>7} {'p50, мс':>9} {'p90, мс':>9} {'p99, мс':>9} {'max, мс':>9}  ошибки")
+    for step in report["steps"]:
+        errors = ", ".join(f"{k}={v}" for k, v in step["errors"].items()) or "—"
+        timings = " ".join(f"{step[k]:>9.1f}" if step[k] is not None else f"{'—':>9}"
+                           for k in ("p50_ms", "p90_ms", "p99_ms", "max_ms"))
+        print(f"{step['step']:<12} {step['count']:>7} {timings}  {errors}")
+    print(f"\nВызовы Bot API: {report['telegram_calls']}")
+    if report["telegram_failures"]:
+        print(f"Ошибки Bot API: {report['telegram_failures']}")
+    print(f"Sheets: {report['sheets']}")
+    print(f"Согласованность: {report['consistency']}")
+
+
+def seed_sheets(groups: List[Optional[Tuple[str, Optional[int]]]], roles: Dict[int, str], history: int,
+                sheets_latency_ms: float):
+    """
+    Группы, роли и история простоев в эмуляторе. Позиция в groups задает индекс grp_idx_N,
+    пропуски (None) сохраняют индексы следующих групп.
+    """
+    emulator = api.sheets_emulator
+    emulator.latency_ms = sheets_latency_ms
+    group_rows = [[GROUP_NAME_COLUMN, GROUP_ID_COLUMN]]
+    for group in groups:
+        name, chat_id = group or ("", None)
+        group_rows.append([name, str(chat_id) if chat_id else ""])
+    emulator.add_sheet(config.GOOGLE_SHEET_ID, RESPONSIBLE_GROUPS_WORKSHEET_NAME, values=group_rows)
+    role_rows = [[USER_ID_COLUMN, USER_ROLE_COLUMN]] + [[str(user_id), role] for user_id, role in roles.items()]
+    emulator.add_sheet(config.GOOGLE_SHEET_ID, USER_ROLES_WORKSHEET_NAME, rows=len(role_rows) + 100, values=role_rows)
+    history_rows = [list(SHEET_HEADERS)] + generate_rows(history)
+    emulator.add_sheet(config.GOOGLE_SHEET_ID, DOWNTIME_WORKSHEET_NAME, rows=len(history_rows) + 1000,
+                       cols=len(SHEET_HEADERS), values=history_rows)
+
+
+async def start_stand_in_bot(telegram: StandInTelegramAPI, seed: Callable[[], None]) -> Tuple[Dispatcher, web.AppRunner]:
+    """Поднимает заглушку Bot API и бота из create_dispatcher поверх эмулятора Sheets, заполненного seed()."""
+    runner, base_url = await telegram.start()
+    bot_class = TracedBot if config.TRACING_ENABLED else Bot
+    bot = bot_class(token=LOAD_TEST_TOKEN, server=TelegramAPIServer.from_base(base_url))
+    dp = create_dispatcher(bot)
+    seed()
+    # При polling это делает executor; здесь апдейты подаются напрямую
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+    await on_startup(dp)
+    return dp, runner
+
+
+async def stop_stand_in_bot(dp: Dispatcher, runner: web.AppRunner):
+    await on_shutdown(dp)
+    await runner.cleanup()
+
+
+async def run_load(args) -> dict:
+    telegram = StandInTelegramAPI(args.telegram_latency_ms)
+    groups = [(f"Группа {g + 1}", GROUP_CHAT_ID_BASE - g) for g in range(args.groups)]
+    roles = {OPERATOR_ID_BASE + i: EMPLOYEE_ROLE for i in range(args.users)}
+    dp, runner = await start_stand_in_bot(telegram, lambda: seed_sheets(groups, roles, args.history, args.sheets_latency_ms))
+    try:
+        load = LoadRun(dp, telegram, args)
+        started = time.perf_counter()
+        await load.run()
+        wall_seconds = time.perf_counter() - started
+        # Дожидаемся фонового обновления кэша, начатого последними записями
+        await dp['storage'].revalidate_downtime_cache(dp.bot)
+        return build_report(load, telegram, dp['storage'], wall_seconds, args)
+    finally:
+        await stop_stand_in_bot(dp, runner)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный стенд диалога ввода простоя.")
+    parser.add_argument("--users", type=int, default=50, help="одновременных операторов")
+    parser.add_argument("--groups", type=int, default=3, help="ответственных групп")
+    parser.add_argument("--members", type=int, default=2, help="участников в каждой группе")
+    parser.add_argument("--ramp", type=float, default=5.0, help="за сколько секунд подключаются все операторы")
+    parser.add_argument("--think-ms", type=float, default=300.0, help="средняя пауза пользователя перед действием")
+    parser.add_argument("--telegram-latency-ms", type=float, default=40.0, help="задержка ответа заглушки Bot API")
+    parser.add_argument("--sheets-latency-ms", type=float, default=80.0, help="задержка ответа эмулятора Sheets")
+    parser.add_argument("--history", type=int, default=5000, help="строк истории в листе простоев")
+    parser.add_argument("--photo-ratio", type=float, default=0.3, help="доля описаний с фото")
+    parser.add_argument("--skip-ratio", type=float, default=0.1, help="доля пропущенных описаний (/skip)")
+    parser.add_argument("--comment-ratio", type=float, default=0.5, help="доля закрытий с комментарием")
+    parser.add_argument("--step-timeout", type=float, default=60.0, help="сколько ждать ответа бота на шаге, с")
+    parser.add_argument("--seed", type=int, default=1, help="зерно случайных выборов")
+    parser.add_argument("--output", help="файл JSON с отчетом")
+    args = parser.parse_args()
+
+    # Логи обработчиков не должны искажать замеры
+    logging.getLogger().setLevel(logging.ERROR)
+
+    report = asyncio.run(run_load(args))
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nОтчет сохранен: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
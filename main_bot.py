@@ -1,6 +1,7 @@
 # main_bot.py
 import logging
 import asyncio
+from datetime import datetime
 from aiogram import Bot, Dispatcher, executor, types
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
@@ -8,8 +9,14 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import config
 from utils.storage import DataStorage
 from filters.admin_filter import AdminFilter
-from utils.reports import scheduled_line_status_report
-from utils.reminders import check_pending_requests_for_reminders
+from utils.reports import scheduled_line_status_report, scheduled_weekly_reliability_digest, prewarm_shift_reports
+from utils.reminders import check_pending_requests_for_reminders, evict_stale_pending_requests
+from utils.fsm_housekeeping import FSMHousekeeper, FSMActivityMiddleware
+from utils.metrics import metrics, HandlerMetricsMiddleware, instrument_scheduler, start_metrics_server
+from utils.tracing import TracedBot, TracingMiddleware, setup_trace_log
+from utils.update_recorder import UpdateRecorderMiddleware
+from utils.charts import CHARTS_AVAILABLE, send_shift_charts
+from utils.workers import shutdown_process_pool
 
 # --- Настройка логирования ---
 logging.basicConfig(
@@ -25,22 +32,33 @@ async def scheduled_shift_report(bot: Bot, storage: DataStorage, shift_type: str
     """
     Формирует и рассылает отчеты о простоях по окончании смены.
     """
-    from utils.reports import get_shift_time_range, generate_admin_shift_summary
+    from utils.reports import get_shift_time_range, get_shift_reports
     logger.info(f"Запуск планового отчета для '{description}'")
     start_dt, end_dt = get_shift_time_range(shift_type)
     if not start_dt or not end_dt:
         logger.error(f"Не удалось определить рамки смены для отчета '{description}'")
         return
 
+    # Отчеты уже подготовлены перед концом смены. Дочитываем строки последних минут, но не дольше таймаута:
+    # при медленной таблице отправляем то, что есть, а чтение продолжается в фоне.
+    try:
+        await asyncio.wait_for(storage.revalidate_downtime_cache(bot), timeout=config.SHIFT_REPORT_REFRESH_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning(f"Кэш не обновился за {config.SHIFT_REPORT_REFRESH_TIMEOUT_SECONDS} с, отчет '{description}' собран по последнему снимку.")
+    reports = await get_shift_reports(start_dt, end_dt, storage)
+
     # Отправка сводки администраторам
     admin_ids = [uid for uid, role in storage.user_roles.items() if storage.is_admin(uid)]
     if admin_ids:
-        summary_text = await generate_admin_shift_summary(start_dt, end_dt, storage)
+        summary_text = reports["summary"]
         for admin_id in admin_ids:
             try:
                 await bot.send_message(int(admin_id), summary_text, parse_mode=types.ParseMode.MARKDOWN)
             except Exception as e:
                 logger.error(f"Ошибка отправки сводки админу {admin_id}: {e}")
+                continue
+            # Картинка загружается один раз, остальным администраторам уходит ее file_id
+            await send_shift_charts(bot, int(admin_id), storage, start_dt, end_dt)
 
     # Отправка уведомления в общий чат
     if config.REPORTS_CHAT_IDS:
@@ -55,6 +73,23 @@ async def scheduled_shift_report(bot: Bot, storage: DataStorage, shift_type: str
                 logger.error(f"Ошибка отправки отчета в чат {chat_id}: {e}")
 
 
+def register_state_gauges(dp: Dispatcher, storage: DataStorage):
+    """Метрики-снимки состояния: снимаются в момент запроса /metrics."""
+    cache = storage.downtime_cache
+    metrics.gauge("downtime_cache_age_seconds", "Возраст снимка кэша простоев",
+                  lambda: (datetime.now() - cache["timestamp"]).total_seconds() if cache["timestamp"] else None)
+    metrics.gauge("downtime_cache_rows", "Строк в кэше простоев",
+                  lambda: len(cache["data_rows"]) if cache["data_rows"] is not None else None)
+    metrics.gauge("downtime_cache_version", "Версия данных кэша простоев", lambda: cache["version"])
+    metrics.gauge("downtime_cache_refresh_interval_seconds", "Текущий интервал обновления кэша",
+                  lambda: storage.refresh_policy.current_interval)
+    metrics.gauge("sheets_quota_usage_ratio", "Доля минутной квоты Google Sheets", storage.refresh_policy.quota_usage)
+    metrics.gauge("pending_requests", "Открытые заявки ответственным группам", lambda: len(storage.pending_requests))
+    metrics.gauge("active_downtimes", "Активные простои (аренды линий)", lambda: len(storage.active_downtimes))
+    metrics.gauge("fsm_records", "Записи в хранилище FSM",
+                  lambda: sum(len(users) for users in dp.storage.data.values()) if hasattr(dp.storage, 'data') else None)
+
+
 # --- Жизненный цикл бота ---
 async def on_startup(dp: Dispatcher):
     """
@@ -67,11 +102,23 @@ async def on_startup(dp: Dispatcher):
     await storage.initialize()
     if not storage.gspread_client:
         logger.critical("Не удалось инициализировать gspread клиент. Бот может работать некорректно.")
+    if storage.journal_replayer.pending_count:
+        asyncio.ensure_future(storage.journal_replayer.drain(bot))
+
+    # Живая доска статуса линий перерисовывается тем же отчетом, что и по кнопке
+    from utils.reports import generate_line_status_report
+    storage.line_board.configure(bot, lambda: generate_line_status_report(storage))
+    if config.CHARTS_ENABLED and not CHARTS_AVAILABLE:
+        logger.warning("matplotlib не установлен: отчеты за смену отправляются без графиков.")
 
     # Настройка и запуск планировщика
     scheduler = AsyncIOScheduler(timezone=config.SCHEDULER_TIMEZONE)
+    instrument_scheduler(scheduler)
     
-    # 1. Отчеты о простоях по сменам (в 08:05 и 20:05)
+    # 1. Отчеты о простоях по сменам (в 08:05 и 20:05), подготовленные за несколько минут до конца смены
+    prewarm_minute = 60 - config.SHIFT_REPORT_PREWARM_MINUTES
+    scheduler.add_job(prewarm_shift_reports, 'cron', hour=7, minute=prewarm_minute, args=[bot, storage])
+    scheduler.add_job(prewarm_shift_reports, 'cron', hour=19, minute=prewarm_minute, args=[bot, storage])
     scheduler.add_job(scheduled_shift_report, 'cron', hour=8, minute=5, args=[bot, storage, 'previous', "Ночная смена"])
     scheduler.add_job(scheduled_shift_report, 'cron', hour=20, minute=5, args=[bot, storage, 'previous', "Дневная смена"])
     
@@ -79,17 +126,30 @@ async def on_startup(dp: Dispatcher):
     scheduler.add_job(scheduled_line_status_report, 'cron', hour=7, minute=55, args=[bot, storage])
     scheduler.add_job(scheduled_line_status_report, 'cron', hour=19, minute=55, args=[bot, storage])
     
+    # 2.1. Еженедельная сводка по надежности линий (понедельник, 08:15)
+    scheduler.add_job(scheduled_weekly_reliability_digest, 'cron', day_of_week='mon', hour=8, minute=15, args=[bot, storage])
+    
     # 3. Проверка "зависших" заявок для напоминаний (каждые 5 минут)
     scheduler.add_job(check_pending_requests_for_reminders, 'interval', minutes=5, args=[bot, storage])
+    scheduler.add_job(evict_stale_pending_requests, 'interval', hours=1, args=[storage])
     
     # 4. Технические задачи
-    scheduler.add_job(storage.refresh_downtime_cache, 'interval', seconds=config.CACHE_REFRESH_INTERVAL_SECONDS, args=[bot])
+    scheduler.add_job(storage.active_downtimes.sweep, 'interval', seconds=config.LINE_LEASE_SWEEP_SECONDS)
+    scheduler.add_job(dp['fsm_housekeeper'].sweep, 'interval', minutes=config.FSM_SWEEP_INTERVAL_MINUTES, args=[dp])
+    # Обновление кэша простоев переназначает себя само с адаптивным интервалом
+    storage.refresh_policy.start(scheduler, lambda: storage.revalidate_downtime_cache(bot))
     scheduler.add_job(storage.initialize, 'interval', hours=6)
+    # Записи журнала, не дошедшие до таблицы (в том числе оставшиеся с прошлого запуска)
+    scheduler.add_job(storage.journal_replayer.drain, 'interval', seconds=config.JOURNAL_REPLAY_INTERVAL_SECONDS, args=[bot])
     
     scheduler.start()
     dp['scheduler'] = scheduler
     logger.info("Планировщик задач запущен.")
 
+    if config.METRICS_ENABLED:
+        register_state_gauges(dp, storage)
+        dp['metrics_runner'] = await start_metrics_server(config.METRICS_HOST, config.METRICS_PORT)
+
 
 async def on_shutdown(dp: Dispatcher):
     """
@@ -100,6 +160,16 @@ async def on_shutdown(dp: Dispatcher):
     if scheduler and scheduler.running:
         scheduler.shutdown()
         logger.info("Планировщик остановлен.")
+
+    metrics_runner = dp.get('metrics_runner')
+    if metrics_runner:
+        await metrics_runner.cleanup()
+
+    update_recorder = dp.get('update_recorder')
+    if update_recorder:
+        update_recorder.close()
+    shutdown_process_pool()
+    dp['storage'].write_journal.close()
         
     await dp.storage.close()
     await dp.storage.wait_closed()
@@ -109,12 +179,11 @@ async def on_shutdown(dp: Dispatcher):
     logger.info("Все ресурсы освобождены.")
 
 
-def main():
+def create_dispatcher(bot: Bot) -> Dispatcher:
     """
-    Главная функция, собирающая и запускающая бота.
+    Собирает диспетчер: хранилища, middleware, фильтры и обработчики.
+    Используется и при запуске бота, и нагрузочным стендом, чтобы они не расходились.
     """
-    # Инициализация основных объектов
-    bot = Bot(token=config.TELEGRAM_BOT_TOKEN)
     storage_fsm = MemoryStorage()
     dp = Dispatcher(bot, storage=storage_fsm)
     
@@ -122,6 +191,23 @@ def main():
     data_storage = DataStorage()
     dp['storage'] = data_storage
     
+    # Учет активности диалогов для сброса брошенных состояний FSM.
+    # Ожидание ответственной группы живет столько же, сколько открытая заявка.
+    fsm_housekeeper = FSMHousekeeper(
+        idle_seconds=config.FSM_IDLE_TIMEOUT_MINUTES * 60,
+        waiting_seconds=config.PENDING_REQUEST_MAX_AGE_HOURS * 3600,
+    )
+    dp['fsm_housekeeper'] = fsm_housekeeper
+    dp.middleware.setup(FSMActivityMiddleware(fsm_housekeeper))
+    if config.METRICS_ENABLED:
+        dp.middleware.setup(HandlerMetricsMiddleware())
+    if config.TRACING_ENABLED:
+        setup_trace_log(config.TRACE_LOG_PATH, config.TRACE_LOG_MAX_BYTES, config.TRACE_LOG_BACKUP_COUNT)
+        dp.middleware.setup(TracingMiddleware(config.TRACE_SLOW_THRESHOLD_MS / 1000))
+    if config.UPDATE_RECORDING_ENABLED:
+        dp['update_recorder'] = UpdateRecorderMiddleware(config.UPDATE_RECORDING_DIR, data_storage)
+        dp.middleware.setup(dp['update_recorder'])
+    
     # Регистрация фильтров
     dp.filters_factory.bind(AdminFilter)
     
@@ -134,6 +220,17 @@ def main():
     admin_handlers.register_admin_handlers(dp)
     downtime_handlers.register_downtime_handlers(dp)
     other_handlers.register_other_handlers(dp)
+    return dp
+
+
+def main():
+    """
+    Главная функция, собирающая и запускающая бота.
+    """
+    # При включенной трассировке вызовы Bot API записываются как участки трассы апдейта
+    bot_class = TracedBot if config.TRACING_ENABLED else Bot
+    bot = bot_class(token=config.TELEGRAM_BOT_TOKEN)
+    dp = create_dispatcher(bot)
     
     # Запуск
     executor.start_polling(
@@ -0,0 +1,211 @@
+# utils/metrics.py
+import bisect
+import logging
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> LabelValues:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def _format_labels(labels: LabelValues, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_format_labels(key)} {value}" for key, value in self.values.items())
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # labels -> [счетчики по корзинам..., сумма, количество]
+        self.values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """Значение снимается в момент запроса метрик через функцию обратного вызова."""
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], Optional[float]]):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def render(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception as e:
+            logging.warning(f"[METRICS] Не удалось получить значение {self.name}: {e}")
+            value = None
+        if value is None:
+            return []
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], Optional[float]]) -> Gauge:
+        self.metrics[name] = Gauge(name, help_text, read)
+        return self.metrics[name]
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Общий реестр процесса: модули регистрируют свои метрики при импорте
+metrics = MetricsRegistry()
+
+HANDLER_LATENCY = metrics.histogram("bot_handler_duration_seconds", "Время выполнения обработчиков aiogram")
+HANDLER_ERRORS = metrics.counter("bot_handler_errors_total", "Исключения в обработчиках aiogram")
+SHEETS_LATENCY = metrics.histogram("sheets_request_duration_seconds", "Время запросов к Google Sheets по операциям")
+SHEETS_ERRORS = metrics.counter("sheets_request_errors_total", "Ошибки запросов к Google Sheets по операциям")
+JOB_LATENCY = metrics.histogram("scheduler_job_duration_seconds", "Время выполнения задач APScheduler")
+JOB_ERRORS = metrics.counter("scheduler_job_errors_total", "Задачи APScheduler, завершившиеся ошибкой")
+
+
+def handler_name(handler) -> str:
+    """Имя обработчика для метки. Лямбды различаем по строке, где они объявлены."""
+    name = getattr(handler, "__qualname__", None) or repr(handler)
+    if name.endswith("<lambda>") and hasattr(handler, "__code__"):
+        name = f"{name}:{handler.__code__.co_firstlineno}"
+    return f"{getattr(handler, '__module__', '')}.{name}"
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Замеряет время каждого обработчика сообщений и нажатий кнопок.
+    Обработчик известен только после проверки фильтров, поэтому отсчет начинается в on_process_*.
+    """
+
+    async def _start(self, data: dict, update_type: str):
+        data["_metrics_started"] = time.perf_counter()
+        data["_metrics_handler"] = handler_name(current_handler.get())
+        data["_metrics_update_type"] = update_type
+
+    async def _finish(self, results: list, data: dict):
+        started = data.get("_metrics_started")
+        if started is None:
+            return
+        labels = {"handler": data["_metrics_handler"], "update_type": data["_metrics_update_type"]}
+        HANDLER_LATENCY.observe(time.perf_counter() - started, **labels)
+        # post_process вызывается из finally: если обработчик упал, исключение видно через exc_info
+        if sys.exc_info()[0] is not None:
+            HANDLER_ERRORS.inc(**labels)
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        await self._start(data, "message")
+
+    async def on_post_process_message(self, message: types.Message, results: list, data: dict):
+        await self._finish(results, data)
+
+    async def on_process_callback_query(self, cb: types.CallbackQuery, data: dict):
+        await self._start(data, "callback_query")
+
+    async def on_post_process_callback_query(self, cb: types.CallbackQuery, results: list, data: dict):
+        await self._finish(results, data)
+
+
+def instrument_scheduler(scheduler):
+    """Замеряет длительность задач планировщика по событиям отправки и завершения."""
+    started: Dict[Tuple[str, object], Tuple[float, str]] = {}
+
+    def on_submitted(event):
+        job = scheduler.get_job(event.job_id)
+        name = job.name if job else event.job_id
+        for run_time in event.scheduled_run_times:
+            started[(event.job_id, run_time)] = (time.perf_counter(), name)
+
+    def on_finished(event):
+        entry = started.pop((event.job_id, event.scheduled_run_time), None)
+        if not entry:
+            return
+        began, name = entry
+        JOB_LATENCY.observe(time.perf_counter() - began, job=name)
+        if event.code == EVENT_JOB_ERROR:
+            JOB_ERRORS.inc(job=name)
+
+    scheduler.add_listener(on_submitted, EVENT_JOB_SUBMITTED)
+    scheduler.add_listener(on_finished, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Поднимает HTTP-эндпоинт /metrics в формате Prometheus."""
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(body=metrics.render().encode("utf-8"),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"[METRICS] Эндпоинт метрик доступен на http://{host}:{port}/metrics")
+    return runner
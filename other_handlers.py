@@ -1,7 +1,6 @@
 # handlers/other_handlers.py
 import logging
 from datetime import datetime
-import json
 from aiogram import Dispatcher, types, Bot
 from aiogram.dispatcher import FSMContext
 from utils.storage import DataStorage
@@ -9,6 +8,8 @@ from config import EMPLOYEE_ROLE, BOT_VERSION
 from keyboards.reply import get_main_keyboard
 from keyboards.inline import get_end_downtime_keyboard, get_group_work_completion_keyboard
 from fsm import DowntimeForm
+from handlers.downtime_handlers import release_line_lease
+from utils.callback_guard import DUPLICATE_ANSWER
 
 async def send_welcome(message: types.Message, state: FSMContext):
     dp = Dispatcher.get_current()
@@ -33,6 +34,8 @@ async def cancel_handler(cb: types.CallbackQuery, state: FSMContext):
     if current_state is None:
         await cb.answer("Нет активных действий для отмены.")
         return
+    dp = Dispatcher.get_current()
+    await release_line_lease(dp['storage'], state, cb.from_user.id)
     await state.finish()
     await cb.message.edit_text("Ввод отменен.")
     await cb.answer()
@@ -43,18 +46,34 @@ async def handle_accept_downtime(cb: types.CallbackQuery):
     bot = cb.bot
     request_id = cb.data.split("accept_dt_", 1)[1]
     user = cb.from_user
-    
-    request = storage.pending_requests.get(request_id)
-    if not request:
-        await cb.answer("Эта заявка уже обработана или недействительна.", show_alert=True)
+    if not storage.callback_guard.claim(cb, "accept"):
+        await cb.answer(DUPLICATE_ANSWER)
         return
 
-    request['status'] = 'work_in_progress'
-    request['accepted_by_user_id'] = user.id
-    request['accepted_by_user_name'] = user.full_name
-    request['acceptance_time_iso'] = datetime.now().isoformat()
+    # Проверка статуса и переход под замком заявки: принять ее может только один участник группы
+    try:
+        async with storage.callback_guard.transition(request_id):
+            request = storage.pending_requests.get(request_id)
+            if not request:
+                await cb.answer("Эта заявка уже обработана или недействительна.", show_alert=True)
+                return
+            if request.status != 'pending_acceptance':
+                await cb.answer(f"Заявка уже принята: {request.accepted_by_user_name or 'Н/Д'}.")
+                return
+            request.status = 'work_in_progress'
+            request.accepted_by_user_id = user.id
+            request.accepted_by_user_name = user.full_name
+            request.acceptance_time = datetime.now()
+    except Exception:
+        # Переход не состоялся: повторное нажатие той же кнопки должно обработаться
+        storage.callback_guard.forget(cb)
+        raise
+    storage.active_downtimes.renew(request.line_key, request.initiating_user_id)
+    storage.response_stats.record_accept(
+        request.responsible_group_name, (request.acceptance_time - request.created_at).total_seconds()
+    )
     
-    updated_text = request['group_notification_text'] + f"\n\n✅ **Принята в работу:** {user.full_name}"
+    updated_text = request.notification_text() + f"\n\n✅ **Принята в работу:** {user.full_name}"
 
     try:
         # <<<< НАЧАЛО ИСПРАВЛЕННОГО БЛОКА >>>>
@@ -62,31 +81,31 @@ async def handle_accept_downtime(cb: types.CallbackQuery):
         if cb.message.photo:
             await bot.edit_message_caption(
                 caption=updated_text,
-                chat_id=request["responsible_group_id"],
-                message_id=request["group_notification_message_id"],
+                chat_id=request.responsible_group_id,
+                message_id=request.group_notification_message_id,
                 parse_mode='Markdown',
                 reply_markup=get_group_work_completion_keyboard(request_id)
             )
         else:
             await bot.edit_message_text(
                 text=updated_text,
-                chat_id=request["responsible_group_id"],
-                message_id=request["group_notification_message_id"],
+                chat_id=request.responsible_group_id,
+                message_id=request.group_notification_message_id,
                 parse_mode='Markdown',
                 reply_markup=get_group_work_completion_keyboard(request_id)
             )
         # <<<< КОНЕЦ ИСПРАВЛЕННОГО БЛОКА >>>>
     except Exception as e:
-        logging.error(f"Ошибка обновления сообщения в группе {request['responsible_group_id']}: {e}")
+        logging.error(f"Ошибка обновления сообщения в группе {request.responsible_group_id}: {e}")
     
-    initiator_chat_id = request["initiating_user_chat_id"]
+    initiator_chat_id = request.initiating_user_chat_id
     try:
         await bot.send_message(
             initiator_chat_id,
-            f"✅ Ваша заявка принята группой '{request['responsible_group_name']}'.\nПринял(а): {user.full_name}."
+            f"✅ Ваша заявка принята группой '{request.responsible_group_name}'.\nПринял(а): {user.full_name}."
         )
     except Exception as e:
-        logging.error(f"Не удалось уведомить инициатора {request['initiating_user_id']}: {e}")
+        logging.error(f"Не удалось уведомить инициатора {request.initiating_user_id}: {e}")
 
     await cb.answer("Заявка принята!")
 
@@ -96,36 +115,49 @@ async def handle_group_work_complete(cb: types.CallbackQuery):
     bot = cb.bot
     request_id = cb.data.split("gw_simple_", 1)[1]
     user = cb.from_user
-
-    request = storage.pending_requests.get(request_id)
-    if not request:
-        await cb.answer("Эта заявка уже обработана или недействительна.", show_alert=True)
+    if not storage.callback_guard.claim(cb, "group_complete"):
+        await cb.answer(DUPLICATE_ANSWER)
         return
-        
-    request['status'] = 'pending_initiator_closure'
-    request['group_completion_time'] = datetime.now().isoformat()
+
+    try:
+        async with storage.callback_guard.transition(request_id):
+            request = storage.pending_requests.get(request_id)
+            if not request:
+                await cb.answer("Эта заявка уже обработана или недействительна.", show_alert=True)
+                return
+            if request.status == 'pending_initiator_closure':
+                await cb.answer("Работа по заявке уже завершена.")
+                return
+            request.status = 'pending_initiator_closure'
+            request.group_completion_time = datetime.now()
+    except Exception:
+        storage.callback_guard.forget(cb)
+        raise
+    storage.active_downtimes.renew(request.line_key, request.initiating_user_id)
+    storage.response_stats.record_complete(
+        request.responsible_group_name, (request.group_completion_time - request.created_at).total_seconds()
+    )
     
-    initiator_id = request['initiating_user_id']
-    initiator_chat_id = request['initiating_user_chat_id']
+    initiator_id = request.initiating_user_id
+    initiator_chat_id = request.initiating_user_chat_id
     fsm_context = FSMContext(storage=dp.storage, chat=initiator_chat_id, user=initiator_id)
     
     try:
-        fsm_data = json.loads(request["downtime_fsm_data_json"])
-        await fsm_context.set_data(fsm_data)
+        await fsm_context.set_data(request.fsm_data())
         
         async with fsm_context.proxy() as data:
-            data['request_id'] = request.get('request_id')
-            data['accepted_by_user_id'] = request.get('accepted_by_user_id')
-            data['accepted_by_user_name'] = request.get('accepted_by_user_name')
-            data['acceptance_time'] = datetime.fromisoformat(request['acceptance_time_iso']).strftime("%Y-%m-%d %H:%M:%S")
+            data['request_id'] = request.request_id
+            data['accepted_by_user_id'] = request.accepted_by_user_id
+            data['accepted_by_user_name'] = request.accepted_by_user_name
+            data['acceptance_time'] = request.acceptance_time.strftime("%Y-%m-%d %H:%M:%S") if request.acceptance_time else ''
             data['group_completed_by_id'] = user.id
             data['group_completed_by_name'] = user.full_name
-            data['group_completion_time'] = datetime.fromisoformat(request['group_completion_time']).strftime("%Y-%m-%d %H:%M:%S")
+            data['group_completion_time'] = request.group_completion_time.strftime("%Y-%m-%d %H:%M:%S")
 
         await fsm_context.set_state(DowntimeForm.waiting_for_downtime_end)
-        await bot.send_message(initiator_chat_id, f"✅ Работы по вашей заявке со стороны группы '{request['responsible_group_name']}' завершены.", reply_markup=get_end_downtime_keyboard())
+        await bot.send_message(initiator_chat_id, f"✅ Работы по вашей заявке со стороны группы '{request.responsible_group_name}' завершены.", reply_markup=get_end_downtime_keyboard())
         
-        final_text = request['group_notification_text'] + f"\n\n✅ **Принята:** {request.get('accepted_by_user_name', 'Н/Д')}" + f"\n🏁 **Работа завершена:** {user.full_name}"
+        final_text = request.notification_text() + f"\n\n✅ **Принята:** {request.accepted_by_user_name or 'Н/Д'}" + f"\n🏁 **Работа завершена:** {user.full_name}"
         
         # <<<< НАЧАЛО ИСПРАВЛЕННОГО БЛОКА >>>>
         if cb.message.photo:
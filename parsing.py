@@ -0,0 +1,63 @@
+# utils/parsing.py
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+# Форматы дат, которые встречаются в столбце "Timestamp_записи"
+SHEET_DATETIME_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%d.%m.%Y %H:%M:%S",
+    "%Y/%m/%d %H:%M:%S",
+]
+
+# Комментарий записи, внесенной администратором задним числом: "Запись внесена вручную 05.06 08:10 - 05.06 09:40"
+MANUAL_ENTRY_PREFIX = "Запись внесена вручную"
+_MANUAL_ENTRY_SPAN = re.compile(
+    re.escape(MANUAL_ENTRY_PREFIX) + r" (\d{2})\.(\d{2}) (\d{2}):(\d{2}) - (\d{2})\.(\d{2}) (\d{2}):(\d{2})")
+
+def parse_sheet_datetime(dt_string: str, log_failures: bool = True) -> datetime | None:
+    """Пытается распарсить строку с датой из таблицы, пробуя несколько форматов."""
+    for fmt in SHEET_DATETIME_FORMATS:
+        try:
+            return datetime.strptime(dt_string, fmt)
+        except ValueError:
+            continue
+    if log_failures:
+        logging.warning(f"Не удалось распознать формат даты-времени: '{dt_string}'")
+    return None
+
+def unchanged_row_count(old_rows: list, new_rows: list) -> int:
+    """
+    Сколько первых строк нового снимка листа совпадает со старым. Если строки только дописаны в конец,
+    результат равен len(old_rows); меньшее значение означает правку или удаление уже прочитанных строк.
+    """
+    n = min(len(old_rows), len(new_rows))
+    # Сравнение блоками: одно сравнение всего листа держало бы GIL, останавливая event loop на время вызова в потоке
+    for start in range(0, n, 1000):
+        end = min(start + 1000, n)
+        if old_rows[start:end] != new_rows[start:end]:
+            for i in range(start, end):
+                if old_rows[i] != new_rows[i]:
+                    return i
+    return n
+
+def parse_manual_entry_span(comment: str, recorded_at: datetime) -> Optional[Tuple[datetime, datetime]]:
+    """
+    Начало и конец простоя из комментария ручной записи. В комментарии нет года: он берется из времени
+    записи в таблицу (простой не может начаться позже, чем его внесли). None - комментарий другой.
+    """
+    match = _MANUAL_ENTRY_SPAN.match(comment or "")
+    if not match:
+        return None
+    day, month, hour, minute, end_day, end_month, end_hour, end_minute = map(int, match.groups())
+    try:
+        start = datetime(recorded_at.year, month, day, hour, minute)
+        if start > recorded_at + timedelta(days=1):
+            start = start.replace(year=start.year - 1)
+        end = datetime(start.year, end_month, end_day, end_hour, end_minute)
+        if end < start:
+            end = end.replace(year=end.year + 1)
+    except ValueError:
+        return None
+    return start, end
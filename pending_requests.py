@@ -0,0 +1,91 @@
+# utils/pending_requests.py
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+audit_logger = logging.getLogger("audit")
+
+
+class PendingRequest:
+    """
+    Открытая заявка, отправленная ответственной группе.
+    Хранит структурированные поля один раз; текст уведомления и данные FSM инициатора
+    собираются по требованию, а не хранятся копиями.
+    """
+    __slots__ = (
+        "request_id", "created_at", "status", "reminders_sent_group", "reminders_sent_initiator",
+        "initiating_user_id", "initiating_user_chat_id", "initiating_user_name",
+        "responsible_group_name", "responsible_group_id", "group_notification_message_id",
+        "site_key", "site_name", "ls_key", "ls_name", "reason_key", "reason_name",
+        "description", "photo_file_id", "downtime_start_time",
+        "accepted_by_user_id", "accepted_by_user_name", "acceptance_time", "group_completion_time",
+    )
+
+    def __init__(self, request_id: str, initiating_user_id: int, initiating_user_chat_id: int,
+                 initiating_user_name: str, responsible_group_name: str, responsible_group_id: int,
+                 fsm_data: dict):
+        self.request_id = request_id
+        self.created_at = datetime.now()
+        self.status = "pending_acceptance"
+        self.reminders_sent_group = 0
+        self.reminders_sent_initiator = 0
+        self.initiating_user_id = initiating_user_id
+        self.initiating_user_chat_id = initiating_user_chat_id
+        self.initiating_user_name = initiating_user_name
+        self.responsible_group_name = responsible_group_name
+        self.responsible_group_id = responsible_group_id
+        self.group_notification_message_id: Optional[int] = None
+        self.site_key = fsm_data.get('site_key')
+        self.site_name = fsm_data.get('site_name', '')
+        self.ls_key = fsm_data.get('ls_key')
+        self.ls_name = fsm_data.get('ls_name', '')
+        self.reason_key = fsm_data.get('reason_key')
+        self.reason_name = fsm_data.get('reason_name', '')
+        self.description = fsm_data.get('description', '')
+        self.photo_file_id = fsm_data.get('photo_file_id', '')
+        start_time = fsm_data.get('downtime_start_time')
+        self.downtime_start_time: Optional[datetime] = datetime.fromisoformat(start_time) if isinstance(start_time, str) else start_time
+        self.accepted_by_user_id: Optional[int] = None
+        self.accepted_by_user_name: Optional[str] = None
+        self.acceptance_time: Optional[datetime] = None
+        self.group_completion_time: Optional[datetime] = None
+
+    @property
+    def line_key(self) -> tuple:
+        return self.site_name, self.ls_name
+
+    def notification_text(self) -> str:
+        """Текст уведомления группе о новом простое."""
+        start_time_str = self.downtime_start_time.strftime('%H:%M:%S %d.%m.%Y') if self.downtime_start_time else "Неизвестно"
+        return (f"🔔 **Новый простой (ID: {self.request_id})**\n\n"
+                f"Площадка: {self.site_name or 'Н/Д'}\n"
+                f"Линия/Секция: {self.ls_name or 'Н/Д'}\n"
+                f"Направление: {self.reason_name or 'Н/Д'}\n"
+                f"Описание: {self.description or 'Н/Д'}\n"
+                f"Начало: {start_time_str}\n"
+                f"Заявитель: {self.initiating_user_name}")
+
+    def fsm_data(self) -> dict:
+        """Восстанавливает данные FSM инициатора для шага завершения простоя."""
+        return {
+            'site_key': self.site_key, 'site_name': self.site_name,
+            'ls_key': self.ls_key, 'ls_name': self.ls_name,
+            'reason_key': self.reason_key, 'reason_name': self.reason_name,
+            'description': self.description, 'photo_file_id': self.photo_file_id,
+            'downtime_start_time': self.downtime_start_time.isoformat() if self.downtime_start_time else None,
+            'responsible_group_name': self.responsible_group_name,
+        }
+
+
+def evict_expired_requests(pending_requests: Dict[str, PendingRequest], max_age: timedelta) -> List[PendingRequest]:
+    """Удаляет заявки старше max_age и пишет о каждой запись в журнал аудита."""
+    threshold = datetime.now() - max_age
+    expired = [request for request in pending_requests.values() if request.created_at < threshold]
+    for request in expired:
+        del pending_requests[request.request_id]
+        audit_logger.warning(
+            f"[AUDIT] Заявка {request.request_id} удалена по сроку: создана {request.created_at:%Y-%m-%d %H:%M:%S}, "
+            f"статус '{request.status}', {request.site_name}/{request.ls_name}, группа '{request.responsible_group_name}', "
+            f"инициатор {request.initiating_user_id}, принял {request.accepted_by_user_name or '—'}."
+        )
+    return expired
@@ -0,0 +1,253 @@
+# utils/period_reports.py
+import logging
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram.utils.markdown import escape_md
+from pytz import timezone
+
+from config import TOP_N_REASONS_FOR_SUMMARY, PRODUCTION_SITES, PRODUCTION_SITE_EMOJIS, SCHEDULER_TIMEZONE
+from utils.parsing import parse_sheet_datetime, unchanged_row_count
+
+SHIFT_LENGTH = timedelta(hours=12)
+SHIFT_DAY_START = time(8, 0)
+
+# Пресеты периодов: ключ -> подпись для кнопок и заголовка отчета
+PERIOD_PRESETS = {
+    "today": "Текущие сутки",
+    "yesterday": "Прошлые сутки",
+    "week": "Текущая неделя",
+    "last_week": "Прошлая неделя",
+    "month": "Текущий месяц",
+    "last_month": "Прошлый месяц",
+}
+
+SITE_NAME_TO_KEY = {v.lower(): k for k, v in PRODUCTION_SITES.items()}
+
+
+def shift_start_for(dt: datetime) -> datetime:
+    """Возвращает начало 12-часовой смены (08:00 или 20:00), в которую попадает наивное локальное время."""
+    if SHIFT_DAY_START <= dt.time() < time(20, 0):
+        return dt.replace(hour=8, minute=0, second=0, microsecond=0)
+    if dt.time() >= time(20, 0):
+        return dt.replace(hour=20, minute=0, second=0, microsecond=0)
+    return (dt - timedelta(days=1)).replace(hour=20, minute=0, second=0, microsecond=0)
+
+
+def _production_day_start(dt: datetime) -> datetime:
+    """Производственные сутки начинаются в 08:00 (дневная + ночная смена)."""
+    start = dt.replace(hour=8, minute=0, second=0, microsecond=0)
+    return start if dt >= start else start - timedelta(days=1)
+
+
+def get_period_time_range(preset: str, now: Optional[datetime] = None) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    Возвращает наивные локальные границы периода [start, end) для пресета.
+    Все границы выровнены по началу смены, чтобы период состоял из целых смен.
+    """
+    # Время листа и границы смен - в часовом поясе планировщика, а не сервера
+    now = now or datetime.now(timezone(SCHEDULER_TIMEZONE)).replace(tzinfo=None)
+    day_start = _production_day_start(now)
+    week_start = day_start - timedelta(days=day_start.weekday())
+    month_start = day_start.replace(day=1)
+
+    if preset == "today":
+        return day_start, day_start + timedelta(days=1)
+    if preset == "yesterday":
+        return day_start - timedelta(days=1), day_start
+    if preset == "week":
+        return week_start, week_start + timedelta(days=7)
+    if preset == "last_week":
+        return week_start - timedelta(days=7), week_start
+    if preset == "month":
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        return month_start, next_month
+    if preset == "last_month":
+        prev_month = (month_start - timedelta(days=1)).replace(day=1)
+        return prev_month, month_start
+    return None, None
+
+
+def parse_period_args(args: str) -> Tuple[datetime, datetime]:
+    """
+    Разбирает произвольный период: `ДД.ММ.ГГГГ [ДД.ММ.ГГГГ]` или `ДД.ММ.ГГГГ ЧЧ:ММ - ДД.ММ.ГГГГ ЧЧ:ММ`.
+    Даты без времени означают производственные сутки с 08:00. Бросает ValueError.
+    """
+    parts = []
+    for token in args.replace(" - ", " ").split():
+        # Время "ЧЧ:ММ" относится к предыдущей дате
+        if ":" in token and parts:
+            parts[-1] = f"{parts[-1]} {token}"
+        else:
+            parts.append(token)
+    parsed = []
+    for part in parts:
+        for fmt, is_date in (("%d.%m.%Y %H:%M", False), ("%d.%m.%Y", True)):
+            try:
+                parsed.append((datetime.strptime(part, fmt), is_date))
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"Неверная дата '{part}'. Формат: ДД.ММ.ГГГГ или ДД.ММ.ГГГГ ЧЧ:ММ.")
+    if not parsed or len(parsed) > 2:
+        raise ValueError("Укажите одну или две даты.")
+
+    start, start_is_date = parsed[0]
+    end, end_is_date = parsed[-1]
+    if start_is_date:
+        start = start.replace(hour=8)
+    if end_is_date:
+        end = end.replace(hour=8) + timedelta(days=1)
+    if end <= start:
+        raise ValueError("Конец периода должен быть позже начала.")
+    return start, end
+
+
+def resolve_period_args(args: str, default_preset: str) -> Tuple[datetime, datetime, str]:
+    """Аргумент команды - ключ пресета, явные даты или пусто (пресет по умолчанию). Бросает ValueError."""
+    args = (args or "").strip() or default_preset
+    if args in PERIOD_PRESETS:
+        start, end = get_period_time_range(args)
+        return start, end, PERIOD_PRESETS[args]
+    start, end = parse_period_args(args)
+    return start, end, "Произвольный период"
+
+
+class ShiftRollups:
+    """
+    Агрегаты по каждой смене (минуты, записи, разбивка по площадкам и направлениям).
+    Обновляются инкрементально при поступлении новых строк, как и индекс простоев.
+    Хранятся только суммы: строки смен на краях периода берутся из индекса простоев.
+    """
+
+    def __init__(self):
+        self.headers: Optional[List[str]] = None
+        self.shifts: Dict[datetime, dict] = {}
+        self._indexed = 0
+        self._rows: List[List[str]] = []
+        self._idx: Dict[str, int] = {}
+
+    def sync(self, headers: List[str], data_rows: List[List[str]], unchanged_rows: Optional[int] = None):
+        if unchanged_rows is None:
+            unchanged_rows = unchanged_row_count(self._rows, data_rows)
+        # Правка или удаление уже учтенной строки меняет агрегаты: пересчитываем с нуля
+        rebuild = headers != self.headers or unchanged_rows < self._indexed
+        if rebuild:
+            try:
+                self._idx = {col: headers.index(col) for col in
+                             ("Timestamp_записи", "Площадка", "Направление_простоя", "Время_простоя_минут")}
+            except ValueError as e:
+                logging.error(f"[ROLLUPS] Отсутствует необходимый столбец в таблице: {e}")
+                return
+            self.headers = list(headers)
+            self.shifts = {}
+            self._indexed = 0
+        for row in data_rows[self._indexed:]:
+            record = self._parse(row)
+            if record:
+                shift = shift_start_for(record[0])
+                if shift not in self.shifts:
+                    self.shifts[shift] = _empty_totals()
+                _add(self.shifts[shift], *record[1:])
+        self._indexed = len(data_rows)
+        self._rows = data_rows
+
+    def _parse(self, row: List[str]) -> Optional[Tuple[datetime, str, str, int]]:
+        try:
+            if len(row) <= max(self._idx.values()) or not row[self._idx["Timestamp_записи"]]:
+                return None
+            record_dt = parse_sheet_datetime(row[self._idx["Timestamp_записи"]], log_failures=False)
+            if not record_dt:
+                return None
+            duration = int(row[self._idx["Время_простоя_минут"]] or 0)
+        except ValueError:
+            return None
+        return record_dt, row[self._idx["Площадка"]], row[self._idx["Направление_простоя"]] or "Не указана", duration
+
+    def aggregate(self, start: datetime, end: datetime,
+                  rows_between: Callable[[datetime, datetime], Iterable[List[str]]]) -> dict:
+        """
+        Суммирует период [start, end): целые смены берутся из готовых агрегатов, а для смен на краях
+        периода строки отбираются rows_between(начало, конец) - временным индексом простоев.
+        """
+        total = _empty_totals()
+        shift = shift_start_for(start)
+        while shift < end:
+            data = self.shifts.get(shift)
+            if data:
+                if shift >= start and shift + SHIFT_LENGTH <= end:
+                    total["count"] += data["count"]
+                    total["minutes"] += data["minutes"]
+                    total["reasons"].update(data["reasons"])
+                    total["sites"].update(data["sites"])
+                    total["site_counts"].update(data["site_counts"])
+                else:
+                    for row in rows_between(max(shift, start), min(shift + SHIFT_LENGTH, end)):
+                        record = self._parse(row)
+                        if record:
+                            _add(total, *record[1:])
+            shift += SHIFT_LENGTH
+        return total
+
+
+def _empty_totals() -> dict:
+    return {"count": 0, "minutes": 0, "reasons": Counter(), "sites": Counter(), "site_counts": Counter()}
+
+
+def _add(totals: dict, site: str, reason: str, duration: int):
+    totals["count"] += 1
+    totals["minutes"] += duration
+    totals["reasons"][reason] += duration
+    totals["sites"][site] += duration
+    totals["site_counts"][site] += 1
+
+
+class RenderedReportCache:
+    """LRU-кэш готовых текстов отчетов. Ключ включает версию данных, поэтому новые строки его инвалидируют."""
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[tuple, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[str]:
+        if key in self._items:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple, value: str):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+
+def render_period_report(title: str, start: datetime, end: datetime, totals: dict) -> str:
+    """Формирует Markdown-отчет за произвольный период по агрегатам смен."""
+    period_str = f"с {start.strftime('%d.%m.%Y %H:%M')} по {end.strftime('%d.%m.%Y %H:%M')}"
+    if totals["count"] == 0:
+        return f"✅ **{escape_md(title)}**\nНет записей о простоях за период {period_str}."
+
+    hours, minutes = divmod(totals["minutes"], 60)
+    lines = [
+        f"✅ **{escape_md(title)}**",
+        f"Период: {period_str}",
+        f"Всего записей: {totals['count']}",
+        f"Общий простой: **{hours} ч {minutes} мин.**",
+        "",
+        "**По площадкам:**",
+    ]
+    for site_name, site_minutes in totals["sites"].most_common():
+        emoji = PRODUCTION_SITE_EMOJIS.get(SITE_NAME_TO_KEY.get(site_name.strip().lower()), '⚪️')
+        lines.append(f"{emoji} {escape_md(site_name)}: {site_minutes} мин. ({totals['site_counts'][site_name]} зап.)")
+
+    top_reasons = totals["reasons"].most_common(TOP_N_REASONS_FOR_SUMMARY)
+    lines.append(f"\n**Топ-{len(top_reasons)} причины:**")
+    lines.extend(f"- {escape_md(r)} ({m} мин.)" for r, m in top_reasons)
+    return "\n".join(lines)
@@ -0,0 +1,77 @@
+# utils/refresh_policy.py
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+JOB_ID = "adaptive_cache_refresh"
+
+
+class AdaptiveRefreshPolicy:
+    """
+    Интервал фонового обновления кэша простоев.
+    После записей и запросов отчетов кэш обновляется часто; в тишине интервал удваивается,
+    при нехватке квоты Google Sheets растет еще быстрее. Верхняя граница — max_interval.
+    Задача планировщика переназначает сама себя, поэтому новый интервал действует сразу.
+    """
+
+    def __init__(self, initial_interval: float, min_interval: float, max_interval: float, active_window: float,
+                 quota_usage: Callable[[], float], quota_high_watermark: float = 0.8):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.active_window = active_window
+        self.quota_usage = quota_usage
+        self.quota_high_watermark = quota_high_watermark
+        self.current_interval = min(max(initial_interval, min_interval), max_interval)
+        self.last_activity = 0.0
+        self.scheduler: Optional[AsyncIOScheduler] = None
+        self._refresh: Optional[Callable[[], Awaitable[None]]] = None
+
+    def start(self, scheduler: AsyncIOScheduler, refresh: Callable[[], Awaitable[None]]):
+        self.scheduler = scheduler
+        self._refresh = refresh
+        self._schedule(self.current_interval)
+
+    def _schedule(self, seconds: float):
+        self.scheduler.add_job(self._run, 'date', run_date=datetime.now(self.scheduler.timezone) + timedelta(seconds=seconds),
+                               id=JOB_ID, replace_existing=True)
+
+    def next_interval(self) -> float:
+        if time.time() - self.last_activity < self.active_window:
+            interval = self.min_interval
+        else:
+            interval = self.current_interval * 2
+        if self.quota_usage() >= self.quota_high_watermark:
+            interval = max(interval, self.current_interval) * 2
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    async def _run(self):
+        try:
+            await self._refresh()
+        finally:
+            new_interval = self.next_interval()
+            if new_interval != self.current_interval:
+                logging.info(f"[CACHE] Интервал обновления кэша: {self.current_interval:.0f} -> {new_interval:.0f} с.")
+            self.current_interval = new_interval
+            self._schedule(new_interval)
+
+    def _note_activity(self):
+        self.last_activity = time.time()
+        if self.current_interval <= self.min_interval or not self.scheduler:
+            return
+        # Был период тишины: переносим уже назначенное обновление ближе
+        self.current_interval = self.min_interval
+        job = self.scheduler.get_job(JOB_ID)
+        soon = datetime.now(self.scheduler.timezone) + timedelta(seconds=self.min_interval)
+        if job and job.next_run_time and job.next_run_time > soon:
+            job.modify(next_run_time=soon)
+
+    def note_write(self):
+        """Локальная запись в таблицу: в ближайшее время данные будут меняться."""
+        self._note_activity()
+
+    def note_report_request(self):
+        """Запрос отчета: пользователям нужны свежие данные."""
+        self._note_activity()
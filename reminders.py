@@ -6,7 +6,9 @@ from aiogram import Bot
 from aiogram.utils.markdown import escape_md
 
 from utils.storage import DataStorage
+from utils.pending_requests import evict_expired_requests
 from keyboards.inline import get_end_downtime_keyboard
+from config import PENDING_REQUEST_MAX_AGE_HOURS
 
 # --- Константы для напоминаний ---
 GROUP_REMINDER_DELAY_MINUTES = 30  # Через сколько минут напомнить группе о непринятой заявке
@@ -25,21 +27,20 @@ async def check_pending_requests_for_reminders(bot: Bot, storage: DataStorage):
     reminders_sent_count = 0
 
     for request_id in request_ids:
-        request_data = storage.pending_requests.get(request_id)
-        if not request_data:
+        request = storage.pending_requests.get(request_id)
+        if not request:
             continue
 
-        status = request_data.get("status")
+        status = request.status
         
         try:
             # --- 1. Напоминание для группы о НЕПРИНЯТОЙ заявке ---
             if status == "pending_acceptance":
-                creation_time = datetime.fromisoformat(request_data.get("creation_time", now.isoformat()))
-                age = now - creation_time
+                age = now - request.created_at
                 
-                if age > timedelta(minutes=GROUP_REMINDER_DELAY_MINUTES) and request_data.get("reminders_sent_group", 0) == 0:
-                    group_id = request_data["responsible_group_id"]
-                    original_msg_id = request_data["group_notification_message_id"]
+                if age > timedelta(minutes=GROUP_REMINDER_DELAY_MINUTES) and request.reminders_sent_group == 0:
+                    group_id = request.responsible_group_id
+                    original_msg_id = request.group_notification_message_id
                     reminder_text = "⚠️ **Напоминание:** Эта заявка не принята в работу уже более 30 минут!"
                     
                     await bot.send_message(
@@ -48,23 +49,21 @@ async def check_pending_requests_for_reminders(bot: Bot, storage: DataStorage):
                         reply_to_message_id=original_msg_id,
                         parse_mode="Markdown"
                     )
-                    request_data["reminders_sent_group"] = 1
+                    request.reminders_sent_group = 1
                     reminders_sent_count += 1
                     logging.info(f"[REMINDER] Отправлено напоминание группе {group_id} по заявке {request_id}")
 
             # --- 2. Напоминание для инициатора о НЕЗАКРЫТОЙ заявке ---
             elif status == "pending_initiator_closure":
-                group_completion_time_iso = request_data.get("group_completion_time")
-                if not group_completion_time_iso: continue
+                if not request.group_completion_time: continue
                 
-                group_completion_time = datetime.fromisoformat(group_completion_time_iso)
-                age_since_completion = now - group_completion_time
+                age_since_completion = now - request.group_completion_time
 
-                if age_since_completion > timedelta(hours=INITIATOR_REMINDER_DELAY_HOURS) and request_data.get("reminders_sent_initiator", 0) == 0:
-                    initiator_chat_id = request_data["initiating_user_chat_id"]
+                if age_since_completion > timedelta(hours=INITIATOR_REMINDER_DELAY_HOURS) and request.reminders_sent_initiator == 0:
+                    initiator_chat_id = request.initiating_user_chat_id
                     reminder_text = (f"⚠️ **Напоминание:**\n\n"
                                      f"Работа по вашей заявке на линии "
-                                     f"**{escape_md(request_data.get('ls_name', ''))}** "
+                                     f"**{escape_md(request.ls_name)}** "
                                      f"была завершена ответственной группой более {INITIATOR_REMINDER_DELAY_HOURS} часов назад. "
                                      f"Пожалуйста, закройте запись о простое, нажав на одну из кнопок ниже.")
                     
@@ -74,7 +73,7 @@ async def check_pending_requests_for_reminders(bot: Bot, storage: DataStorage):
                         reply_markup=get_end_downtime_keyboard(),
                         parse_mode="Markdown"
                     )
-                    request_data["reminders_sent_initiator"] = 1
+                    request.reminders_sent_initiator = 1
                     reminders_sent_count += 1
                     logging.info(f"[REMINDER] Отправлено напоминание инициатору {initiator_chat_id} по заявке {request_id}")
 
@@ -82,4 +81,11 @@ async def check_pending_requests_for_reminders(bot: Bot, storage: DataStorage):
             logging.error(f"[REMINDER_CHECK] Ошибка при обработке заявки {request_id}: {e}")
 
     if reminders_sent_count > 0:
-        logging.info(f"[REMINDER_CHECK] Проверка завершена. Отправлено напоминаний: {reminders_sent_count}.")
\ No newline at end of file
+        logging.info(f"[REMINDER_CHECK] Проверка завершена. Отправлено напоминаний: {reminders_sent_count}.")
+
+
+async def evict_stale_pending_requests(storage: DataStorage):
+    """Удаляет из отслеживания заявки, которые так и не были закрыты за PENDING_REQUEST_MAX_AGE_HOURS."""
+    expired = evict_expired_requests(storage.pending_requests, timedelta(hours=PENDING_REQUEST_MAX_AGE_HOURS))
+    if expired:
+        logging.info(f"[REMINDER_CHECK] Удалено зависших заявок по сроку: {len(expired)}. Осталось: {len(storage.pending_requests)}.")
\ No newline at end of file
@@ -0,0 +1,242 @@
+# benchmarks/replay_updates.py
+"""
+Воспроизведение записанного потока апдейтов (см. utils/update_recorder.py) через Dispatcher.
+
+Использование:
+    python -m benchmarks.replay_updates recordings/updates_20250101_0800_080012.jsonl.gz
+                                        [--speed 1] [--limit 5000] [--telegram-latency-ms 40]
+                                        [--sheets-latency-ms 80] [--history 5000]
+                                        [--output replay.json] [--compare old_replay.json]
+
+--speed 1 — в исходном темпе, 10 — вдесятеро быстрее (апдейты обрабатываются параллельно, как при polling),
+0 — как можно быстрее, строго по одному в порядке записи (чистая стоимость обработчиков).
+Бот собирается так же, как в нагрузочном стенде: заглушка Bot API и эмулятор Sheets с группами и ролями из записи. request_id заявок в нажатиях «Принять»/«Завершить»
+подменяются на заявки, созданные при воспроизведении. Запуск одной записи на двух версиях бота
+и --compare показывают, какие обработчики стали медленнее.
+"""
+import os
+import tempfile
+
+os.environ["SHEETS_BACKEND"] = "emulator"
+os.environ["JOURNAL_PATH"] = os.path.join(tempfile.mkdtemp(prefix="replay_"), "journal.jsonl")
+
+import argparse
+import asyncio
+import json
+import logging
+import re
+import statistics
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from config import ADMIN_ROLE, EMPLOYEE_ROLE
+from g_sheets import api
+from utils.metrics import handler_name
+from utils.update_recorder import read_recording
+from benchmarks.load_harness import StandInTelegramAPI, seed_sheets, start_stand_in_bot, stop_stand_in_bot, percentile
+
+_REQUEST_CALLBACK = re.compile(r"^(accept_dt_|gw_simple_)dt_(\d+)_\d+$")
+
+
+class ReplayTimingMiddleware(BaseMiddleware):
+    """Время и ошибки по обработчикам. Апдейт без подходящего обработчика сюда не попадает."""
+
+    def __init__(self):
+        super().__init__()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def _start(self, data: dict):
+        data["_replay_started"] = time.perf_counter()
+        data["_replay_handler"] = handler_name(current_handler.get())
+
+    async def _finish(self, data: dict):
+        started = data.get("_replay_started")
+        if started is None:
+            return
+        self.latencies[data["_replay_handler"]].append(time.perf_counter() - started)
+        if sys.exc_info()[0] is not None:
+            self.errors[data["_replay_handler"]] += 1
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        await self._start(data)
+
+    async def on_post_process_message(self, message: types.Message, results: list, data: dict):
+        await self._finish(data)
+
+    async def on_process_callback_query(self, cb: types.CallbackQuery, data: dict):
+        await self._start(data)
+
+    async def on_post_process_callback_query(self, cb: types.CallbackQuery, results: list, data: dict):
+        await self._finish(data)
+
+
+def seed_from_recording(meta: dict, records: List[dict], args):
+    """Группы из метаданных записи (с прежними индексами), роли всех встреченных пользователей."""
+    groups = []
+    for group in meta.get("groups", []):
+        index = int(group["key"].rsplit("_", 1)[1])
+        groups.extend([None] * (index + 1 - len(groups)))
+        groups[index] = (group["name"], group["chat_id"])
+    roles = {}
+    for record in records:
+        event = record["update"].get("message") or record["update"].get("callback_query")
+        user_id = event["from"]["id"]
+        if record.get("admin"):
+            roles[user_id] = ADMIN_ROLE
+        else:
+            roles.setdefault(user_id, EMPLOYEE_ROLE)
+    seed_sheets(groups, roles, args.history, args.sheets_latency_ms)
+
+
+class Replayer:
+    def __init__(self, dp: Dispatcher, records: List[dict]):
+        self.dp = dp
+        self.records = records
+        self.failures: Dict[str, int] = defaultdict(int)
+        self.rewritten_request_ids = 0
+
+    def _live_update(self, raw: dict) -> types.Update:
+        """Подменяет записанный request_id заявки на созданный при воспроизведении для того же инициатора."""
+        cb = raw.get("callback_query")
+        match = _REQUEST_CALLBACK.match(cb.get("data", "")) if cb else None
+        if match:
+            initiator = int(match.group(2))
+            live = [r for r in self.dp['storage'].pending_requests.values() if r.initiating_user_id == initiator]
+            if live:
+                request = max(live, key=lambda r: r.created_at)
+                raw = {**raw, "callback_query": {**cb, "data": f"{match.group(1)}{request.request_id}"}}
+                self.rewritten_request_ids += 1
+        return types.Update.to_object(raw)
+
+    async def _feed(self, raw: dict):
+        try:
+            await self.dp.process_updates([self._live_update(raw)])
+        except Exception as e:
+            self.failures[type(e).__name__] += 1
+
+    async def run(self, speed: float):
+        if speed > 0:
+            # Исходный темп: апдейты подаются по расписанию и обрабатываются параллельно, как при polling
+            started = time.perf_counter()
+            tasks = []
+            for record in self.records:
+                delay = record["t"] / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.ensure_future(self._feed(record["update"])))
+            await asyncio.gather(*tasks)
+            return
+
+        # Как можно быстрее: строго по порядку записи. Нажатия участников группы зависят от заявок,
+        # созданных в чатах операторов, поэтому параллельная подача по чатам нарушила бы причинность.
+        for record in self.records:
+            await self._feed(record["update"])
+
+
+def build_report(replayer: Replayer, timing: ReplayTimingMiddleware, telegram: StandInTelegramAPI,
+                 wall_seconds: float, args, meta: dict) -> dict:
+    handlers = []
+    for name, values in sorted(timing.latencies.items(), key=lambda kv: sum(kv[1]), reverse=True):
+        handlers.append({
+            "handler": name, "count": len(values), "errors": timing.errors.get(name, 0),
+            **{f"p{p}_ms": round(percentile(values, p) * 1000, 1) for p in (50, 90, 99)},
+            "max_ms": round(max(values) * 1000, 1), "mean_ms": round(statistics.mean(values) * 1000, 1),
+            "total_ms": round(sum(values) * 1000, 1),
+        })
+    handled = sum(h["count"] for h in handlers)
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "recording": {"opened_at": meta.get("opened_at"), "updates": len(replayer.records),
+                      "duration_seconds": replayer.records[-1]["t"] if replayer.records else 0},
+        "wall_seconds": round(wall_seconds, 2),
+        "updates_per_second": round(len(replayer.records) / wall_seconds, 1) if wall_seconds else None,
+        "handled": handled,
+        "unhandled": len(replayer.records) - handled,
+        "failures": dict(replayer.failures),
+        "rewritten_request_ids": replayer.rewritten_request_ids,
+        "handlers": handlers,
+        "telegram_calls": dict(telegram.calls),
+        "sheets": {"requests": api.sheets_emulator.requests_total, "throttled": api.sheets_emulator.throttled_total},
+    }
+
+
+def print_report(report: dict):
+    recording = report["recording"]
+    print(f"\nАпдейтов: {recording['updates']} (запись {recording['duration_seconds']:.0f} с), "
+          f"воспроизведено за {report['wall_seconds']} с, {report['updates_per_second']} апд/с")
+    print(f"Обработано: {report['handled']}, без обработчика: {report['unhandled']}, "
+          f"подменено request_id: {report['rewritten_request_ids']}")
+    if report["failures"]:
+        print(f"Исключения: {report['failures']}")
+    print(f"\n{'обработчик':<60} {'кол-во':>7} {'p50, мс':>9} {'p90, мс':>9} {'p99, мс':>9} {'max, мс':>9} {'ошибки':>7}")
+    for h in report["handlers"]:
+        print(f"{h['handler'][:60]:<60} {h['count']:>7} {h['p50_ms']:>9.1f} {h['p90_ms']:>9.1f} "
+              f"{h['p99_ms']:>9.1f} {h['max_ms']:>9.1f} {h['errors']:>7}")
+    print(f"\nВызовы Bot API: {report['telegram_calls']}")
+    print(f"Sheets: {report['sheets']}")
+
+
+def compare(report: dict, previous_path: str):
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {h["handler"]: h for h in json.load(f)["handlers"]}
+    print(f"\nСравнение с {previous_path} (p50 и p90, текущее / прошлое):")
+    for h in report["handlers"]:
+        old = previous.get(h["handler"])
+        if not old or not old["p50_ms"] or not old["p90_ms"]:
+            continue
+        ratio50, ratio90 = h["p50_ms"] / old["p50_ms"], h["p90_ms"] / old["p90_ms"]
+        flag = "  ⚠️ медленнее" if max(ratio50, ratio90) > 1.2 else ""
+        print(f"{h['handler'][:60]:<60} p50 x{ratio50:.2f}  p90 x{ratio90:.2f}{flag}")
+
+
+async def replay(args) -> dict:
+    meta, records = read_recording(args.path)
+    if args.limit:
+        records = records[:args.limit]
+    telegram = StandInTelegramAPI(args.telegram_latency_ms, strict=False)
+    timing = ReplayTimingMiddleware()
+    dp, runner = await start_stand_in_bot(telegram, lambda: seed_from_recording(meta, records, args))
+    dp.middleware.setup(timing)
+    try:
+        replayer = Replayer(dp, records)
+        started = time.perf_counter()
+        await replayer.run(args.speed)
+        return build_report(replayer, timing, telegram, time.perf_counter() - started, args, meta)
+    finally:
+        await stop_stand_in_bot(dp, runner)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных апдейтов через Dispatcher.")
+    parser.add_argument("path", help="файл записи (.jsonl.gz)")
+    parser.add_argument("--speed", type=float, default=1.0, help="множитель темпа; 0 — как можно быстрее")
+    parser.add_argument("--limit", type=int, help="воспроизвести только первые N апдейтов")
+    parser.add_argument("--telegram-latency-ms", type=float, default=40.0, help="задержка ответа заглушки Bot API")
+    parser.add_argument("--sheets-latency-ms", type=float, default=80.0, help="задержка ответа эмулятора Sheets")
+    parser.add_argument("--history", type=int, default=5000, help="строк истории в листе простоев")
+    parser.add_argument("--output", help="файл JSON с отчетом")
+    parser.add_argument("--compare", help="прошлый отчет для сравнения")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+
+    report = asyncio.run(replay(args))
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nОтчет сохранен: {args.output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
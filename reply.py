@@ -15,6 +15,7 @@ def get_main_keyboard(is_admin: bool) -> ReplyKeyboardMarkup:
         kb.add(KeyboardButton(text="🗓️ Внести прошедший простой"))
         kb.add(KeyboardButton(text="📄 Отчет за текущую смену"))
         kb.add(KeyboardButton(text="📄 Отчет за предыдущую смену"))
+        kb.add(KeyboardButton(text="📆 Отчет за период"))
         kb.add(KeyboardButton(text="🔄 Статус линий"))
         kb.add(KeyboardButton(text="⚙️ Управление ролями"))
         
@@ -1,6 +1,7 @@
 # utils/reports.py
 import logging
 from datetime import datetime, timedelta, time
+from typing import Tuple
 from collections import Counter, defaultdict
 from pytz import timezone
 
@@ -8,8 +9,15 @@ from aiogram.utils.markdown import escape_md
 from aiogram import Bot
 
 from config import (SCHEDULER_TIMEZONE, TOP_N_REASONS_FOR_SUMMARY,
-                    PRODUCTION_SITES, LINES_SECTIONS, ADMIN_ROLE, PRODUCTION_SITE_EMOJIS)
+                    PRODUCTION_SITES, LINES_SECTIONS, ADMIN_ROLE, PRODUCTION_SITE_EMOJIS,
+                    REPORT_PROCESS_POOL_MIN_ROWS)
 from utils.storage import DataStorage
+from utils.parsing import parse_sheet_datetime
+from utils.period_reports import render_period_report, get_period_time_range
+from utils.analytics import render_reliability_report
+from utils.charts import prerender_shift_charts
+from utils.intervals import merged_minutes, naive_local, record_span
+from utils.workers import run_in_process
 
 # Создаем обратный словарь для поиска ключа по названию площадки (в нижнем регистре для надежности)
 SITE_NAME_TO_KEY = {v.lower(): k for k, v in PRODUCTION_SITES.items()}
@@ -65,47 +73,22 @@ def calculate_shift_times(record_datetime: datetime) -> (str, str):
 
     return start_dt.strftime("%Y-%m-%d %H:%M:%S"), end_dt.strftime("%Y-%m-%d %H:%M:%S")
 
-def _parse_datetime_from_sheet(dt_string: str) -> datetime | None:
-    """Пытается распарсить строку с датой из таблицы, пробуя несколько форматов."""
-    formats_to_try = [
-        "%Y-%m-%d %H:%M:%S",
-        "%d.%m.%Y %H:%M:%S",
-        "%Y/%m/%d %H:%M:%S",
-    ]
-    for fmt in formats_to_try:
-        try:
-            return datetime.strptime(dt_string, fmt)
-        except ValueError:
-            continue
-    logging.warning(f"Не удалось распознать формат даты-времени: '{dt_string}'")
-    return None
-
-async def get_downtime_report_for_period(start_dt: datetime, end_dt: datetime, storage: DataStorage):
-    cache_status = ""
-    if storage.downtime_cache.get("error"):
-        cache_status += f"\n\n⚠️ **Кэш-ошибка: {storage.downtime_cache['error']}.**"
-    if storage.is_cache_stale():
-        cache_status += f"\n\n⚠️ **Данные могут быть неактуальны (кэш устарел).**"
-
-    headers = storage.downtime_cache.get("headers")
-    data_rows = storage.downtime_cache.get("data_rows")
-
-    if not headers or data_rows is None:
-        return {}, 0, 0, f"Нет данных о простоях для анализа.{cache_status}"
+REPORT_COLUMNS = [
+    "Timestamp_записи", "Площадка", "Линия_Секция", "Направление_простоя",
+    "Время_простоя_минут", "Причина_простоя_описание", "Ответственная_группа",
+    "Дополнительный_комментарий_инициатора", "Кто_принял_заявку_Имя", "Кто_завершил_работу_в_группе_Имя"
+]
 
-    try:
-        required_cols = [
-            "Timestamp_записи", "Площадка", "Линия_Секция", "Направление_простоя",
-            "Время_простоя_минут", "Причина_простоя_описание", "Ответственная_группа",
-            "Дополнительный_комментарий_инициатора", "Кто_принял_заявку_Имя", "Кто_завершил_работу_в_группе_Имя"
-        ]
-        idx_map = {col: headers.index(col) for col in required_cols}
-    except ValueError as e:
-        logging.error(f"Отсутствует необходимый столбец в таблице: {e}")
-        error_message = f"Ошибка конфигурации отчета: столбец '{str(e).split()[0]}' не найден в таблице."
-        return {}, 0, 0, error_message
 
+def build_site_reports(headers: list, data_rows: list, start_dt: datetime, end_dt: datetime) -> Tuple[dict, int, int, int]:
+    """
+    Тексты отчетов по площадкам за период: (отчеты по площадкам, всего минут, минут без наложений, записей).
+    Минуты без наложений считаются по тем же записям, что и общий итог: их отрезки на каждой линии объединяются.
+    Работает только с переданными данными, поэтому для больших периодов выполняется в пуле процессов.
+    """
+    idx_map = {col: headers.index(col) for col in REPORT_COLUMNS}
     downtimes_by_site = defaultdict(lambda: {'total_minutes': 0, 'entries': []})
+    spans_by_line = defaultdict(list)
     total_minutes_overall = 0
     record_count = 0
     tz = timezone(SCHEDULER_TIMEZONE)
@@ -117,7 +100,7 @@ async def get_downtime_report_for_period(start_dt: datetime, end_dt: datetime, s
             record_timestamp_str = row[idx_map["Timestamp_записи"]]
             if not record_timestamp_str: continue
             
-            record_dt = _parse_datetime_from_sheet(record_timestamp_str)
+            record_dt = parse_sheet_datetime(record_timestamp_str)
             if not record_dt: continue
 
             record_dt_aware = tz.localize(record_dt)
@@ -136,6 +119,9 @@ async def get_downtime_report_for_period(start_dt: datetime, end_dt: datetime, s
 
                 total_minutes_overall += duration
                 downtimes_by_site[site_name]['total_minutes'] += duration
+                spans_by_line[(site_name, row[idx_map['Линия_Секция']])].append(
+                    record_span(record_dt, duration, row[idx_map["Дополнительный_комментарий_инициатора"]])
+                )
 
                 entry_details = [
                     f"   └ ⚙️ **{line_section}: {reason} ({duration} мин.)**",
@@ -156,9 +142,9 @@ async def get_downtime_report_for_period(start_dt: datetime, end_dt: datetime, s
             logging.warning(f"Пропущена некорректная строка при создании отчета: {row}. Ошибка: {e}")
             continue
 
-    if record_count == 0:
-        no_records_message = f"✅ **Отчет за смену**\nНет корректных записей за смену с {start_dt.strftime('%d.%m.%Y %H:%M')} по {end_dt.strftime('%d.%m.%Y %H:%M')}.{cache_status}"
-        return {}, 0, 0, no_records_message
+    merged_by_site = Counter()
+    for (site_name, _), spans in spans_by_line.items():
+        merged_by_site[site_name] += merged_minutes(spans)
 
     reports_by_site_dict = {}
     for site_name_from_sheet, data in sorted(downtimes_by_site.items()):
@@ -171,10 +157,63 @@ async def get_downtime_report_for_period(start_dt: datetime, end_dt: datetime, s
         # Экранируем Markdown в названии площадки перед отправкой
         escaped_site_name = escape_md(site_name_from_sheet)
         report_parts = [f"{emoji} **{escaped_site_name} Общее время простоя: {site_total_minutes} минут.**"]
+        report_parts.append(f"   ⏱️ Без наложений записей одной линии: {merged_by_site[site_name_from_sheet]} минут.")
         report_parts.extend(data['entries'])
         reports_by_site_dict[site_name_from_sheet] = "\n".join(report_parts)
 
-    return reports_by_site_dict, total_minutes_overall, record_count, cache_status
+    return reports_by_site_dict, total_minutes_overall, sum(merged_by_site.values()), record_count
+
+
+async def get_downtime_report_for_period(start_dt: datetime, end_dt: datetime, storage: DataStorage):
+    storage.refresh_policy.note_report_request()
+    cache_status = ""
+    if storage.downtime_cache.get("error"):
+        cache_status += f"\n\n⚠️ **Кэш-ошибка: {storage.downtime_cache['error']}.**"
+    if storage.is_cache_stale():
+        cache_status += f"\n\n⚠️ **Данные могут быть неактуальны (кэш устарел, обновление уже запущено).**"
+
+    headers = storage.downtime_cache.get("headers")
+    data_rows = storage.downtime_cache.get("data_rows")
+
+    if not headers or data_rows is None:
+        return {}, 0, 0, 0, f"Нет данных о простоях для анализа.{cache_status}"
+
+    missing = [col for col in REPORT_COLUMNS if col not in headers]
+    if missing:
+        logging.error(f"Отсутствует необходимый столбец в таблице: {missing[0]}")
+        error_message = f"Ошибка конфигурации отчета: столбец '{missing[0]}' не найден в таблице."
+        return {}, 0, 0, 0, error_message
+
+    # Если включено зеркало SQLite, отбор строк за период выполняется по индексу на стороне базы
+    min_width = max(headers.index(col) for col in REPORT_COLUMNS) + 1
+    mirror_rows = storage.mirror.fetch_rows(start_dt, end_dt, min_width) if storage.mirror else None
+    if mirror_rows is not None:
+        data_rows = mirror_rows
+    elif storage.downtime_index.headers == headers:
+        # Иначе строки периода отбираются индексом простоев (в порядке листа): в отчет и тем более
+        # в другой процесс уходят только они, а не весь лист
+        index = storage.downtime_index
+        row_ids = sorted(index.query({}, naive_local(start_dt), naive_local(end_dt)))
+        data_rows = [index.rows[i] for i in row_ids]
+
+    args = (list(headers), data_rows, start_dt, end_dt)
+    if len(data_rows) >= REPORT_PROCESS_POOL_MIN_ROWS:
+        # Месяц по всем площадкам - тысячи строк форматирования и escape_md: собираем в другом процессе,
+        # чтобы обработчики остальных пользователей не ждали
+        try:
+            reports_by_site_dict, total_minutes_overall, merged_minutes_overall, record_count = \
+                await run_in_process(build_site_reports, *args)
+        except Exception as e:
+            logging.error(f"[REPORTS] Сборка отчета в пуле процессов не удалась, собираем на месте: {e}")
+            reports_by_site_dict, total_minutes_overall, merged_minutes_overall, record_count = build_site_reports(*args)
+    else:
+        reports_by_site_dict, total_minutes_overall, merged_minutes_overall, record_count = build_site_reports(*args)
+
+    if record_count == 0:
+        no_records_message = f"✅ **Отчет за смену**\nНет корректных записей за смену с {start_dt.strftime('%d.%m.%Y %H:%M')} по {end_dt.strftime('%d.%m.%Y %H:%M')}.{cache_status}"
+        return {}, 0, 0, 0, no_records_message
+
+    return reports_by_site_dict, total_minutes_overall, merged_minutes_overall, record_count, cache_status
 
 
 async def generate_admin_shift_summary(start_dt: datetime, end_dt: datetime, storage: DataStorage):
@@ -184,20 +223,32 @@ async def generate_admin_shift_summary(start_dt: datetime, end_dt: datetime, sto
     if not headers or data_rows is None: return "Нет данных для сводки."
 
     try:
-        idx_map = {col: headers.index(col) for col in ["Timestamp_записи", "Время_простоя_минут", "Направление_простоя"]}
+        idx_map = {col: headers.index(col) for col in
+                   ["Timestamp_записи", "Время_простоя_минут", "Направление_простоя", "Площадка", "Линия_Секция"]}
     except ValueError as e: return f"Ошибка конфигурации сводки: столбец '{str(e).split()[0]}' не найден."
+    comment_col = "Дополнительный_комментарий_инициатора"
+    comment_idx = headers.index(comment_col) if comment_col in headers else None
     
     total_minutes = 0
     reason_counts = Counter()
+    spans_by_line = defaultdict(list)
     tz = timezone(SCHEDULER_TIMEZONE)
 
+    # Если включено зеркало SQLite, строки смены выбираются по индексу на стороне базы
+    mirror_rows = storage.mirror.fetch_rows(start_dt, end_dt, max(idx_map.values()) + 1) if storage.mirror else None
+    if mirror_rows is not None:
+        data_rows = mirror_rows
+    elif storage.downtime_index.headers == headers:
+        # Иначе строки смены отбираются временным индексом: разбирать даты всего листа в event loop незачем
+        data_rows = storage.downtime_index.rows_between(naive_local(start_dt), naive_local(end_dt))
+
     for row in data_rows:
         try:
             if len(row) <= max(idx_map.values()): continue
             record_timestamp_str = row[idx_map["Timestamp_записи"]]
             if not record_timestamp_str: continue
             
-            record_dt = _parse_datetime_from_sheet(record_timestamp_str)
+            record_dt = parse_sheet_datetime(record_timestamp_str)
             if not record_dt: continue
 
             record_dt_aware = tz.localize(record_dt)
@@ -207,6 +258,10 @@ async def generate_admin_shift_summary(start_dt: datetime, end_dt: datetime, sto
                 reason = row[idx_map["Направление_простоя"]] or "Не указана"
                 total_minutes += duration
                 reason_counts[reason] += duration
+                comment = row[comment_idx] if comment_idx is not None and comment_idx < len(row) else ""
+                spans_by_line[(row[idx_map["Площадка"]], row[idx_map["Линия_Секция"]])].append(
+                    record_span(record_dt, duration, comment)
+                )
         except (ValueError, IndexError) as e:
             logging.warning(f"Пропущена некорректная строка при создании сводки: {row}. Ошибка: {e}")
             continue
@@ -215,14 +270,60 @@ async def generate_admin_shift_summary(start_dt: datetime, end_dt: datetime, sto
         return f"За смену ({start_dt.strftime('%H:%M')}-{end_dt.strftime('%H:%M')}) простоев не зафиксировано."
 
     hours, minutes = divmod(total_minutes, 60)
+    merged_hours, merged_rest = divmod(sum(merged_minutes(spans) for spans in spans_by_line.values()), 60)
     top_reasons_list = reason_counts.most_common(TOP_N_REASONS_FOR_SUMMARY)
     top_reasons = [f"- {escape_md(r)} ({m} мин.)" for r, m in top_reasons_list]
     summary = (f"**Сводка за смену ({start_dt.strftime('%H:%M %d.%m')})**\n\n"
-               f"Общий простой: **{hours} ч {minutes} мин.**\n\n"
+               f"Общий простой: **{hours} ч {minutes} мин.**\n"
+               f"Без наложений записей одной линии: **{merged_hours} ч {merged_rest} мин.**\n\n"
                f"**Топ-{len(top_reasons)} причины:**\n" + "\n".join(top_reasons))
     return summary
 
 
+async def get_shift_reports(start_dt: datetime, end_dt: datetime, storage: DataStorage) -> dict:
+    """
+    Сводка и отчеты по площадкам за смену. Готовые тексты хранятся до изменения версии данных,
+    поэтому после предварительной подготовки отправка ничего не пересчитывает.
+    """
+    key = (start_dt, end_dt)
+    version = storage.downtime_cache["version"]
+    entry = storage.prerendered_shift_reports.get(key)
+    # Текст, собранный на устаревшем кэше, пересобираем после успешного обновления, даже без новых строк
+    if entry and entry["version"] == version and not (entry["stale"] and not storage.is_cache_stale()):
+        return entry
+
+    reports_by_site, total_minutes, merged_minutes_total, record_count, cache_status = \
+        await get_downtime_report_for_period(start_dt, end_dt, storage)
+    entry = {
+        "version": version,
+        "stale": storage.is_cache_stale(),
+        "summary": await generate_admin_shift_summary(start_dt, end_dt, storage),
+        "reports_by_site": reports_by_site,
+        "total_minutes": total_minutes,
+        "merged_minutes": merged_minutes_total,
+        "record_count": record_count,
+        "cache_status": cache_status,
+    }
+    # Хранится только последняя смена и предыдущая
+    storage.prerendered_shift_reports[key] = entry
+    while len(storage.prerendered_shift_reports) > 2:
+        del storage.prerendered_shift_reports[next(iter(storage.prerendered_shift_reports))]
+    return entry
+
+
+async def prewarm_shift_reports(bot: Bot, storage: DataStorage):
+    """
+    Запускается за несколько минут до конца смены: обновляет кэш, пока до отчета есть запас времени,
+    и заранее собирает отчеты за заканчивающуюся смену.
+    """
+    start_dt, end_dt = get_shift_time_range('current')
+    logging.info(f"[PREWARM] Подготовка отчетов за смену {start_dt.strftime('%H:%M %d.%m')}-{end_dt.strftime('%H:%M %d.%m')}")
+    await storage.refresh_downtime_cache(bot)
+    await get_shift_reports(start_dt, end_dt, storage)
+    # Графики рисуются в пуле процессов заранее: к рассылке они уже в кэше
+    await prerender_shift_charts(storage, start_dt, end_dt)
+
+
 async def generate_line_status_report(storage: DataStorage):
     report_lines = ["**Статус линий на текущий момент:**"]
     for site_key, site_name in PRODUCTION_SITES.items():
@@ -234,23 +335,107 @@ async def generate_line_status_report(storage: DataStorage):
         for line_key, line_name in LINES_SECTIONS[site_key].items():
             line_tuple = (site_name, line_name)
             if line_tuple in storage.active_downtimes:
-                reason = storage.active_downtimes[line_tuple]
-                report_lines.append(f"   🔴 {escape_md(line_name)}: **ПРОСТОЙ** ({escape_md(reason)})")
+                holders = storage.active_downtimes.holders(line_tuple)
+                reasons = ", ".join(dict.fromkeys(lease.reason for lease in holders))
+                extra = f", записей: {len(holders)}" if len(holders) > 1 else ""
+                report_lines.append(f"   🔴 {escape_md(line_name)}: **ПРОСТОЙ** ({escape_md(reasons)}{extra})")
             else:
                 report_lines.append(f"   🟢 {escape_md(line_name)}: Работает")
     return "\n".join(report_lines)
 
 
+async def get_period_report(start: datetime, end: datetime, title: str, storage: DataStorage) -> str:
+    """
+    Отчет за произвольный период [start, end) в наивном локальном времени.
+    Готовый текст кэшируется по периоду и версии данных, поэтому повторные запросы ничего не пересчитывают.
+    """
+    storage.refresh_policy.note_report_request()
+    if not storage.downtime_cache.get("headers"):
+        return "Нет данных о простоях для анализа."
+    cache_key = (start, end, title, storage.downtime_cache["version"])
+    report_text = storage.report_cache.get(cache_key)
+    if report_text is None:
+        totals = storage.shift_rollups.aggregate(start, end, storage.downtime_index.rows_between)
+        report_text = render_period_report(title, start, end, totals)
+        storage.report_cache.put(cache_key, report_text)
+
+    if storage.is_cache_stale():
+        report_text += "\n\n⚠️ **Данные могут быть неактуальны (кэш устарел, обновление уже запущено).**"
+    return report_text
+
+
+def render_cache_stats(storage: DataStorage) -> str:
+    """Состояние кэша простоев и текущий интервал его обновления."""
+    cache = storage.downtime_cache
+    age = f"{(datetime.now() - cache['timestamp']).total_seconds():.0f} с" if cache.get("timestamp") else "—"
+    rows = len(cache["data_rows"]) if cache.get("data_rows") is not None else 0
+    policy = storage.refresh_policy
+    lines = [
+        "🗄️ **Кэш простоев**",
+        f"Строк: {rows}, версия данных: {cache.get('version', 0)}",
+        f"Возраст снимка: {age}",
+        f"Интервал обновления: {policy.current_interval:.0f} с "
+        f"(от {policy.min_interval:.0f} до {policy.max_interval:.0f} с)",
+        f"Использование квоты Sheets: {policy.quota_usage() * 100:.0f}% за минуту",
+        f"Чтений листа: {storage.cache_fetches}, присоединений к идущему чтению: {storage.cache_refresh_joins}",
+        f"Графики: нарисовано {storage.charts.renders}, из кэша {storage.charts.hits}, загружено {storage.charts.uploads}",
+    ]
+    if cache.get("error"):
+        lines.append(f"⚠️ Последняя ошибка: {escape_md(cache['error'])}")
+    return "\n".join(lines)
+
+
+def render_downtime_query_page(headers: list, rows: list, total_count: int, page: int, page_size: int) -> str:
+    """Форматирует одну страницу результатов команды /query."""
+    def cell(row, col):
+        idx = headers.index(col) if col in headers else None
+        return row[idx] if idx is not None and idx < len(row) else ""
+
+    lines = [f"🔎 **Найдено записей: {total_count}** (стр. {page + 1})"]
+    for offset, row in enumerate(rows, start=page * page_size + 1):
+        seq = cell(row, "Порядковый номер заявки") or "—"
+        user_name = cell(row, "Username_Telegram") or cell(row, "Имя_пользователя_Telegram")
+        lines.append(
+            f"\n{offset}. №{escape_md(seq)} | {escape_md(cell(row, 'Timestamp_записи'))}\n"
+            f"   └ ⚙️ **{escape_md(cell(row, 'Площадка'))} / {escape_md(cell(row, 'Линия_Секция'))}**: "
+            f"{escape_md(cell(row, 'Направление_простоя'))} ({escape_md(cell(row, 'Время_простоя_минут') or '0')} мин.)\n"
+            f"   └ 👥 {escape_md(cell(row, 'Ответственная_группа') or 'Не указана')} | 👤 {escape_md(user_name)}"
+        )
+    return "\n".join(lines)
+
+
 async def scheduled_line_status_report(bot: Bot, storage: DataStorage):
     logging.info("SCHEDULER: Запуск задачи на отправку отчета о статусе линий.")
     admin_ids = [uid for uid, role in storage.user_roles.items() if role == ADMIN_ROLE]
     if not admin_ids:
         logging.warning("SCHEDULER: Нет администраторов для отправки отчета о статусе линий.")
         return
+    # Администраторы с живой доской получают обновление доски, а не новое сообщение
+    await storage.line_board.refresh()
+    recipients = [uid for uid in admin_ids if not storage.line_board.has_board(int(uid))]
+    if not recipients:
+        logging.info("SCHEDULER: Все администраторы используют доску статуса линий, отчет не рассылается.")
+        return
     report_text = await generate_line_status_report(storage)
-    for admin_id in admin_ids:
+    for admin_id in recipients:
         try:
             await bot.send_message(int(admin_id), report_text, parse_mode="Markdown")
         except Exception as e:
             logging.error(f"SCHEDULER: Не удалось отправить отчет о статусе линий админу {admin_id}: {e}")
-    logging.info(f"SCHEDULER: Отчет о статусе линий отправлен {len(admin_ids)} администраторам.")
\ No newline at end of file
+    logging.info(f"SCHEDULER: Отчет о статусе линий отправлен {len(recipients)} администраторам.")
+
+
+async def scheduled_weekly_reliability_digest(bot: Bot, storage: DataStorage):
+    logging.info("SCHEDULER: Запуск еженедельной сводки по надежности линий.")
+    admin_ids = [uid for uid, role in storage.user_roles.items() if role == ADMIN_ROLE]
+    if not admin_ids:
+        logging.warning("SCHEDULER: Нет администраторов для отправки сводки по надежности.")
+        return
+    start, end = get_period_time_range("last_week")
+    report_text = render_reliability_report("Надежность линий за прошлую неделю", start, end, storage.reliability)
+    for admin_id in admin_ids:
+        try:
+            await bot.send_message(int(admin_id), report_text, parse_mode="Markdown")
+        except Exception as e:
+            logging.error(f"SCHEDULER: Не удалось отправить сводку по надежности админу {admin_id}: {e}")
+    logging.info(f"SCHEDULER: Сводка по надежности отправлена {len(admin_ids)} администраторам.")
@@ -0,0 +1,101 @@
+# utils/response_stats.py
+import math
+from typing import Dict, List, Optional
+
+from aiogram.utils.markdown import escape_md
+
+# Границы корзин гистограммы: геометрическая сетка от 1 секунды до 7 суток.
+# Относительная погрешность оценки перцентиля не превышает ~7%, память на группу постоянна.
+_MIN_SECONDS = 1.0
+_MAX_SECONDS = 7 * 24 * 3600.0
+_GROWTH = 1.15
+_BUCKETS = int(math.ceil(math.log(_MAX_SECONDS / _MIN_SECONDS, _GROWTH))) + 1
+
+PERCENTILES = (50, 90, 99)
+
+
+class LogHistogram:
+    """Потоковая гистограмма с логарифмическими корзинами для оценки перцентилей."""
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * _BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    @staticmethod
+    def _bucket(value: float) -> int:
+        if value <= _MIN_SECONDS:
+            return 0
+        return min(_BUCKETS - 1, int(math.log(value / _MIN_SECONDS, _GROWTH)) + 1)
+
+    def add(self, seconds: float):
+        seconds = max(0.0, seconds)
+        self.counts[self._bucket(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for bucket, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                if bucket == 0:
+                    return self.min
+                # Геометрическая середина корзины, ограниченная наблюдавшимися min/max
+                low = _MIN_SECONDS * _GROWTH ** (bucket - 1)
+                estimate = low * math.sqrt(_GROWTH)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+
+class GroupResponseStats:
+    """Время принятия и завершения заявок по ответственным группам."""
+
+    def __init__(self):
+        self.groups: Dict[str, Dict[str, LogHistogram]] = {}
+
+    def _group(self, group_name: str) -> Dict[str, LogHistogram]:
+        return self.groups.setdefault(group_name, {"accept": LogHistogram(), "complete": LogHistogram()})
+
+    def record_accept(self, group_name: str, seconds: float):
+        """Время от создания заявки до ее принятия группой."""
+        self._group(group_name)["accept"].add(seconds)
+
+    def record_complete(self, group_name: str, seconds: float):
+        """Время от создания заявки до завершения работы группой."""
+        self._group(group_name)["complete"].add(seconds)
+
+
+def _fmt_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "—"
+    minutes = int(round(seconds / 60))
+    if minutes < 1:
+        return f"{int(round(seconds))} с"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} ч {minutes} мин" if hours else f"{minutes} мин"
+
+
+def render_response_stats(stats: GroupResponseStats) -> str:
+    if not stats.groups:
+        return "Статистика реакции групп пока не накоплена (с момента запуска бота заявок не было)."
+    lines = ["⏱️ **Скорость реакции ответственных групп** (с момента запуска бота)"]
+    labels = {"accept": "Принятие", "complete": "Завершение"}
+    for group_name in sorted(stats.groups):
+        lines.append(f"\n👥 **{escape_md(group_name)}**")
+        for kind, label in labels.items():
+            hist = stats.groups[group_name][kind]
+            if not hist.count:
+                lines.append(f"   └ {label}: нет данных")
+                continue
+            percentiles = ", ".join(f"p{p} {_fmt_duration(hist.percentile(p))}" for p in PERCENTILES)
+            lines.append(f"   └ {label} ({hist.count}): {percentiles}")
+    return "\n".join(lines)
@@ -0,0 +1,168 @@
+# utils/sqlite_mirror.py
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Iterator, Optional, List
+
+from pytz import timezone
+
+from config import SCHEDULER_TIMEZONE
+from utils.parsing import parse_sheet_datetime
+
+# Время в зеркале хранится как локальная строка этого формата: она сортируется лексикографически
+MIRROR_TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Версия схемы (PRAGMA user_version): зеркало старой схемы пересоздается при запуске
+_SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS downtimes (
+    row_no     INTEGER PRIMARY KEY,
+    ts         TEXT,
+    site       TEXT,
+    line       TEXT,
+    reason     TEXT,
+    resp_group TEXT,
+    user_id    TEXT,
+    duration   INTEGER,
+    width      INTEGER NOT NULL,
+    raw        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_downtimes_ts ON downtimes(ts);
+CREATE INDEX IF NOT EXISTS idx_downtimes_site ON downtimes(site, ts);
+CREATE INDEX IF NOT EXISTS idx_downtimes_line ON downtimes(line, ts);
+CREATE INDEX IF NOT EXISTS idx_downtimes_reason ON downtimes(reason, ts);
+CREATE INDEX IF NOT EXISTS idx_downtimes_group ON downtimes(resp_group, ts);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Столбцы таблицы, которые выносятся в отдельные индексируемые поля зеркала
+_INDEXED_COLUMNS = {
+    "ts": "Timestamp_записи",
+    "site": "Площадка",
+    "line": "Линия_Секция",
+    "reason": "Направление_простоя",
+    "resp_group": "Ответственная_группа",
+    "user_id": "ID_пользователя_Telegram",
+    "duration": "Время_простоя_минут",
+}
+
+
+class DowntimeMirror:
+    """
+    Локальная копия листа "Простои" в SQLite.
+    Google Таблица остается основным источником. При обновлении кэша в зеркало дописываются новые строки,
+    а при правке уже перенесенных строк оно пересобирается. Отчеты используют его для фильтрации
+    и агрегации на стороне SQL.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS downtimes")
+            self._conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self.tz = timezone(SCHEDULER_TIMEZONE)
+        # Заголовки и число строк, перенесенных при последней синхронизации этого процесса
+        self._headers: Optional[List[str]] = None
+        self._synced_rows = 0
+
+    def sync(self, headers: List[str], data_rows: List[List[str]], unchanged_rows: int):
+        """
+        Переносит снимок листа в зеркало. unchanged_rows - число первых строк, совпадающих с прошлым снимком:
+        если все перенесенные строки на месте, дописываются только новые, иначе зеркало пересобирается.
+        Выполняется в пуле потоков.
+        """
+        try:
+            idx_map = {field: headers.index(col) for field, col in _INDEXED_COLUMNS.items()}
+        except ValueError as e:
+            logging.error(f"[MIRROR] Отсутствует необходимый столбец в таблице: {e}")
+            return
+
+        rebuild = headers != self._headers or unchanged_rows < self._synced_rows
+        first = 0 if rebuild else self._synced_rows
+        if not rebuild and first == len(data_rows):
+            return
+
+        with self._lock:
+            try:
+                with self._conn:
+                    if rebuild:
+                        self._conn.execute("DELETE FROM downtimes")
+                    # Строки передаются генератором: снимок не копируется в список кортежей целиком
+                    self._conn.executemany("INSERT INTO downtimes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                           _mirror_records(idx_map, data_rows, first))
+                    self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('headers', ?)",
+                                       (json.dumps(headers, ensure_ascii=False),))
+                    self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('synced_at', ?)",
+                                       (datetime.now().isoformat(),))
+            except sqlite3.Error as e:
+                logging.error(f"[MIRROR] Ошибка синхронизации зеркала SQLite: {e}")
+                # Состояние зеркала неизвестно: следующая синхронизация пересоберет его
+                self._headers = None
+                return
+        self._headers = list(headers)
+        self._synced_rows = len(data_rows)
+        logging.info(f"[MIRROR] Зеркало SQLite синхронизировано: {len(data_rows)} строк "
+                     f"({'пересборка' if rebuild else f'+{len(data_rows) - first}'}).")
+
+    def _to_local_str(self, dt: datetime) -> str:
+        """Переводит границу периода в локальную строку формата зеркала."""
+        local_dt = dt.astimezone(self.tz) if dt.tzinfo else dt
+        return local_dt.strftime(MIRROR_TS_FORMAT)
+
+    def _query(self, sql: str, params: tuple) -> Optional[list]:
+        with self._lock:
+            try:
+                return self._conn.execute(sql, params).fetchall()
+            except sqlite3.Error as e:
+                logging.error(f"[MIRROR] Ошибка запроса к зеркалу SQLite: {e}")
+                return None
+
+    def fetch_rows(self, start_dt: datetime, end_dt: datetime, min_width: int = 0) -> Optional[List[List[str]]]:
+        """
+        Возвращает исходные строки листа за период [start_dt, end_dt). None - при ошибке зеркала.
+        Строки короче min_width пропускаются, как и при разборе строк кэша.
+        """
+        result = self._query(
+            "SELECT raw FROM downtimes WHERE ts >= ? AND ts < ? AND width >= ? ORDER BY row_no",
+            (self._to_local_str(start_dt), self._to_local_str(end_dt), min_width),
+        )
+        if result is None:
+            return None
+        return [json.loads(raw) for (raw,) in result]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _mirror_records(idx_map: dict, data_rows: List[List[str]], first: int) -> Iterator[tuple]:
+    def _cell(row, field):
+        idx = idx_map[field]
+        return row[idx] if idx < len(row) else ""
+
+    for row_no in range(first, len(data_rows)):
+        row = data_rows[row_no]
+        ts = _cell(row, "ts")
+        record_dt = parse_sheet_datetime(ts, log_failures=False) if ts else None
+        try:
+            duration = int(_cell(row, "duration") or 0)
+        except ValueError:
+            duration = None
+        yield (
+            row_no + 2,  # Строка 1 - заголовки
+            record_dt.strftime(MIRROR_TS_FORMAT) if record_dt else None,
+            _cell(row, "site"), _cell(row, "line"), _cell(row, "reason"),
+            _cell(row, "resp_group"), _cell(row, "user_id"),
+            duration,
+            len(row),
+            json.dumps(row, ensure_ascii=False),
+        )
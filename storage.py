@@ -1,13 +1,46 @@
 # utils/storage.py
+import asyncio
+import contextvars
 import logging
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from aiogram import Bot
 
 import gspread
-from g_sheets.api import get_gspread_client, get_worksheet, fetch_all_rows, load_user_roles, load_responsible_groups
+from g_sheets.api import get_gspread_client, get_worksheet, fetch_all_rows, load_user_roles, load_responsible_groups, sheets_quota
 from config import (ADMIN_ROLE, DOWNTIME_WORKSHEET_NAME, USER_ROLES_WORKSHEET_NAME, RESPONSIBLE_GROUPS_WORKSHEET_NAME, 
-                    SHEET_HEADERS, CACHE_MAX_AGE_SECONDS)
+                    SHEET_HEADERS, CACHE_MAX_AGE_SECONDS, SQLITE_MIRROR_ENABLED, SQLITE_MIRROR_PATH,
+                    LINE_BOARD_DEBOUNCE_SECONDS, ACTIVE_DOWNTIME_LEASE_HOURS, CACHE_REFRESH_INTERVAL_SECONDS,
+                    CACHE_MIN_REFRESH_INTERVAL_SECONDS, CACHE_ACTIVITY_WINDOW_SECONDS, CACHE_REFRESH_HEADROOM_SECONDS,
+                    CHART_CACHE_SIZE, JOURNAL_PATH, CALLBACK_DEDUP_TTL_SECONDS)
+from utils.sqlite_mirror import DowntimeMirror
+from utils.downtime_index import DowntimeIndex
+from utils.period_reports import ShiftRollups, RenderedReportCache
+from utils.analytics import ReliabilityAnalytics
+from utils.intervals import DowntimeIntervalIndex
+from utils.charts import ChartCache
+from utils.write_journal import WriteAheadJournal, JournalReplayer, max_sequence_in_rows
+from utils.response_stats import GroupResponseStats
+from utils.callback_guard import CallbackGuard
+from utils.line_board import LineStatusBoard
+from utils.line_registry import LineOccupancyRegistry
+from utils.pending_requests import PendingRequest
+from utils.refresh_policy import AdaptiveRefreshPolicy
+from utils.tracing import span
+from utils.parsing import unchanged_row_count
+
+# Больше дописанных строк (импорт, отправка журнала после сбоя) индексы не дополняются в event loop, а строятся заново
+INLINE_INDEX_SYNC_MAX_ROWS = 1000
+
+
+def _build_indexes(headers: list, data_rows: list) -> tuple:
+    """Строит индексы кэша с нуля на новых объектах (в пуле потоков, пока обработчики читают прежние)."""
+    indexes = (DowntimeIndex(), ShiftRollups(), ReliabilityAnalytics(), DowntimeIntervalIndex())
+    for index in indexes:
+        index.sync(headers, data_rows, 0)
+    return indexes
+
 
 class DataStorage:
     def __init__(self):
@@ -19,12 +52,53 @@ class DataStorage:
         self.user_roles: Dict[str, str] = {}
         self.responsible_groups: Dict[str, str] = {}
         self.group_ids: Dict[str, int] = {}
-        self.pending_requests: Dict[str, Dict[str, Any]] = {}
+        self.pending_requests: Dict[str, PendingRequest] = {}
+        # Потоковые перцентили времени реакции ответственных групп
+        self.response_stats = GroupResponseStats()
+        # Двойные нажатия кнопок заявок и замки на смену ее статуса
+        self.callback_guard = CallbackGuard(CALLBACK_DEDUP_TTL_SECONDS)
 
-        self.downtime_cache: Dict[str, Any] = {"timestamp": None, "headers": None, "data_rows": None, "error": None}
+        # "version" увеличивается только когда данные листа действительно изменились
+        self.downtime_cache: Dict[str, Any] = {"timestamp": None, "headers": None, "data_rows": None, "error": None, "version": 0}
+        # Единственное выполняющееся обновление кэша: параллельные вызовы ждут его, а не читают лист заново
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._refresh_started_at = 0.0
+        self.cache_fetches = 0
+        self.cache_refresh_joins = 0
+        # Интервал фонового обновления подстраивается под активность и запас квоты Sheets
+        self.refresh_policy = AdaptiveRefreshPolicy(
+            initial_interval=CACHE_REFRESH_INTERVAL_SECONDS,
+            min_interval=CACHE_MIN_REFRESH_INTERVAL_SECONDS,
+            # Обновление должно закончиться до того, как кэш станет устаревшим для обработчиков
+            max_interval=CACHE_MAX_AGE_SECONDS - CACHE_REFRESH_HEADROOM_SECONDS,
+            active_window=CACHE_ACTIVITY_WINDOW_SECONDS,
+            quota_usage=sheets_quota.usage,
+        )
         
-        # <<<< ИСПРАВЛЕНИЕ: Добавлена недостающая строка >>>>
-        self.active_downtimes: Dict[tuple, str] = {}
+        # Закрепленные доски статуса линий, обновляемые при изменении active_downtimes
+        self.line_board = LineStatusBoard(LINE_BOARD_DEBOUNCE_SECONDS)
+        # Активные простои: аренды линий операторами с истечением срока
+        self.active_downtimes = LineOccupancyRegistry(ACTIVE_DOWNTIME_LEASE_HOURS * 3600,
+                                                      on_change=self.line_board.notify_changed)
+
+        # Локальное зеркало SQLite (включается через SQLITE_MIRROR_ENABLED)
+        self.mirror: Optional[DowntimeMirror] = DowntimeMirror(SQLITE_MIRROR_PATH) if SQLITE_MIRROR_ENABLED else None
+        # Инвертированные индексы для команды /query
+        self.downtime_index = DowntimeIndex()
+        # Агрегаты по сменам и кэш готовых отчетов за произвольные периоды
+        self.shift_rollups = ShiftRollups()
+        self.report_cache = RenderedReportCache()
+        # Отчеты за смену, подготовленные заранее перед плановой рассылкой: (начало, конец) -> тексты
+        self.prerendered_shift_reports: Dict[tuple, Dict[str, Any]] = {}
+        # Матрицы простоев "смена x линия" для MTBF/MTTR/доступности
+        self.reliability = ReliabilityAnalytics()
+        # Интервалы простоев по линиям для учета наложившихся записей
+        self.interval_index = DowntimeIntervalIndex()
+        # Графики к отчетам за смену: PNG и file_id по (тип, период, версия данных)
+        self.charts = ChartCache(CHART_CACHE_SIZE)
+        # Журнал записей: запись сохраняется локально до отправки в таблицу и не теряется при ее недоступности
+        self.write_journal = WriteAheadJournal(JOURNAL_PATH)
+        self.journal_replayer = JournalReplayer(self.write_journal, self)
 
     def is_admin(self, user_id: str) -> bool:
         """Проверяет, является ли пользователь администратором."""
@@ -44,6 +118,8 @@ class DataStorage:
         await self.load_user_roles()
         await self.load_responsible_groups()
         await self.refresh_downtime_cache()
+        if self.downtime_cache["data_rows"] is not None:
+            self.write_journal.observe_sequence(max_sequence_in_rows(self.downtime_cache["headers"], self.downtime_cache["data_rows"]))
         logging.info("--- [STORAGE] Инициализация хранилища завершена. ---")
 
     async def load_user_roles(self):
@@ -56,8 +132,49 @@ class DataStorage:
         if self.gspread_client:
             self.responsible_groups, self.group_ids = load_responsible_groups(self.gspread_client)
 
+    def _start_refresh(self, bot: Optional[Bot]) -> asyncio.Task:
+        self._refresh_started_at = time.monotonic()
+        self._refresh_task = asyncio.ensure_future(self._fetch_downtime_cache(bot))
+        return self._refresh_task
+
     async def refresh_downtime_cache(self, bot: Optional[Bot] = None):
-        """Обновляет кэш данных о простоях из Google Таблицы."""
+        """
+        Обновляет кэш и дожидается чтения листа, начатого не раньше этого вызова (нужно после записи).
+        Если такое чтение уже идет, вызов присоединяется к нему вместо запуска своего.
+        """
+        requested_at = time.monotonic()
+        with span("cache.refresh"):
+            while True:
+                task, started_at = self._refresh_task, self._refresh_started_at
+                if task is None or task.done():
+                    await asyncio.shield(self._start_refresh(bot))
+                    return
+                self.cache_refresh_joins += 1
+                await asyncio.shield(task)
+                if started_at >= requested_at:
+                    return
+                # Дождались чтения, начатого до вызова: оно могло не увидеть последнюю запись, читаем еще раз
+
+    async def revalidate_downtime_cache(self, bot: Optional[Bot] = None):
+        """Фоновое обновление кэша: подойдет любое уже идущее чтение листа."""
+        task = self._refresh_task
+        if task is None or task.done():
+            task = self._start_refresh(bot)
+        else:
+            self.cache_refresh_joins += 1
+        await asyncio.shield(task)
+
+    def _schedule_revalidation(self):
+        if self._refresh_task and not self._refresh_task.done():
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._start_refresh(None)
+
+    async def _fetch_downtime_cache(self, bot: Optional[Bot]):
+        """Читает лист простоев и атомарно (без await между шагами) заменяет снимок кэша."""
         logging.info("Обновление кэша данных о простоях...")
         if not self.downtime_ws:
             self.downtime_cache["error"] = "Worksheet not available"
@@ -65,14 +182,41 @@ class DataStorage:
             return
 
         try:
-            all_values = fetch_all_rows(self.downtime_ws)
+            self.cache_fetches += 1
+            # gspread синхронный: чтение листа выполняется в пуле потоков, чтобы не блокировать обработчики
+            # Контекст копируется, чтобы чтение попало в трассу апдейта, запустившего обновление
+            context = contextvars.copy_context()
+            loop = asyncio.get_running_loop()
+            all_values = await loop.run_in_executor(None, context.run, fetch_all_rows, self.downtime_ws)
             current_time = datetime.now()
             if all_values is not None:
-                self.downtime_cache["headers"] = all_values[0] if all_values else []
-                self.downtime_cache["data_rows"] = all_values[1:] if len(all_values) > 1 else []
+                new_headers = all_values[0] if all_values else []
+                new_rows = all_values[1:] if len(all_values) > 1 else []
+                old_headers, old_rows = self.downtime_cache["headers"], self.downtime_cache["data_rows"] or []
+                # Снимки после чтения не меняются, поэтому сравнение и пересборка идут в пуле потоков
+                unchanged = await loop.run_in_executor(None, unchanged_row_count, old_rows, new_rows)
+                appended_only = new_headers == old_headers and unchanged == len(old_rows)
+                indexes = None
+                if not appended_only or len(new_rows) - len(old_rows) > INLINE_INDEX_SYNC_MAX_ROWS:
+                    # Правка строк, новые заголовки, первое чтение или большой прирост: индексы строятся заново
+                    indexes = await loop.run_in_executor(None, _build_indexes, new_headers, new_rows)
+
+                # Дальше без await: читатели видят либо старый снимок с его индексами, либо новый
+                if not appended_only or len(new_rows) != len(old_rows):
+                    self.downtime_cache["version"] += 1
+                self.downtime_cache["headers"] = new_headers
+                self.downtime_cache["data_rows"] = new_rows
                 self.downtime_cache["timestamp"] = current_time
                 self.downtime_cache["error"] = None
                 logging.info(f"Кэш обновлен: {len(self.downtime_cache['data_rows'])} строк.")
+                if indexes:
+                    self.downtime_index, self.shift_rollups, self.reliability, self.interval_index = indexes
+                else:
+                    # Несколько дописанных строк: индексы дополняются на месте
+                    for index in (self.downtime_index, self.shift_rollups, self.reliability, self.interval_index):
+                        index.sync(new_headers, new_rows, unchanged)
+                if self.mirror:
+                    await loop.run_in_executor(None, self.mirror.sync, new_headers, new_rows, unchanged)
             else:
                 self.downtime_cache["error"] = "Failed to fetch data"
                 logging.error("Не удалось получить данные для кэша (fetch_all_rows вернул None).")
@@ -92,7 +236,12 @@ class DataStorage:
             logging.error(f"Неожиданная ошибка при обновлении кэша: {e}", exc_info=True)
             
     def is_cache_stale(self) -> bool:
-        """Проверяет, не устарел ли кэш."""
-        if not self.downtime_cache["timestamp"]:
-            return True
-        return (datetime.now() - self.downtime_cache["timestamp"]).total_seconds() > CACHE_MAX_AGE_SECONDS
\ No newline at end of file
+        """
+        Проверяет, не устарел ли кэш. Устаревший кэш сразу запускает фоновое обновление,
+        а читатели пока получают последний удачный снимок.
+        """
+        if self.downtime_cache["timestamp"] and \
+                (datetime.now() - self.downtime_cache["timestamp"]).total_seconds() <= CACHE_MAX_AGE_SECONDS:
+            return False
+        self._schedule_revalidation()
+        return True
\ No newline at end of file
@@ -0,0 +1,81 @@
+# utils/trace_summary.py
+"""
+Сводка по файлу медленных трасс.
+
+Использование:
+    python -m utils.trace_summary slow_traces.jsonl [--top 15] [--handler ИМЯ]
+"""
+import argparse
+import glob
+import json
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+
+def read_traces(path: str) -> Iterable[dict]:
+    """Читает текущий файл и его ротированные копии (path.1, path.2, ...)."""
+    for file_path in sorted(glob.glob(f"{path}.*"), reverse=True) + [path]:
+        try:
+            with open(file_path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            yield json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+        except FileNotFoundError:
+            continue
+
+
+def _percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round((len(ordered) - 1) * p / 100)))]
+
+
+def summarize(traces: Iterable[dict], handler: str = None) -> Dict[str, Dict[str, List[float]]]:
+    """Собирает длительности трасс по обработчикам и участков по именам (собственное время без детей)."""
+    handlers: Dict[str, List[float]] = defaultdict(list)
+    spans: Dict[str, List[float]] = defaultdict(list)
+    for trace in traces:
+        name = trace.get("handler") or "—"
+        if handler and handler not in name:
+            continue
+        handlers[name].append(trace["duration_ms"])
+        items = trace.get("spans", [])
+        children = defaultdict(float)
+        for item in items:
+            if item.get("parent") is not None:
+                children[item["parent"]] += item["duration_ms"]
+        for index, item in enumerate(items):
+            spans[item["name"]].append(max(0.0, item["duration_ms"] - children[index]))
+    return {"handlers": handlers, "spans": spans}
+
+
+def _table(title: str, series: Dict[str, List[float]], top: int) -> List[str]:
+    rows = sorted(series.items(), key=lambda kv: sum(kv[1]), reverse=True)[:top]
+    lines = [title, f"{'имя':<60} {'кол-во':>7} {'всего, мс':>11} {'p50':>9} {'p95':>9} {'max':>9}"]
+    for name, values in rows:
+        lines.append(f"{name[:60]:<60} {len(values):>7} {sum(values):>11.0f} "
+                     f"{_percentile(values, 50):>9.0f} {_percentile(values, 95):>9.0f} {max(values):>9.0f}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Самые горячие участки медленных трасс бота.")
+    parser.add_argument("path", nargs="?", default="slow_traces.jsonl", help="файл трасс (ротированные копии читаются тоже)")
+    parser.add_argument("--top", type=int, default=15, help="сколько строк показывать")
+    parser.add_argument("--handler", help="только трассы обработчиков, содержащих эту подстроку")
+    args = parser.parse_args()
+
+    result = summarize(read_traces(args.path), args.handler)
+    if not result["handlers"]:
+        print("Трасс не найдено.")
+        return
+    print("\n".join(_table("Обработчики (полное время апдейта):", result["handlers"], args.top)))
+    print()
+    print("\n".join(_table("Участки (собственное время без вложенных):", result["spans"], args.top)))
+
+
+if __name__ == "__main__":
+    main()
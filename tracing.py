@@ -0,0 +1,142 @@
+# utils/tracing.py
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from typing import List, Optional
+
+from aiogram import Bot, types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from utils.metrics import handler_name
+
+# Отдельный логгер: медленные трассы пишутся строками JSON и не попадают в общий лог
+trace_logger = logging.getLogger("traces")
+trace_logger.propagate = False
+
+
+class Span:
+    __slots__ = ("name", "parent", "depth", "started", "duration", "error")
+
+    def __init__(self, name: str, parent: Optional[int], depth: int):
+        self.name = name
+        self.parent = parent
+        self.depth = depth
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+
+class Trace:
+    """Трасса одного апдейта Telegram: обработчик и вложенные вызовы Telegram/Sheets."""
+
+    def __init__(self, update: types.Update):
+        self.update_id = update.update_id
+        event = update.callback_query or update.message
+        self.update_type = "callback_query" if update.callback_query else "message" if update.message else "other"
+        self.user_id = event.from_user.id if event and event.from_user else None
+        self.handler: Optional[str] = None
+        self.started_wall = time.time()
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+
+    def to_dict(self, duration: float) -> dict:
+        return {
+            "ts": round(self.started_wall, 3),
+            "update_id": self.update_id,
+            "update_type": self.update_type,
+            "user_id": self.user_id,
+            "handler": self.handler,
+            "duration_ms": round(duration * 1000, 1),
+            "spans": [
+                {"name": s.name, "parent": s.parent, "depth": s.depth,
+                 "offset_ms": round((s.started - self.started) * 1000, 1),
+                 "duration_ms": round((s.duration or 0) * 1000, 1), "error": s.error}
+                for s in self.spans
+            ],
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+# Текущий участок хранится в контексте, а не в трассе: у фоновых задач, начатых из обработчика, своя вложенность
+_current_span: ContextVar[Optional[int]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str):
+    """
+    Дочерний участок текущей трассы. Вне трассы (планировщик, опрос getUpdates) ничего не делает.
+    В пул потоков контекст не передается сам: задачу нужно запускать через contextvars.copy_context().run.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    parent = _current_span.get()
+    item = Span(name, parent, trace.spans[parent].depth + 1 if parent is not None else 0)
+    trace.spans.append(item)
+    token = _current_span.set(len(trace.spans) - 1)
+    try:
+        yield
+    except Exception as e:
+        item.error = type(e).__name__
+        raise
+    finally:
+        item.duration = time.perf_counter() - item.started
+        _current_span.reset(token)
+
+
+class TracedBot(Bot):
+    """Bot, записывающий каждый вызов Bot API как участок текущей трассы."""
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        with span(f"telegram.{method}"):
+            return await super().request(method, data, files, **kwargs)
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Открывает трассу на каждый апдейт и сохраняет медленные трассы в JSONL."""
+
+    def __init__(self, slow_threshold_seconds: float):
+        super().__init__()
+        self.slow_threshold_seconds = slow_threshold_seconds
+        self.slow_traces = 0
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        data["_trace_token"] = _current_trace.set(Trace(update))
+        data["_span_token"] = _current_span.set(None)
+
+    async def _remember_handler(self):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.handler = handler_name(current_handler.get())
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        await self._remember_handler()
+
+    async def on_process_callback_query(self, cb: types.CallbackQuery, data: dict):
+        await self._remember_handler()
+
+    async def on_post_process_update(self, update: types.Update, results: list, data: dict):
+        trace = _current_trace.get()
+        token = data.pop("_trace_token", None)
+        if token is not None:
+            _current_trace.reset(token)
+            _current_span.reset(data.pop("_span_token"))
+        if trace is None:
+            return
+        duration = time.perf_counter() - trace.started
+        if duration >= self.slow_threshold_seconds:
+            self.slow_traces += 1
+            trace_logger.info(json.dumps(trace.to_dict(duration), ensure_ascii=False))
+
+
+def setup_trace_log(path: str, max_bytes: int, backup_count: int):
+    """Ротируемый файл медленных трасс: одна трасса — одна строка JSON."""
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(handler)
+    trace_logger.setLevel(logging.INFO)
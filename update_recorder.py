@@ -0,0 +1,201 @@
+# utils/update_recorder.py
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from pytz import timezone
+
+from config import SCHEDULER_TIMEZONE
+from keyboards.reply import get_main_keyboard
+from utils.reports import get_shift_time_range
+
+RECORDING_FORMAT_VERSION = 1
+
+# Тексты, по которым выбираются обработчики, записываются как есть: кнопки меню, даты, время и числа
+_MENU_TEXTS = {button.text for row in get_main_keyboard(True).keyboard for button in row}
+_STRUCTURED_TEXT = re.compile(r"^[\d\s.:,/\-]*$")
+_LONG_NUMBER = re.compile(r"-?\d{5,}")
+_REQUEST_ID_USER = re.compile(r"dt_(\d+)_")
+
+
+class UpdateAnonymizer:
+    """
+    Заменяет идентификаторы пользователей, чатов и файлов на стабильные псевдонимы в пределах одной записи.
+    Свободный текст заменяется заполнителем той же длины: на обработку влияет длина, но не содержание.
+    """
+
+    def __init__(self):
+        self.ids: Dict[int, int] = {}
+        self.files: Dict[str, str] = {}
+
+    def chat_id(self, value: int) -> int:
+        # Пользователь и его личный чат получают один псевдоним; группы остаются отрицательными
+        if value not in self.ids:
+            n = len(self.ids) + 1
+            self.ids[value] = -(1000000000000 + n) if value < 0 else 100000 + n
+        return self.ids[value]
+
+    def file_id(self, value: str) -> str:
+        if value not in self.files:
+            self.files[value] = f"file_{len(self.files) + 1}"
+        return self.files[value]
+
+    def callback_data(self, value: str) -> str:
+        """
+        Заменяет id инициатора в request_id заявки (dt_<id>_<время>) и прочие уже известные идентификаторы.
+        Остальные длинные числа (время в request_id, номера страниц) не трогаем.
+        """
+        value = _REQUEST_ID_USER.sub(lambda m: f"dt_{self.chat_id(int(m.group(1)))}_", value)
+
+        def replace(match):
+            number = int(match.group())
+            return str(self.ids[number]) if number in self.ids else match.group()
+        return _LONG_NUMBER.sub(replace, value)
+
+    def text(self, value: Optional[str]) -> Optional[str]:
+        if value is None or value in _MENU_TEXTS or _STRUCTURED_TEXT.match(value):
+            return value
+        if value.startswith("/"):
+            # Аргументы команд могут содержать id пользователей (/setrole 123456)
+            return _LONG_NUMBER.sub(lambda m: str(self.chat_id(int(m.group()))), value)
+        return "x" * len(value)
+
+    def user(self, user: dict) -> dict:
+        user_id = self.chat_id(user["id"])
+        return {"id": user_id, "is_bot": user.get("is_bot", False), "first_name": f"Пользователь {user_id}"}
+
+    def message(self, message: dict) -> dict:
+        chat = message["chat"]
+        result = {
+            "message_id": message["message_id"],
+            "date": message["date"],
+            "chat": {"id": self.chat_id(chat["id"]), "type": chat["type"]},
+        }
+        if "from" in message:
+            result["from"] = self.user(message["from"])
+        if "text" in message:
+            result["text"] = self.text(message["text"])
+            commands = [e for e in message.get("entities", []) if e.get("type") == "bot_command"]
+            if commands:
+                result["entities"] = commands
+        if message.get("photo"):
+            largest = message["photo"][-1]
+            file_id = self.file_id(largest["file_id"])
+            result["photo"] = [{"file_id": file_id, "file_unique_id": file_id,
+                                "width": largest.get("width", 0), "height": largest.get("height", 0)}]
+        if "caption" in message:
+            result["caption"] = self.text(message["caption"])
+        return result
+
+    def update(self, update: types.Update, update_id: int) -> Optional[dict]:
+        raw = update.to_python()
+        if "message" in raw:
+            return {"update_id": update_id, "message": self.message(raw["message"])}
+        if "callback_query" in raw:
+            cb = raw["callback_query"]
+            result = {"id": str(update_id), "from": self.user(cb["from"]), "chat_instance": "0",
+                      "data": self.callback_data(cb.get("data", ""))}
+            if "message" in cb:
+                result["message"] = self.message(cb["message"])
+            return {"update_id": update_id, "callback_query": result}
+        return None
+
+
+class UpdateRecorderMiddleware(BaseMiddleware):
+    """
+    Пишет обезличенные сообщения и нажатия кнопок со смещением от начала записи.
+    Каждый файл самодостаточен: свои псевдонимы и таблица ответственных групп в первой строке.
+    """
+
+    def __init__(self, directory: str, storage):
+        super().__init__()
+        self.directory = directory
+        self.storage = storage
+        self.recorded = 0
+        self.path: Optional[str] = None
+        self._file = None
+        self._shift_end: Optional[datetime] = None
+        self._started = 0.0
+        self._anonymizer = UpdateAnonymizer()
+
+    def _open(self, now: datetime):
+        self.close()
+        shift_start, self._shift_end = get_shift_time_range('current')
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"updates_{shift_start:%Y%m%d_%H%M}_{now:%H%M%S}.jsonl.gz")
+        self._file = gzip.open(self.path, "at", encoding="utf-8")
+        self._started = time.monotonic()
+        self._anonymizer = UpdateAnonymizer()
+        # Кнопки групп ссылаются на индексы grp_idx_N, поэтому порядок и индексы групп сохраняются
+        groups = [{"key": key, "name": name, "chat_id": self._anonymizer.chat_id(self.storage.group_ids[name])
+                   if name in self.storage.group_ids else None}
+                  for key, name in self.storage.responsible_groups.items()]
+        self._write({"meta": {"version": RECORDING_FORMAT_VERSION, "shift_start": shift_start.isoformat(),
+                              "opened_at": now.isoformat(timespec="seconds"), "groups": groups}})
+        logging.info(f"[RECORDER] Запись апдейтов в {self.path}")
+
+    def _write(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        # Сжатый поток сбрасывается на каждой записи: при падении бота теряется не больше одного апдейта
+        self._file.flush()
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        try:
+            now = datetime.now(timezone(SCHEDULER_TIMEZONE))
+            if self._file is None or now >= self._shift_end:
+                self._open(now)
+            record = self._anonymizer.update(update, self.recorded + 1)
+            if record is None:
+                return
+            item = {"t": round(time.monotonic() - self._started, 3), "update": record}
+            # Для администраторов отмечаем роль: без нее их команды при воспроизведении не пройдут фильтр
+            user = update.callback_query.from_user if update.callback_query else update.message.from_user
+            if user and self.storage.is_admin(str(user.id)):
+                item["admin"] = 1
+            self._write(item)
+            self.recorded += 1
+        except Exception as e:
+            # Запись не должна мешать обработке апдейта
+            logging.warning(f"[RECORDER] Не удалось записать апдейт {update.update_id}: {e}")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_recording(path: str) -> Tuple[dict, List[dict]]:
+    """Читает файл записи: метаданные и записи вида {"t": смещение в секундах, "update": ..., "admin": 1}."""
+    meta: dict = {}
+    records: List[dict] = []
+    for line in _lines(path):
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            # Последняя строка могла оборваться при аварийной остановке бота
+            continue
+        if "meta" in item:
+            meta = item["meta"]
+        else:
+            records.append(item)
+    return meta, records
+
+
+def _lines(path: str) -> Iterator[str]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+        except EOFError:
+            # Недописанный gzip-блок: все, что было сброшено до него, уже прочитано
+            return
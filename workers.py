@@ -0,0 +1,43 @@
+# utils/workers.py
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from config import WORKER_PROCESSES
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Общий пул процессов для CPU-тяжелых задач. Создается при первом обращении."""
+    global _pool
+    if _pool is None:
+        # spawn, а не fork: дочерний процесс не наследует потоки пула gspread и состояние event loop
+        _pool = ProcessPoolExecutor(max_workers=WORKER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        logging.info(f"[WORKERS] Запущен пул процессов: {WORKER_PROCESSES}.")
+    return _pool
+
+
+async def run_in_process(func: Callable, *args) -> Any:
+    """
+    Выполняет func(*args) в пуле процессов, не блокируя event loop.
+    func и аргументы должны сериализоваться pickle: функции уровня модуля и простые данные.
+    """
+    global _pool
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_process_pool(), func, *args)
+    except BrokenProcessPool:
+        # Упавший процесс (например, OOM) ломает пул целиком: следующий вызов создаст новый
+        logging.error("[WORKERS] Пул процессов поврежден, будет пересоздан.")
+        _pool = None
+        raise
+
+
+def shutdown_process_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
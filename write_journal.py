@@ -0,0 +1,282 @@
+# utils/write_journal.py
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+
+from config import JOURNAL_BATCH_SIZE
+from g_sheets.api import append_downtime_records, get_sequence_timestamps
+from utils.parsing import parse_sheet_datetime
+
+SEQ_COLUMN = "Порядковый номер заявки"
+TIMESTAMP_COLUMN = "Timestamp_записи"
+AUTHOR_ID_COLUMN = "ID_пользователя_Telegram"
+
+
+class WriteAheadJournal:
+    """
+    Локальный журнал записей в лист "Простои" (JSONL, только дописывание, fsync на каждую запись).
+    Запись попадает в журнал до обращения к Google Sheets и считается отправленной только после
+    подтверждения. Порядковые номера выделяются здесь же, без чтения столбца A перед каждой записью.
+
+    Строки файла:
+        {"op": "append", "seq": N, "record": {...}}  - запись принята
+        {"op": "done", "seq": N}                     - запись есть в таблице
+        {"op": "renumber", "seq": N, "new": M}       - номер N в таблице занят другой строкой
+        {"op": "mark", "next_seq": N}                - следующий номер (после сжатия файла)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pending: "OrderedDict[int, dict]" = OrderedDict()
+        # Старый номер -> новый для записей, чей номер оказался занят в таблице
+        self.renumbered: Dict[int, int] = {}
+        self.next_seq = 1
+        self._file = None
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Строка, оборванная при аварийной остановке: fsync для нее не завершился
+                        continue
+                    self._apply(item)
+            if self.pending:
+                logging.warning(f"[JOURNAL] В журнале {len(self.pending)} неотправленных записей, "
+                                f"№{next(iter(self.pending))}–№{next(reversed(self.pending))}.")
+
+    def _apply(self, item: dict):
+        op = item.get("op")
+        if op == "append":
+            self.pending[item["seq"]] = item["record"]
+            self.next_seq = max(self.next_seq, item["seq"] + 1)
+        elif op == "done":
+            self.pending.pop(item["seq"], None)
+        elif op == "renumber" and item["seq"] in self.pending:
+            record = self.pending.pop(item["seq"])
+            record[SEQ_COLUMN] = item["new"]
+            self.pending[item["new"]] = record
+            self.renumbered[item["seq"]] = item["new"]
+            self.pending = OrderedDict(sorted(self.pending.items()))
+            self.next_seq = max(self.next_seq, item["new"] + 1)
+        elif op == "mark":
+            self.next_seq = max(self.next_seq, item["next_seq"])
+
+    def _write(self, items: List[dict]):
+        # Файл открывается при первой записи: хранилище, которое ничего не пишет (бенчмарки), его не создает
+        if self._file is None:
+            torn_tail = False
+            if os.path.exists(self.path) and os.path.getsize(self.path):
+                with open(self.path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    torn_tail = f.read(1) != b"\n"
+            self._file = open(self.path, "a", encoding="utf-8")
+            # Оборванная последняя строка не должна склеиться с первой новой
+            if torn_tail:
+                self._file.write("\n")
+        self._file.write("".join(json.dumps(item, ensure_ascii=False, default=str) + "\n" for item in items))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def observe_sequence(self, max_seq: int):
+        """Номера в таблице могли вырасти без бота (строки, внесенные вручную): выдаем номера после них."""
+        self.next_seq = max(self.next_seq, max_seq + 1)
+
+    def allocate(self, count: int = 1) -> int:
+        """Выделяет count подряд идущих номеров и возвращает первый."""
+        first = self.next_seq
+        self.next_seq += count
+        return first
+
+    def release(self, first: int, count: int = 1):
+        """
+        Возвращает номера, выделенные allocate() под записи, которые не удалось записать в журнал.
+        Вызывается без await после allocate(): если с тех пор номера выдавались еще, блок не возвращается.
+        """
+        if self.next_seq == first + count:
+            self.next_seq = first
+
+    def append(self, records: List[dict]):
+        """Пишет записи в журнал и дожидается fsync. Номер записи берется из столбца "Порядковый номер заявки"."""
+        items = [{"op": "append", "seq": int(record[SEQ_COLUMN]), "record": record} for record in records]
+        self._write(items)
+        for item in items:
+            self.pending[item["seq"]] = item["record"]
+
+    def mark_done(self, seqs: List[int]):
+        self._write([{"op": "done", "seq": seq} for seq in seqs])
+        for seq in seqs:
+            self.pending.pop(seq, None)
+        if not self.pending:
+            self._compact()
+
+    def renumber(self, seq: int, new_seq: int):
+        self._write([{"op": "renumber", "seq": seq, "new": new_seq}])
+        self._apply({"op": "renumber", "seq": seq, "new": new_seq})
+
+    def _compact(self):
+        """Все записи отправлены: файл заменяется одной строкой со следующим номером."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"op": "mark", "next_seq": self.next_seq}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.close()
+        os.replace(tmp_path, self.path)
+
+    def resolve(self, seq: int) -> int:
+        """Актуальный номер записи с учетом перенумерации."""
+        while seq in self.renumbered:
+            seq = self.renumbered[seq]
+        return seq
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _same_record(sheet_row: Tuple[str, str], record: dict) -> bool:
+    """
+    Строка в таблице - та же запись, если совпадают время записи (формат мог поменять USER_ENTERED) и автор.
+    У записей задним числом время записи - окончание простоя с точностью до минуты, одного времени мало.
+    """
+    sheet_timestamp, sheet_user_id = sheet_row
+    return parse_sheet_datetime(sheet_timestamp, log_failures=False) == \
+        parse_sheet_datetime(str(record.get(TIMESTAMP_COLUMN, "")), log_failures=False) and \
+        str(sheet_user_id).strip() == str(record.get(AUTHOR_ID_COLUMN, "")).strip()
+
+
+class JournalReplayer:
+    """
+    Отправляет записи журнала в таблицу по порядку номеров. Перед отправкой читает столбцы A:B:
+    запись, номер и время которой уже есть в таблице, считается отправленной (ответ на прошлую попытку
+    мог потеряться), а занятый чужой строкой номер заменяется новым. Поэтому повторы безопасны.
+    Ожидающие push() просыпаются сразу после отметки записей отправленными, не дожидаясь обновления кэша.
+    """
+
+    def __init__(self, journal: WriteAheadJournal, storage):
+        self.journal = journal
+        self.storage = storage
+        self.failing_since: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._cache_refresh: Optional[asyncio.Task] = None
+        # Событие заменяется новым после каждой отметки записей отправленными
+        self._progress = asyncio.Event()
+
+    @property
+    def pending_count(self) -> int:
+        return len(self.journal.pending)
+
+    async def drain(self, bot: Optional[Bot] = None) -> bool:
+        """Отправляет все накопленные записи, включая поступившие во время отправки. True - журнал пуст."""
+        async with self._lock:
+            ok, written = True, 0
+            while ok and self.journal.pending:
+                try:
+                    ok, batch_written = await self._drain_locked()
+                except Exception as e:
+                    logging.error(f"[JOURNAL] Ошибка отправки журнала: {e}", exc_info=True)
+                    ok, batch_written = False, 0
+                written += batch_written
+            if ok:
+                if self.failing_since:
+                    logging.warning(f"[JOURNAL] Запись в таблицу восстановлена (сбой с {self.failing_since:%H:%M:%S}).")
+                self.failing_since = None
+            elif not self.failing_since:
+                self.failing_since = datetime.now()
+        if written:
+            self.storage.refresh_policy.note_write()
+            # Кэш дочитывается отдельной задачей: записи уже в таблице, ждать чтения листа незачем
+            self._cache_refresh = asyncio.ensure_future(self.storage.refresh_downtime_cache(bot))
+        return ok
+
+    async def _drain_locked(self):
+        loop = asyncio.get_running_loop()
+        ws = self.storage.downtime_ws
+        existing: Optional[Dict[int, Tuple[str, str]]] = await loop.run_in_executor(None, get_sequence_timestamps, ws)
+        if existing is None:
+            return False, 0
+        if existing:
+            self.journal.observe_sequence(max(existing))
+
+        already_written = []
+        for seq, record in list(self.journal.pending.items()):
+            if seq not in existing:
+                continue
+            if _same_record(existing[seq], record):
+                already_written.append(seq)
+            else:
+                new_seq = self.journal.allocate()
+                logging.warning(f"[JOURNAL] Номер {seq} в таблице занят другой строкой, запись получает №{new_seq}.")
+                self.journal.renumber(seq, new_seq)
+        if already_written:
+            logging.info(f"[JOURNAL] Уже в таблице: {already_written}")
+            self._mark_done(already_written)
+
+        seqs = list(self.journal.pending)
+        records = list(self.journal.pending.values())
+        if not records:
+            return True, 0
+        written = await loop.run_in_executor(None, append_downtime_records, ws, records, JOURNAL_BATCH_SIZE)
+        if written:
+            self._mark_done(seqs[:written])
+        logging.info(f"[JOURNAL] Отправлено {written} из {len(records)} записей журнала.")
+        return written == len(records), written
+
+    def _mark_done(self, seqs: List[int]):
+        self.journal.mark_done(seqs)
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    def _start(self, bot: Optional[Bot]) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.drain(bot))
+        return self._task
+
+    def _is_pending(self, seqs: List[int]) -> bool:
+        return any(self.journal.resolve(seq) in self.journal.pending for seq in seqs)
+
+    async def _wait_written(self, seqs: List[int], bot: Optional[Bot]) -> bool:
+        while self._is_pending(seqs):
+            # Отправка, начатая до записи в журнал, могла ее не захватить - тогда запускаем следующую
+            task = self._start(bot)
+            progress = asyncio.ensure_future(self._progress.wait())
+            try:
+                # asyncio.wait не отменяет отправку, если ожидающего снимут по таймауту
+                await asyncio.wait({task, progress}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                progress.cancel()
+            if task.done() and not task.result():
+                return not self._is_pending(seqs)
+        return True
+
+    async def push(self, seqs: List[int], bot: Optional[Bot] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Запускает отправку и ждет записи seqs в таблицу не дольше timeout. Пока таблица недоступна,
+        не ждет вовсе: записи уже в журнале и уйдут при следующей попытке. True - записи в таблице.
+        """
+        if self.failing_since and timeout is not None:
+            self._start(bot)
+            return False
+        try:
+            return await asyncio.wait_for(self._wait_written(seqs, bot), timeout)
+        except asyncio.TimeoutError:
+            return False
+
+
+def max_sequence_in_rows(headers: List[str], data_rows: List[List[str]]) -> int:
+    if SEQ_COLUMN not in (headers or []):
+        return 0
+    idx = headers.index(SEQ_COLUMN)
+    return max((int(row[idx]) for row in data_rows if len(row) > idx and row[idx].isdigit()), default=0)